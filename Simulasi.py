@@ -1,77 +1,68 @@
 import tkinter as tk
-from tkinter import ttk, Frame, Scale, HORIZONTAL, StringVar, DoubleVar, IntVar
-import pygame
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.animation as animation
-from matplotlib.figure import Figure
+from tkinter import ttk, filedialog, Frame, Scale, HORIZONTAL, StringVar, DoubleVar, IntVar
 import time
 import threading
-import random
+import queue
 import sys
-from PIL import Image, ImageTk, ImageFont
-import colorsys
-import os
-import matplotlib.font_manager as fm
-import platform
+import tempfile
+import shutil
+from engine import SimulationEngine
+from theme import COLORS
+from fonts import find_font
+from ensemble import run_ensemble
+from checkpoint import save_checkpoint, load_checkpoint
+from history_store import HistoryStore
+from profiling import PhaseTimer
+from run_cache import RunCache, run_key
+from surrogate import build_surrogate, load_cached_surrogate
+from telemetry import publisher_from_environment
 
-# Custom color scheme
-COLORS = {
-    "primary": "#006A71",      # Dark teal
-    "secondary": "#48A6A7",    # Medium teal
-    "tertiary": "#9ACBD0",     # Light teal
-    "background": "#F2EFE7",   # Off-white
-    "text": "#333333",         # Dark gray for text
-    "text_light": "#666666",   # Light gray for secondary text
-    "accent": "#E74C3C",       # Red for alerts/highlights
-    "border": "#D0D0D0",       # Light gray for borders
-    "button": "#006A71",       # Button background
-    "button_hover": "#48A6A7", # Button hover
-    "button_text": "#FFFFFF",  # Button text
-}
+# The Tk side polls for simulation snapshots at this rate and redraws charts at most this often
+TARGET_FPS = 30
+CHART_FPS = 10
 
-# Try to load Roboto font for matplotlib
+# Generations the worker may run ahead of the display before it waits
+SNAPSHOT_QUEUE_SIZE = 1024
+
+# Seconds between display refreshes while fast-forwarding (None: refresh only at the end)
+FAST_FORWARD_REFRESH = 0.5
+
+# Chart lines are read from the history store down-sampled to about this many points
+CHART_POINTS = 2000
+
+# Generations between resistance distribution snapshots in the history store
+HISTORY_SNAPSHOT_EVERY = 100
+
+# Timed phases shown in the performance readout, in pipeline order
+PERF_PHASES = ("generation", "selection", "reproduction", "mutation", "fused", "capacity", "history",
+               "sample", "render", "convert", "charts")
+PERF_REFRESH = 0.5  # seconds between readout updates
+
+# Periodic checkpoints are written here (relative to the working directory)
+AUTOSAVE_PATH = "simulation_autosave.npz"
+
+# Try to load Roboto font for matplotlib (called when the charts are first created)
 def setup_roboto_font():
-    # Check system for Roboto font
-    system = platform.system()
-    roboto_paths = []
-    
-    if system == "Windows":
-        font_dirs = [r"C:\Windows\Fonts"]
-        for font_dir in font_dirs:
-            if os.path.exists(os.path.join(font_dir, "Roboto-Regular.ttf")):
-                roboto_paths.append(os.path.join(font_dir, "Roboto-Regular.ttf"))
-    elif system == "Darwin":  # macOS
-        font_dirs = ["/Library/Fonts", "/System/Library/Fonts", os.path.expanduser("~/Library/Fonts")]
-        for font_dir in font_dirs:
-            if os.path.exists(os.path.join(font_dir, "Roboto-Regular.ttf")):
-                roboto_paths.append(os.path.join(font_dir, "Roboto-Regular.ttf"))
-    elif system == "Linux":
-        font_dirs = ["/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts")]
-        for font_dir in font_dirs:
-            if os.path.exists(font_dir):
-                for root, dirs, files in os.walk(font_dir):
-                    if "Roboto-Regular.ttf" in files:
-                        roboto_paths.append(os.path.join(root, "Roboto-Regular.ttf"))
+    import matplotlib
+    import matplotlib.font_manager as fm
+    
+    # Check system for Roboto font (cached between launches)
+    roboto_paths = find_font("Roboto-Regular.ttf")
     
     # If Roboto is found, add it to matplotlib's font manager
     if roboto_paths:
         for path in roboto_paths:
             try:
                 fm.fontManager.addfont(path)
-                plt.rcParams['font.family'] = 'Roboto'
+                matplotlib.rcParams['font.family'] = 'Roboto'
                 return True
             except:
                 continue
     
     # If Roboto isn't found, use a similar sans-serif font
-    plt.rcParams['font.family'] = 'sans-serif'
+    matplotlib.rcParams['font.family'] = 'sans-serif'
     return False
 
-# Set up Roboto font
-has_roboto = setup_roboto_font()
-
 class ModernTooltip:
     """Modern tooltip implementation for Tkinter widgets"""
     def __init__(self, widget, text):
@@ -199,11 +190,13 @@ tk.Canvas.create_rounded_rectangle = ModernButton._create_rounded_rectangle
 
 class ModernSlider(tk.Frame):
     """Custom modern slider with value display"""
-    def __init__(self, master, min_val, max_val, resolution, variable, label_text, width=250, **kwargs):
+    def __init__(self, master, min_val, max_val, resolution, variable, label_text, width=250,
+                 on_change=None, **kwargs):
         bg_color = kwargs.pop('bg', COLORS["background"])
         super().__init__(master, bg=bg_color, **kwargs)
         
         self.variable = variable
+        self.on_change = on_change  # called with the new value while the slider moves
         self.min_val = min_val
         self.max_val = max_val
         
@@ -249,6 +242,8 @@ class ModernSlider(tk.Frame):
     
     def update_value(self, value):
         self.value_var.set(f"{float(value):.3f}")
+        if self.on_change is not None:
+            self.on_change(float(value))
 
 class BacterialResistanceSimulation:
     def __init__(self, master):
@@ -264,23 +259,67 @@ class BacterialResistanceSimulation:
         # Initialize variables
         self.running = False
         self.paused = False
-        self.population_size = 1000
-        self.initial_resistance_range = (0.0, 0.1)
-        self.antibiotic_concentration = 0.3
-        self.mutation_std = 0.01
-        self.reproduction_rate = 1.2
-        self.carrying_capacity = 2000
-        self.max_generations = 100  # Default max generations
-        self.bacteria_population = []
-        self.generation = 0
-        self.avg_resistance_history = []
-        self.population_history = []
         self.visualize_type = "scatter"
         
-        # Setup pygame for visualization
-        pygame.init()
+        # Headless model engine; the GUI only reads its state and feeds it parameters.
+        # History streams to an on-disk store, so memory stays flat on long runs.
+        self.history_dir = tempfile.mkdtemp(prefix="simulasi-history-")
+        self.history = HistoryStore(self.history_dir, snapshot_every=HISTORY_SNAPSHOT_EVERY)
+        self.engine = SimulationEngine(history=self.history)
+        
+        # Per-phase timings for the engine (worker thread) and drawing (Tk thread)
+        self.timer = PhaseTimer()
+        self.engine.timer = self.timer
+        self.last_perf_time = 0.0
+        
+        # Per-generation metrics for external dashboards when SIMULASI_TELEMETRY is set
+        self.engine.telemetry = publisher_from_environment("gui")
+        
+        # Worker -> Tk pipeline. While running, only the worker thread touches the engine;
+        # it publishes per-generation snapshots and the Tk side polls them with after().
+        self.snapshots = queue.Queue(maxsize=SNAPSHOT_QUEUE_SIZE)
+        self.frame_requested = threading.Event()  # ask the worker to attach render data
+        self.live_params = {}  # slider values copied on the Tk thread for the worker
+        self.live_speed = 1.0
+        self.viz_mode = self.visualize_type
+        self.last_chart_time = 0.0
+        self.poll_job = None
+        
+        # Fast-forward requests from the Tk thread: (generations, stop when done)
+        self.fast_forward_requests = queue.SimpleQueue()
+        self.fast_forward_remaining = 0  # worker-side state
+        self.fast_forward_stop = False
+        
+        # Checkpoint paths the worker should write, and the autosave interval it reads
+        self.checkpoint_requests = queue.SimpleQueue()
+        self.live_autosave = 0
+        
+        # Finished runs are cached by parameters and seed. cache_key is set while the
+        # worker computes a run the cache can hold; cache_params are its live parameters.
+        self.run_cache = RunCache()
+        self.cache_key = None
+        self.cache_params = {}
+        self.initialized_with = None  # (population size, resistance range) of the population
+        
+        # Aggregated replicate statistics drawn as bands on the charts
+        self.ensemble_result = None
+        self.ensemble_running = False
+        self.ensemble_token = 0  # bumped to cancel an ensemble in flight
+        
+        # Background task threads never touch Tk: they queue (handler, args) pairs,
+        # and poll_snapshots() runs the handlers on the Tk thread
+        self.task_events = queue.Queue()
+        
+        # Surrogate of the expected trajectories, previewed on the charts as sliders move
+        self.surrogate = None
+        self.surrogate_building = False
+        self.surrogate_token = 0  # bumped to cancel a build in flight
+        self.preview_job = None
+        
+        # Pygame visualization; the renderer is created once the window is up
         self.pygame_surface_size = (600, 400)
-        self.pygame_surface = pygame.Surface(self.pygame_surface_size)
+        self.renderer = None
+        self.tk_img = None
         
         # Create main frames
         self.create_frames()
@@ -295,15 +334,35 @@ class BacterialResistanceSimulation:
         # Create visualization area
         self.create_visualization_area()
         
-        # Create charts
-        self.create_charts()
+        # Status bar, with the rolling performance readout on the right
+        status_frame = Frame(self.master, bg=COLORS["background"], bd=1, relief=tk.SUNKEN)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
         
-        # Status bar
-        self.status_bar = tk.Label(self.master, textvariable=self.status_var, 
-                                 bd=1, relief=tk.SUNKEN, anchor=tk.W, 
+        self.status_bar = tk.Label(status_frame, textvariable=self.status_var, 
+                                 anchor=tk.W, 
                                  bg=COLORS["background"], fg=COLORS["text"],
                                  font=("Roboto", 9), padx=10, pady=5)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        trace_button = ModernButton(status_frame, text="Export Trace", 
+                                  command=self.export_trace,
+                                  width=100, height=24)
+        trace_button.pack(side=tk.RIGHT, padx=5)
+        ModernTooltip(trace_button, "Save recent phase timings as a Chrome trace "
+                                    "(chrome://tracing or ui.perfetto.dev)")
+        
+        self.perf_var = tk.StringVar(value="")
+        perf_label = tk.Label(status_frame, textvariable=self.perf_var, 
+                            anchor=tk.E, 
+                            bg=COLORS["background"], fg=COLORS["text_light"],
+                            font=("Roboto", 9), padx=10)
+        perf_label.pack(side=tk.RIGHT)
+        ModernTooltip(perf_label, "p50/p95 milliseconds per phase over recent calls")
+        
+        # Show the window before loading pygame and matplotlib, which dominate startup
+        self.master.update()
+        self.create_renderer()
+        self.create_charts()
         
         # Initialize population
         self.initialize_population()
@@ -311,6 +370,10 @@ class BacterialResistanceSimulation:
         # Update pygame visualization
         self.update_pygame_visualization()
         
+        # Start polling for snapshots from the simulation thread
+        self.read_live_parameters()
+        self.poll_job = self.master.after(1000 // TARGET_FPS, self.poll_snapshots)
+        
         # Bind window close event
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
         
@@ -428,7 +491,7 @@ class BacterialResistanceSimulation:
                bg=COLORS["background"], fg=COLORS["text"],
                font=("Roboto", 10)).pack(side=tk.LEFT)
         
-        self.population_var = tk.StringVar(value=str(self.population_size))
+        self.population_var = tk.StringVar(value=str(self.engine.population_size))
         population_entry = ttk.Entry(param_frame, textvariable=self.population_var, width=8, 
                                    font=("Roboto", 10))
         population_entry.pack(side=tk.RIGHT)
@@ -445,7 +508,7 @@ class BacterialResistanceSimulation:
         resistance_frame = Frame(param_frame, bg=COLORS["background"])
         resistance_frame.pack(side=tk.RIGHT)
         
-        self.min_resistance_var = tk.StringVar(value=str(self.initial_resistance_range[0]))
+        self.min_resistance_var = tk.StringVar(value=str(self.engine.initial_resistance_range[0]))
         min_entry = ttk.Entry(resistance_frame, textvariable=self.min_resistance_var, width=4,
                             font=("Roboto", 10))
         min_entry.pack(side=tk.LEFT)
@@ -454,7 +517,7 @@ class BacterialResistanceSimulation:
                bg=COLORS["background"], fg=COLORS["text"],
                font=("Roboto", 10)).pack(side=tk.LEFT)
         
-        self.max_resistance_var = tk.StringVar(value=str(self.initial_resistance_range[1]))
+        self.max_resistance_var = tk.StringVar(value=str(self.engine.initial_resistance_range[1]))
         max_entry = ttk.Entry(resistance_frame, textvariable=self.max_resistance_var, width=4,
                             font=("Roboto", 10))
         max_entry.pack(side=tk.LEFT)
@@ -468,7 +531,7 @@ class BacterialResistanceSimulation:
                bg=COLORS["background"], fg=COLORS["text"],
                font=("Roboto", 10)).pack(side=tk.LEFT)
         
-        self.capacity_var = tk.StringVar(value=str(self.carrying_capacity))
+        self.capacity_var = tk.StringVar(value=str(self.engine.carrying_capacity))
         capacity_entry = ttk.Entry(param_frame, textvariable=self.capacity_var, width=8,
                                  font=("Roboto", 10))
         capacity_entry.pack(side=tk.RIGHT)
@@ -482,12 +545,54 @@ class BacterialResistanceSimulation:
                bg=COLORS["background"], fg=COLORS["text"],
                font=("Roboto", 10)).pack(side=tk.LEFT)
         
-        self.max_gen_var = tk.StringVar(value=str(self.max_generations))
+        self.max_gen_var = tk.StringVar(value=str(self.engine.max_generations))
         max_gen_entry = ttk.Entry(param_frame, textvariable=self.max_gen_var, width=8,
                                 font=("Roboto", 10))
         max_gen_entry.pack(side=tk.RIGHT)
         ModernTooltip(max_gen_entry, "Maximum number of generations to simulate (0 = unlimited)")
         
+        # Population Model
+        param_frame = Frame(controls_vars_frame, bg=COLORS["background"])
+        param_frame.pack(fill=tk.X, pady=8)
+        
+        tk.Label(param_frame, text="Population Model:", 
+               bg=COLORS["background"], fg=COLORS["text"],
+               font=("Roboto", 10)).pack(side=tk.LEFT)
+        
+        self.mode_var = tk.StringVar(value=self.engine.population_mode)
+        
+        mode_frame = tk.Frame(param_frame, bg=COLORS["background"])
+        mode_frame.pack(side=tk.RIGHT)
+        
+        agents_radio = tk.Radiobutton(mode_frame, text="Agents", variable=self.mode_var, 
+                                    value="agents", bg=COLORS["background"], 
+                                    fg=COLORS["text"], font=("Roboto", 10),
+                                    activebackground=COLORS["background"])
+        agents_radio.pack(side=tk.LEFT, padx=(0, 10))
+        
+        binned_radio = tk.Radiobutton(mode_frame, text="Binned", variable=self.mode_var, 
+                                    value="binned", bg=COLORS["background"], 
+                                    fg=COLORS["text"], font=("Roboto", 10),
+                                    activebackground=COLORS["background"])
+        binned_radio.pack(side=tk.LEFT)
+        ModernTooltip(mode_frame, "Agents: one value per bacterium. Binned: counts per resistance bin, "
+                                  "for populations of billions (applies on Reset)")
+        
+        # Random seed
+        param_frame = Frame(controls_vars_frame, bg=COLORS["background"])
+        param_frame.pack(fill=tk.X, pady=8)
+        
+        tk.Label(param_frame, text="Seed:", 
+               bg=COLORS["background"], fg=COLORS["text"],
+               font=("Roboto", 10)).pack(side=tk.LEFT)
+        
+        self.seed_var = tk.StringVar(value="")
+        seed_entry = ttk.Entry(param_frame, textvariable=self.seed_var, width=8,
+                             font=("Roboto", 10))
+        seed_entry.pack(side=tk.RIGHT)
+        ModernTooltip(seed_entry, "Integer seed to replay a run exactly (blank = random; "
+                                  "applies on Reset)")
+        
         # Section: Simulation Parameters
         section_frame = Frame(controls_vars_frame, bg=COLORS["background"])
         section_frame.pack(fill=tk.X, pady=(20, 10))
@@ -503,28 +608,31 @@ class BacterialResistanceSimulation:
         section_line.pack(fill=tk.X, pady=(0, 10))
         
         # Antibiotic Concentration Slider
-        self.antibiotic_var = tk.DoubleVar(value=self.antibiotic_concentration)
+        self.antibiotic_var = tk.DoubleVar(value=self.engine.antibiotic_concentration)
         antibiotic_slider = ModernSlider(
             controls_vars_frame, 0.0, 1.0, 0.01, self.antibiotic_var,
-            "Antibiotic Concentration:", bg=COLORS["background"]
+            "Antibiotic Concentration:", bg=COLORS["background"],
+            on_change=self.schedule_preview
         )
         antibiotic_slider.pack(fill=tk.X, pady=8)
         ModernTooltip(antibiotic_slider, "Concentration of antibiotic in the environment (0.0 to 1.0)")
         
         # Mutation Rate Slider
-        self.mutation_var = tk.DoubleVar(value=self.mutation_std)
+        self.mutation_var = tk.DoubleVar(value=self.engine.mutation_std)
         mutation_slider = ModernSlider(
             controls_vars_frame, 0.001, 0.1, 0.001, self.mutation_var,
-            "Mutation Rate:", bg=COLORS["background"]
+            "Mutation Rate:", bg=COLORS["background"],
+            on_change=self.schedule_preview
         )
         mutation_slider.pack(fill=tk.X, pady=8)
         ModernTooltip(mutation_slider, "Standard deviation of mutations in resistance values")
         
         # Reproduction Rate Slider
-        self.reproduction_var = tk.DoubleVar(value=self.reproduction_rate)
+        self.reproduction_var = tk.DoubleVar(value=self.engine.reproduction_rate)
         reproduction_slider = ModernSlider(
             controls_vars_frame, 1.0, 2.0, 0.05, self.reproduction_var,
-            "Reproduction Rate:", bg=COLORS["background"]
+            "Reproduction Rate:", bg=COLORS["background"],
+            on_change=self.schedule_preview
         )
         reproduction_slider.pack(fill=tk.X, pady=8)
         ModernTooltip(reproduction_slider, "Average number of offspring per bacterium")
@@ -561,14 +669,14 @@ class BacterialResistanceSimulation:
         scatter_radio = tk.Radiobutton(viz_frame, text="Scatter", variable=self.viz_var, 
                                      value="scatter", bg=COLORS["background"], 
                                      fg=COLORS["text"], font=("Roboto", 10),
-                                     command=self.update_pygame_visualization,
+                                     command=self.change_visualization,
                                      activebackground=COLORS["background"])
         scatter_radio.pack(side=tk.LEFT, padx=(0, 10))
         
         grid_radio = tk.Radiobutton(viz_frame, text="Grid", variable=self.viz_var, 
                                   value="grid", bg=COLORS["background"], 
                                   fg=COLORS["text"], font=("Roboto", 10),
-                                  command=self.update_pygame_visualization,
+                                  command=self.change_visualization,
                                   activebackground=COLORS["background"])
         grid_radio.pack(side=tk.LEFT)
         
@@ -581,6 +689,22 @@ class BacterialResistanceSimulation:
         speed_slider.pack(fill=tk.X, pady=8)
         ModernTooltip(speed_slider, "Speed of simulation (higher values = faster simulation)")
         
+        # Level of detail
+        param_frame = Frame(controls_vars_frame, bg=COLORS["background"])
+        param_frame.pack(fill=tk.X, pady=8)
+        
+        tk.Label(param_frame, text="Detail Limit:", 
+               bg=COLORS["background"], fg=COLORS["text"],
+               font=("Roboto", 10)).pack(side=tk.LEFT)
+        
+        self.lod_var = tk.StringVar(value="")  # filled in by create_renderer()
+        self.lod_var.trace_add("write", self.update_lod_threshold)
+        lod_entry = ttk.Entry(param_frame, textvariable=self.lod_var, width=8,
+                            font=("Roboto", 10))
+        lod_entry.pack(side=tk.RIGHT)
+        ModernTooltip(lod_entry, "Most bacteria drawn individually; larger populations are "
+                                 "shown as a stratified sample")
+        
         # Button frame for controls
         button_frame = Frame(self.control_frame, bg=COLORS["background"])
         button_frame.pack(fill=tk.X, pady=(25, 0))
@@ -605,6 +729,97 @@ class BacterialResistanceSimulation:
                                        button_hover="#ff6b5e",
                                        width=90, height=36)
         self.reset_button.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        
+        # Fast-forward: run many generations without per-generation display work
+        fast_forward_frame = Frame(self.control_frame, bg=COLORS["background"])
+        fast_forward_frame.pack(fill=tk.X, pady=(15, 0))
+        
+        tk.Label(fast_forward_frame, text="Generations:", 
+               bg=COLORS["background"], fg=COLORS["text"],
+               font=("Roboto", 10)).pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.fast_forward_var = tk.StringVar(value="1000")
+        fast_forward_entry = ttk.Entry(fast_forward_frame, textvariable=self.fast_forward_var, width=6,
+                                     font=("Roboto", 10))
+        fast_forward_entry.pack(side=tk.LEFT, padx=5)
+        ModernTooltip(fast_forward_entry, "Number of generations to skip ahead")
+        
+        self.fast_forward_button = ModernButton(fast_forward_frame, text="Fast Forward", 
+                                              command=self.start_fast_forward,
+                                              width=120, height=36)
+        self.fast_forward_button.pack(side=tk.RIGHT, padx=5)
+        ModernTooltip(self.fast_forward_button, 
+                      "Run the model flat out, refreshing the display at most twice a second")
+        
+        # Checkpoints: periodic autosave plus save/load on demand
+        checkpoint_frame = Frame(self.control_frame, bg=COLORS["background"])
+        checkpoint_frame.pack(fill=tk.X, pady=(15, 0))
+        
+        tk.Label(checkpoint_frame, text="Autosave every:", 
+               bg=COLORS["background"], fg=COLORS["text"],
+               font=("Roboto", 10)).pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.autosave_var = tk.StringVar(value="0")
+        autosave_entry = ttk.Entry(checkpoint_frame, textvariable=self.autosave_var, width=6,
+                                 font=("Roboto", 10))
+        autosave_entry.pack(side=tk.LEFT, padx=5)
+        ModernTooltip(autosave_entry, f"Write {AUTOSAVE_PATH} every this many generations "
+                                      "and on exit (0 = off)")
+        
+        self.load_button = ModernButton(checkpoint_frame, text="Load", 
+                                      command=self.load_checkpoint_file,
+                                      width=56, height=36)
+        self.load_button.pack(side=tk.RIGHT, padx=5)
+        ModernTooltip(self.load_button, "Restore a saved checkpoint and resume from it")
+        
+        self.save_button = ModernButton(checkpoint_frame, text="Save", 
+                                      command=self.save_checkpoint_file,
+                                      width=56, height=36)
+        self.save_button.pack(side=tk.RIGHT)
+        ModernTooltip(self.save_button, "Save the full simulation state to a checkpoint file")
+        
+        # Ensemble controls: many replicates of the current parameters
+        ensemble_frame = Frame(self.control_frame, bg=COLORS["background"])
+        ensemble_frame.pack(fill=tk.X, pady=(15, 0))
+        
+        tk.Label(ensemble_frame, text="Replicates:", 
+               bg=COLORS["background"], fg=COLORS["text"],
+               font=("Roboto", 10)).pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.replicates_var = tk.StringVar(value="200")
+        replicates_entry = ttk.Entry(ensemble_frame, textvariable=self.replicates_var, width=6,
+                                   font=("Roboto", 10))
+        replicates_entry.pack(side=tk.LEFT, padx=5)
+        ModernTooltip(replicates_entry, "Number of independent runs in the ensemble")
+        
+        self.ensemble_button = ModernButton(ensemble_frame, text="Run Ensemble", 
+                                          command=self.start_ensemble,
+                                          width=120, height=36)
+        self.ensemble_button.pack(side=tk.RIGHT, padx=5)
+        ModernTooltip(self.ensemble_button, 
+                      "Run many replicates of the current parameters and plot 5-95% bands")
+        
+        # Slider preview: a surrogate built from short ensembles over the slider ranges
+        preview_frame = Frame(self.control_frame, bg=COLORS["background"])
+        preview_frame.pack(fill=tk.X, pady=(15, 0))
+        
+        self.preview_var = tk.BooleanVar(value=True)
+        preview_check = tk.Checkbutton(preview_frame, text="Preview sliders", 
+                                     variable=self.preview_var, command=self.schedule_preview,
+                                     bg=COLORS["background"], fg=COLORS["text"],
+                                     font=("Roboto", 10),
+                                     activebackground=COLORS["background"])
+        preview_check.pack(side=tk.LEFT, padx=(5, 0))
+        ModernTooltip(preview_check, "Draw the expected population and resistance (dotted) "
+                                     "for the slider values while they move")
+        
+        self.surrogate_button = ModernButton(preview_frame, text="Build Preview", 
+                                           command=self.start_surrogate_build,
+                                           width=120, height=36)
+        self.surrogate_button.pack(side=tk.RIGHT, padx=5)
+        ModernTooltip(self.surrogate_button, 
+                      "Run short ensembles over the slider ranges for the other parameters. "
+                      "Rebuild after changing the model")
     
     def create_visualization_area(self):
         # Pygame visualization
@@ -615,6 +830,9 @@ class BacterialResistanceSimulation:
                                      highlightthickness=0)
         self.pygame_canvas.pack(expand=True)
         
+        # Single image item, updated in place every frame
+        self.canvas_image = self.pygame_canvas.create_image(0, 0, anchor=tk.NW)
+        
         # Info labels for the current state
         info_frame = Frame(self.pygame_frame, bg=COLORS["background"])
         info_frame.pack(fill=tk.X, pady=(15, 0))
@@ -647,7 +865,7 @@ class BacterialResistanceSimulation:
         create_stat_card(info_grid, "Generation:", self.generation_var, 0)
         
         # Population counter
-        self.pop_count_var = tk.StringVar(value=f"{self.population_size}")
+        self.pop_count_var = tk.StringVar(value=f"{self.engine.population_size}")
         create_stat_card(info_grid, "Population Size:", self.pop_count_var, 1)
         
         # Average resistance
@@ -655,443 +873,649 @@ class BacterialResistanceSimulation:
         create_stat_card(info_grid, "Average Resistance:", self.avg_res_var, 2)
         
         # Current antibiotic concentration
-        self.conc_var = tk.StringVar(value=f"{self.antibiotic_concentration:.2f}")
+        self.conc_var = tk.StringVar(value=f"{self.engine.antibiotic_concentration:.2f}")
         create_stat_card(info_grid, "Antibiotic Concentration:", self.conc_var, 3)
         
         # Make columns expand equally
         for i in range(4):
             info_grid.columnconfigure(i, weight=1)
     
+    def create_renderer(self):
+        import pygame
+        from renderer import PopulationRenderer
+        
+        pygame.init()
+        self.renderer = PopulationRenderer(self.pygame_surface_size)
+        self.lod_var.set(str(self.renderer.lod_threshold))
+    
     def create_charts(self):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from charts import ResistanceCharts
+        
+        setup_roboto_font()
+        
         # Create matplotlib figure with custom style
-        plt.style.use('ggplot')
         self.fig = Figure(figsize=(12, 6), dpi=100, facecolor=COLORS["background"])  # Increased height
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.chart_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
-        # Create subplots with more space
-        self.fig.subplots_adjust(bottom=0.15, top=0.9, wspace=0.3)
-        
-        self.ax1 = self.fig.add_subplot(131)  # Population size
-        self.ax2 = self.fig.add_subplot(132)  # Average resistance
-        self.ax3 = self.fig.add_subplot(133)  # Resistance distribution
-        
-        # Configure plots with improved styling
-        for ax in [self.ax1, self.ax2, self.ax3]:
-            ax.set_facecolor('#f8f9fa')
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['bottom'].set_color('#cccccc')
-            ax.spines['left'].set_color('#cccccc')
-            ax.tick_params(colors='#666666', labelsize=9)
-            ax.xaxis.label.set_color('#333333')
-            ax.yaxis.label.set_color('#333333')
-            ax.title.set_color('#333333')
-            # Increase font sizes
-            ax.xaxis.label.set_fontsize(11)
-            ax.yaxis.label.set_fontsize(11)
-            ax.title.set_fontsize(13)
-            ax.title.set_fontweight('bold')
-        
-        self.ax1.set_title("Population Size Over Time")
-        self.ax1.set_xlabel("Generation")
-        self.ax1.set_ylabel("Population Size")
-        self.ax1.grid(True, linestyle='--', alpha=0.7, color='#dddddd')
-        
-        self.ax2.set_title("Average Resistance Over Time")
-        self.ax2.set_xlabel("Generation")
-        self.ax2.set_ylabel("Resistance Value")
-        self.ax2.grid(True, linestyle='--', alpha=0.7, color='#dddddd')
-        self.ax2.set_ylim(0, 1)
-        
-        self.ax3.set_title("Resistance Distribution")
-        self.ax3.set_xlabel("Resistance Value")
-        self.ax3.set_ylabel("Number of Bacteria")
-        self.ax3.grid(True, linestyle='--', alpha=0.7, color='#dddddd')
-        self.ax3.set_xlim(0, 1)
-        
-        # Update the canvas
-        self.fig.tight_layout()
-        self.canvas.draw()
+        # Charts keep persistent artists and blit incremental updates
+        self.charts = ResistanceCharts(self.fig)
+        self.charts.draw(self.canvas)
+        self.resize_job = None
+    
+    def read_parameters(self):
+        """Parse all parameter inputs into engine keyword arguments"""
+        return {
+            "population_size": int(self.population_var.get()),
+            "initial_resistance_range": (float(self.min_resistance_var.get()),
+                                         float(self.max_resistance_var.get())),
+            "antibiotic_concentration": self.antibiotic_var.get(),
+            "mutation_std": self.mutation_var.get(),
+            "reproduction_rate": self.reproduction_var.get(),
+            "carrying_capacity": int(self.capacity_var.get()),
+            "max_generations": int(self.max_gen_var.get()),
+        }
+    
+    def read_seed(self):
+        """Seed from the entry, or None for a fresh random stream"""
+        text = self.seed_var.get().strip()
+        if not text:
+            return None
+        try:
+            return int(text)
+        except ValueError:
+            raise ValueError("Seed must be a whole number")
     
     def initialize_population(self):
         try:
             # Parse parameter inputs
-            self.population_size = int(self.population_var.get())
-            min_res = float(self.min_resistance_var.get())
-            max_res = float(self.max_resistance_var.get())
-            self.initial_resistance_range = (min_res, max_res)
-            self.max_generations = int(self.max_gen_var.get())
-            
-            # Create initial bacteria with resistance values
-            self.bacteria_population = []
-            for _ in range(self.population_size):
-                resistance = random.uniform(self.initial_resistance_range[0], self.initial_resistance_range[1])
-                self.bacteria_population.append(resistance)
+            self.engine.set_parameters(**self.read_parameters())
+            self.engine.set_population_mode(self.mode_var.get())
+            self.engine.reseed(self.read_seed())
             
-            # Reset history
-            self.avg_resistance_history = [np.mean(self.bacteria_population)]
-            self.population_history = [len(self.bacteria_population)]
-            self.generation = 0
+            # Create initial bacteria and reset history
+            self.engine.initialize_population()
+            self.initialized_with = (self.engine.population_size, self.engine.initial_resistance_range)
             
             # Update GUI
             self.update_info_labels()
             self.update_charts()
             self.update_pygame_visualization()
-            self.status_var.set("Population initialized. Ready to start simulation.")
+            self.status_var.set(f"Population initialized with seed {self.engine.seed_sequence.entropy}. "
+                                "Ready to start simulation.")
             
         except ValueError as e:
             self.status_var.set(f"Error initializing population: {str(e)}")
     
+    def read_live_parameters(self):
+        """Copy the live-adjustable controls into plain values for the worker thread"""
+        params = {
+            "antibiotic_concentration": self.antibiotic_var.get(),
+            "mutation_std": self.mutation_var.get(),
+            "reproduction_rate": self.reproduction_var.get(),
+        }
+        try:
+            params["carrying_capacity"] = int(self.capacity_var.get())
+        except ValueError:
+            pass  # Keep the previous capacity while the entry is being edited
+        self.live_params = dict(self.live_params, **params)
+        self.live_speed = self.speed_var.get()
+        try:
+            self.live_autosave = max(0, int(self.autosave_var.get()))
+        except ValueError:
+            pass
+    
+    def make_frame(self):
+        """Render data for the current view: sampled resistance values and histogram"""
+        with self.timer.phase("sample"):
+            return self._make_frame()
+    
+    def _make_frame(self):
+        mode = self.viz_mode
+        population_count = self.engine.population_count()
+        if mode == "scatter":
+            # Above the level-of-detail threshold draw a stratified sample that keeps
+            # the resistance distribution, so cost is bounded by the view size
+            if population_count > self.renderer.lod_threshold:
+                values = self.engine.stratified_values(self.renderer.lod_threshold)
+            else:
+                values = self.engine.resistance_values(population_count)
+        else:  # grid
+            values = self.engine.resistance_values(self.renderer.grid_cells(population_count))
+        counts, _ = self.engine.histogram(bins=self.charts.histogram_bins)
+        return {
+            "generation": self.engine.generation,
+            "mode": mode,
+            "values": values,
+            "population_count": population_count,
+            "histogram": counts,
+            "concentration": self.engine.antibiotic_concentration,
+        }
+    
+    def show_engine_parameters(self):
+        """Set the parameter controls from the engine (after a restore)"""
+        params = self.engine.get_parameters()
+        self.population_var.set(str(params["population_size"]))
+        self.min_resistance_var.set(str(params["initial_resistance_range"][0]))
+        self.max_resistance_var.set(str(params["initial_resistance_range"][1]))
+        self.capacity_var.set(str(params["carrying_capacity"]))
+        self.max_gen_var.set(str(params["max_generations"]))
+        self.antibiotic_var.set(params["antibiotic_concentration"])
+        self.mutation_var.set(params["mutation_std"])
+        self.reproduction_var.set(params["reproduction_rate"])
+        self.mode_var.set(self.engine.population_mode)
+        self.seed_var.set(str(self.engine.seed_sequence.entropy))
+    
+    def make_snapshot(self, with_frame=False, event=None):
+        """Compact copy of the engine state, safe to hand to the Tk thread"""
+        return {
+            "generation": self.engine.generation,
+            "population": self.engine.population_count(),
+            "mean_resistance": self.engine.average_resistance(),
+            "concentration": self.engine.antibiotic_concentration,
+            "frame": self.make_frame() if with_frame else None,
+            "event": event,  # None, "extinct", "finished" or "fast_forward_done"
+            "fast_forward": None,  # (generations, generations per second) after a fast-forward
+            "notice": None,  # status message from the worker
+        }
+    
+    def advance(self):
+        """Step the engine once on the worker thread; returns the run-ending event, if any"""
+        # Parameters come from the copy made on the Tk thread, never from Tk variables
+        if self.cache_key is not None and self.live_params != self.cache_params:
+            self.cache_key = None  # steered mid-run, so no longer the run the key describes
+        self.engine.set_parameters(**self.live_params)
+        
+        # Advance the model by one generation
+        self.engine.step()
+        every = self.live_autosave
+        if every > 0 and self.engine.generation % every == 0:
+            self.write_checkpoint(AUTOSAVE_PATH)
+        
+        # Check if we've reached the maximum generation limit or died out
+        event = None
+        if self.engine.max_generations > 0 and self.engine.generation >= self.engine.max_generations:
+            event = "finished"
+        elif self.engine.is_extinct():
+            event = "extinct"
+        if event is not None and self.cache_key is not None:
+            self.run_cache.store(self.cache_key, self.engine)
+            self.cache_key = None
+        return event
+    
     def simulation_step(self):
-        # Update parameters from GUI
-        self.antibiotic_concentration = self.antibiotic_var.get()
-        self.mutation_std = self.mutation_var.get()
-        self.reproduction_rate = self.reproduction_var.get()
-        self.carrying_capacity = int(self.capacity_var.get())
-        
-        # Apply selection (bacteria survival based on resistance)
-        survived = []
-        for resistance in self.bacteria_population:
-            # Calculate survival probability
-            # Higher resistance means higher survival probability under antibiotic pressure
-            survival_prob = max(0, 1 - (self.antibiotic_concentration - resistance))
-            if random.random() < survival_prob:
-                survived.append(resistance)
-        
-        # Reproduction with mutation
-        next_gen = []
-        # Limit reproduction based on carrying capacity
-        for resistance in survived:
-            # Reproduction rate determines average number of offspring
-            num_offspring = 0
-            # Using Poisson-like process for number of offspring
-            remaining_prob = self.reproduction_rate
-            while remaining_prob > 0:
-                if random.random() < remaining_prob:
-                    num_offspring += 1
-                remaining_prob -= 1
-            
-            # Create offspring with mutations
-            for _ in range(num_offspring):
-                # Apply mutation
-                new_resistance = resistance + random.gauss(0, self.mutation_std)
-                # Ensure resistance stays within [0, 1]
-                new_resistance = max(0, min(1, new_resistance))
-                next_gen.append(new_resistance)
-        
-        # Apply carrying capacity limit
-        if len(next_gen) > self.carrying_capacity:
-            next_gen = random.sample(next_gen, self.carrying_capacity)
-        
-        # Update the population
-        self.bacteria_population = next_gen
-        
-        # Update history
-        if len(self.bacteria_population) > 0:
-            self.avg_resistance_history.append(np.mean(self.bacteria_population))
-        else:
-            self.avg_resistance_history.append(0)  # Extinction
-        self.population_history.append(len(self.bacteria_population))
-        
-        # Increment generation
-        self.generation += 1
-        
-        # Update GUI
-        self.update_info_labels()
-        if self.generation % 5 == 0:  # Update charts every 5 generations for efficiency
-            self.update_charts()
-        self.update_pygame_visualization()
-        
-        # Check if we've reached the maximum generation limit
-        if self.max_generations > 0 and self.generation >= self.max_generations:
-            self.running = False
-            self.status_var.set(f"Simulation completed: reached maximum generation limit ({self.max_generations}).")
-            # Update buttons on main thread
-            self.master.after(0, lambda: self.start_button.config(state=tk.NORMAL))
-            self.master.after(0, lambda: self.pause_button.config(state=tk.DISABLED))
-            return True
-        
-        return False  # Continue simulation
-    
-    def update_info_labels(self):
-        # Update info labels
-        self.generation_var.set(f"{self.generation}")
-        self.pop_count_var.set(f"{len(self.bacteria_population)}")
-        if len(self.bacteria_population) > 0:
-            avg_resistance = np.mean(self.bacteria_population)
-            self.avg_res_var.set(f"{avg_resistance:.4f}")
+        """Advance one generation on the worker thread and return its snapshot"""
+        event = self.advance()
+        
+        # Attach render data only when the display asked for it, or on the last generation
+        with_frame = event is not None or self.frame_requested.is_set()
+        if with_frame:
+            self.frame_requested.clear()
+        return self.make_snapshot(with_frame, event)
+    
+    def write_checkpoint(self, path):
+        """Save a checkpoint from the worker thread and report it to the display"""
+        try:
+            save_checkpoint(self.engine, path)
+            notice = f"Checkpoint saved at generation {self.engine.generation}: {path}"
+        except OSError as e:
+            notice = f"Error saving checkpoint: {str(e)}"
+        snapshot = self.make_snapshot()
+        snapshot["notice"] = notice
+        self.publish_snapshot(snapshot)
+    
+    def write_requested_checkpoints(self):
+        while True:
+            try:
+                path = self.checkpoint_requests.get_nowait()
+            except queue.Empty:
+                return
+            self.write_checkpoint(path)
+    
+    def take_fast_forward_requests(self):
+        while True:
+            try:
+                generations, stop = self.fast_forward_requests.get_nowait()
+            except queue.Empty:
+                return
+            self.fast_forward_remaining += generations
+            self.fast_forward_stop = stop
+    
+    def fast_forward(self):
+        """Run pending fast-forward generations with no per-generation display work
+        
+        The display gets a snapshot at most every FAST_FORWARD_REFRESH seconds and
+        once at the end, with the achieved rate. Returns True when the run is over.
+        """
+        start = last_refresh = time.perf_counter()
+        done = 0
+        event = None
+        while self.running and not self.paused and self.fast_forward_remaining > 0:
+            event = self.advance()
+            done += 1
+            self.fast_forward_remaining -= 1
+            if event is not None:
+                break
+            now = time.perf_counter()
+            if FAST_FORWARD_REFRESH is not None and now - last_refresh >= FAST_FORWARD_REFRESH:
+                self.publish_snapshot(self.make_snapshot(with_frame=True))
+                self.take_fast_forward_requests()
+                self.write_requested_checkpoints()
+                last_refresh = now
+        rate = done / max(time.perf_counter() - start, 1e-9)
+        
+        if event is not None:
+            self.fast_forward_remaining = 0
+        elif self.fast_forward_remaining == 0 and self.fast_forward_stop:
+            event = "fast_forward_done"
+        snapshot = self.make_snapshot(with_frame=True, event=event)
+        snapshot["fast_forward"] = (done, rate)
+        self.publish_snapshot(snapshot)
+        return event is not None
+    
+    def publish_snapshot(self, snapshot):
+        # Wait while the display is a full queue behind, but give up once stopped
+        while self.running:
+            try:
+                self.snapshots.put(snapshot, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def poll_snapshots(self):
+        """Drain pending snapshots on the Tk thread and show the latest state"""
+        self.read_live_parameters()
+        self.drain_task_events()
+        latest = None
+        frame = None
+        fast_forward = None
+        notice = None
+        while True:
+            try:
+                snapshot = self.snapshots.get_nowait()
+            except queue.Empty:
+                break
+            # Intermediate generations are coalesced; the charts read them from the store
+            latest = snapshot
+            if snapshot["frame"] is not None:
+                frame = snapshot["frame"]
+            if snapshot["fast_forward"] is not None:
+                fast_forward = snapshot["fast_forward"]
+            if snapshot["notice"] is not None:
+                notice = snapshot["notice"]
+        
+        if latest is not None:
+            self.update_info_labels(latest)
+            if frame is not None:
+                self.update_pygame_visualization(frame)
+                now = time.perf_counter()
+                if latest["event"] is not None or now - self.last_chart_time >= 1.0 / CHART_FPS:
+                    self.update_charts(frame)
+                    self.last_chart_time = now
+            message = notice
+            if latest["event"] is not None:
+                message = self.finish_simulation(latest)
+            if fast_forward is not None:
+                generations, rate = fast_forward
+                report = f"Fast-forwarded {generations:,} generations at {rate:,.0f} generations/s."
+                message = f"{message} {report}" if message else report
+            if message:
+                self.status_var.set(message)
+        
+        if self.running and not self.paused:
+            self.frame_requested.set()
+        now = time.perf_counter()
+        if now - self.last_perf_time >= PERF_REFRESH:
+            self.update_perf_readout()
+            self.last_perf_time = now
+        self.poll_job = self.master.after(1000 // TARGET_FPS, self.poll_snapshots)
+    
+    def drain_task_events(self):
+        """Run the handlers background task threads queued for the Tk thread"""
+        while True:
+            try:
+                handler, args = self.task_events.get_nowait()
+            except queue.Empty:
+                return
+            handler(*args)
+    
+    def update_perf_readout(self):
+        parts = []
+        if self.running and not self.paused:
+            generation = self.timer.stats("generation")
+            if generation is not None:
+                parts.append(f"{generation['rate']:,.0f} gen/s")
+        for name, stats in self.timer.summary(PERF_PHASES).items():
+            parts.append(f"{name} {stats['p50_ms']:.2f}/{stats['p95_ms']:.2f}")
+        self.perf_var.set("  ".join(parts))
+    
+    def export_trace(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("Chrome trace", "*.json")])
+        if not path:
+            return
+        try:
+            events = self.timer.export_chrome_trace(path)
+            self.status_var.set(f"Exported {events:,} timed events to {path}")
+        except OSError as e:
+            self.status_var.set(f"Error exporting trace: {str(e)}")
+    
+    def finish_simulation(self, snapshot):
+        """Restore the buttons after the worker stopped and describe why"""
+        self.start_button.config(state=tk.NORMAL)
+        self.pause_button.config(state=tk.DISABLED)
+        if snapshot["event"] == "finished":
+            return (f"Simulation completed: reached maximum generation limit "
+                    f"({snapshot['generation']}).")
+        if snapshot["event"] == "fast_forward_done":
+            return f"Fast-forward finished at generation {snapshot['generation']}."
+        return "Population extinct! Reset to start a new simulation."
+    
+    def update_info_labels(self, snapshot=None):
+        # Update info labels from a worker snapshot, or from the idle engine
+        if snapshot is None:
+            snapshot = self.make_snapshot()
+        self.generation_var.set(f"{snapshot['generation']}")
+        self.pop_count_var.set(f"{snapshot['population']}")
+        if snapshot["population"] > 0:
+            self.avg_res_var.set(f"{snapshot['mean_resistance']:.4f}")
         else:
             self.avg_res_var.set("N/A (Extinct)")
-        self.conc_var.set(f"{self.antibiotic_concentration:.2f}")
-    
-    def update_charts(self):
-        # Clear previous plots
-        self.ax1.clear()
-        self.ax2.clear()
-        self.ax3.clear()
-        
-        # Configure common style elements
-        for ax in [self.ax1, self.ax2, self.ax3]:
-            ax.set_facecolor('#f8f9fa')
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['bottom'].set_color('#cccccc')
-            ax.spines['left'].set_color('#cccccc')
-            ax.tick_params(colors='#666666', labelsize=9)
-            ax.xaxis.label.set_color('#333333')
-            ax.yaxis.label.set_color('#333333')
-            ax.title.set_color('#333333')
-            # Increase font sizes
-            ax.xaxis.label.set_fontsize(11)
-            ax.yaxis.label.set_fontsize(11)
-            ax.title.set_fontsize(13)
-            ax.title.set_fontweight('bold')
-        
-        # Population size over time
-        self.ax1.plot(self.population_history, color=COLORS["primary"], linewidth=2)
-        self.ax1.set_title("Population Size Over Time")
-        self.ax1.set_xlabel("Generation")
-        self.ax1.set_ylabel("Population Size")
-        self.ax1.grid(True, linestyle='--', alpha=0.7, color='#dddddd')
-        
-        # Add shaded area under the curve
-        self.ax1.fill_between(range(len(self.population_history)), 
-                            self.population_history, 
-                            color=COLORS["primary"], alpha=0.2)
-        
-        # Average resistance over time
-        self.ax2.plot(self.avg_resistance_history, color=COLORS["secondary"], linewidth=2)
-        self.ax2.set_title("Average Resistance Over Time")
-        self.ax2.set_xlabel("Generation")
-        self.ax2.set_ylabel("Resistance Value")
-        self.ax2.grid(True, linestyle='--', alpha=0.7, color='#dddddd')
-        self.ax2.set_ylim(0, 1)
-        
-        # Add horizontal line for current antibiotic concentration
-        self.ax2.axhline(y=self.antibiotic_concentration, color=COLORS["accent"], 
-                       linestyle='--', alpha=0.8, linewidth=1.5)
-        self.ax2.text(0, self.antibiotic_concentration + 0.02, 
-                    f"Antibiotic Concentration: {self.antibiotic_concentration:.2f}", 
-                    color=COLORS["accent"], fontsize=10)
-        
-        # Add shaded area under the curve
-        self.ax2.fill_between(range(len(self.avg_resistance_history)), 
-                            self.avg_resistance_history, 
-                            color=COLORS["secondary"], alpha=0.2)
-        
-        # Resistance distribution histogram
-        if len(self.bacteria_population) > 0:
-            n, bins, patches = self.ax3.hist(self.bacteria_population, bins=30, range=(0, 1), 
-                                          color=COLORS["tertiary"], alpha=0.7)
-            
-            # Color the bins based on their relationship to antibiotic concentration
-            bin_centers = 0.5 * (bins[:-1] + bins[1:])
-            for i, center in enumerate(bin_centers):
-                if center < self.antibiotic_concentration:
-                    # Bacteria with resistance below antibiotic concentration
-                    patches[i].set_facecolor(COLORS["accent"])
-                else:
-                    # Bacteria with resistance above antibiotic concentration
-                    patches[i].set_facecolor(COLORS["secondary"])
-            
-            self.ax3.set_title("Resistance Distribution")
-            self.ax3.set_xlabel("Resistance Value")
-            self.ax3.set_ylabel("Number of Bacteria")
-            self.ax3.grid(True, linestyle='--', alpha=0.7, color='#dddddd')
-            self.ax3.set_xlim(0, 1)
-            
-            # Add vertical line for antibiotic concentration
-            self.ax3.axvline(x=self.antibiotic_concentration, color='black', 
-                           linestyle='--', alpha=0.8, linewidth=1.5)
-            self.ax3.text(self.antibiotic_concentration + 0.02, max(n) * 0.9, 
-                        f"Antibiotic\nConcentration", 
-                        color='black', fontsize=10)
-        
-        # Update the canvas
-        self.fig.tight_layout()
-        self.canvas.draw()
+        self.conc_var.set(f"{snapshot['concentration']:.2f}")
     
-    def update_pygame_visualization(self):
-        # Clear the surface
-        self.pygame_surface.fill((255, 255, 255))
-        
+    def update_charts(self, frame=None):
+        if frame is None:
+            if self.running:
+                # The engine belongs to the worker; redraw from its next frame
+                self.last_chart_time = 0.0
+                self.frame_requested.set()
+                return
+            frame = self.make_frame()
+        with self.timer.phase("charts"):
+            # Every generation up to the frame's is already in the store
+            stop = frame["generation"] + 1
+            generations, population = self.history.downsample("population", CHART_POINTS, stop)
+            _, resistance = self.history.downsample("avg_resistance", CHART_POINTS, stop)
+            self.charts.update(population, resistance, 
+                               frame["histogram"], frame["concentration"], generations)
+            self.charts.draw(self.canvas)
+    
+    def update_pygame_visualization(self, frame=None):
+        import pygame
+        from PIL import Image, ImageTk
+        
+        if frame is None:
+            if self.running:
+                self.frame_requested.set()
+                return
+            frame = self.make_frame()
         # Draw bacteria based on visualization type
-        if self.viz_var.get() == "scatter":
-            self._draw_scatter_visualization()
-        else:  # grid
-            self._draw_grid_visualization()
-        
-        # Convert pygame surface to tkinter PhotoImage
-        pygame_img = pygame.image.tostring(self.pygame_surface, 'RGB')
-        img = Image.frombytes('RGB', self.pygame_surface_size, pygame_img)
-        self.tk_img = ImageTk.PhotoImage(image=img)
-        
-        # Update canvas
-        self.pygame_canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_img)
-    
-    def _draw_scatter_visualization(self):
-        width, height = self.pygame_surface_size
-        
-        # Draw a subtle grid background
-        grid_spacing = 50
-        for x in range(0, width, grid_spacing):
-            pygame.draw.line(self.pygame_surface, (240, 240, 240), (x, 0), (x, height))
-        for y in range(0, height, grid_spacing):
-            pygame.draw.line(self.pygame_surface, (240, 240, 240), (0, y), (width, y))
-        
-        # Draw antibiotic concentration indicator
-        indicator_height = 10
-        pygame.draw.rect(self.pygame_surface, (240, 240, 240), 
-                       (0, height - indicator_height, width, indicator_height))
-        
-        conc_x = int(width * self.antibiotic_concentration)
-        pygame.draw.rect(self.pygame_surface, self.hex_to_rgb(COLORS["accent"]), 
-                       (0, height - indicator_height, conc_x, indicator_height))
-        
-        # Draw legend
-        legend_y = 20
-        legend_x = width - 150
-        
-        # Susceptible bacteria legend
-        pygame.draw.circle(self.pygame_surface, self.hex_to_rgb(COLORS["accent"]), (legend_x, legend_y), 6)
-        font = pygame.font.SysFont('Arial', 12)
-        text = font.render('Susceptible', True, (50, 50, 50))
-        self.pygame_surface.blit(text, (legend_x + 15, legend_y - 6))
-        
-        # Resistant bacteria legend
-        pygame.draw.circle(self.pygame_surface, self.hex_to_rgb(COLORS["secondary"]), (legend_x, legend_y + 25), 6)
-        text = font.render('Resistant', True, (50, 50, 50))
-        self.pygame_surface.blit(text, (legend_x + 15, legend_y + 19))
-        
-        # Calculate color and size for each bacterium
-        for resistance in self.bacteria_population:
-            # Position based on random placement
-            x = random.randint(10, width - 10)
-            y = random.randint(10, height - 20)  # Leave space for indicator
-            
-            # Use HSV color space for smoother color transitions
-            # Map resistance from 0-1 to 0-120 (red to green in HSV)
-            if resistance < self.antibiotic_concentration:
-                color = self.hex_to_rgb(COLORS["accent"])
+        with self.timer.phase("render"):
+            surface = self.renderer.render(frame["values"], frame["concentration"], 
+                                           frame["mode"], frame["population_count"])
+        
+        # Convert pygame surface to tkinter PhotoImage, reusing the same image
+        with self.timer.phase("convert"):
+            pygame_img = pygame.image.tostring(surface, 'RGB')
+            img = Image.frombytes('RGB', self.pygame_surface_size, pygame_img)
+            if self.tk_img is None:
+                self.tk_img = ImageTk.PhotoImage(image=img)
+                self.pygame_canvas.itemconfig(self.canvas_image, image=self.tk_img)
             else:
-                color = self.hex_to_rgb(COLORS["secondary"])
-            
-            # Size based on how close the resistance is to antibiotic concentration
-            resistance_diff = abs(resistance - self.antibiotic_concentration)
-            size = max(3, 8 - int(resistance_diff * 10))
-            
-            # Add glow effect for bacteria near the antibiotic concentration
-            if resistance_diff < 0.05:
-                glow_size = size + 4
-                glow_alpha = 100  # Semi-transparent
-                glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
-                pygame.draw.circle(glow_surface, (*color, glow_alpha), (glow_size, glow_size), glow_size)
-                self.pygame_surface.blit(glow_surface, (x-glow_size, y-glow_size))
-            
-            # Draw the bacterium
-            pygame.draw.circle(self.pygame_surface, color, (x, y), size)
+                self.tk_img.paste(img)
     
-    def _draw_grid_visualization(self):
-        width, height = self.pygame_surface_size
-        
-        # Create a grid representation of bacteria
-        grid_size = min(30, int(np.sqrt(len(self.bacteria_population))))
-        if grid_size < 2:
-            return  # Not enough bacteria for grid
-            
-        cell_width = width // grid_size
-        cell_height = height // grid_size
-        
-        # Draw grid background
-        for i in range(grid_size + 1):
-            pygame.draw.line(self.pygame_surface, (230, 230, 230), 
-                           (0, i * cell_height), (width, i * cell_height), 1)
-            pygame.draw.line(self.pygame_surface, (230, 230, 230), 
-                           (i * cell_width, 0), (i * cell_width, height), 1)
-        
-        # Draw antibiotic concentration indicator at the bottom
-        indicator_height = 10
-        pygame.draw.rect(self.pygame_surface, (240, 240, 240), 
-                       (0, height - indicator_height, width, indicator_height))
-        
-        conc_x = int(width * self.antibiotic_concentration)
-        pygame.draw.rect(self.pygame_surface, self.hex_to_rgb(COLORS["accent"]), 
-                       (0, height - indicator_height, conc_x, indicator_height))
-        
-        # Draw bacteria in grid cells
-        for i, resistance in enumerate(self.bacteria_population[:grid_size * grid_size]):
-            row = i // grid_size
-            col = i % grid_size
-            
-            # Calculate position
-            x = col * cell_width + cell_width // 2
-            y = row * cell_height + cell_height // 2
-            
-            # Determine color based on resistance vs antibiotic concentration
-            if resistance < self.antibiotic_concentration:
-                color = self.hex_to_rgb(COLORS["accent"])
-                cell_color = (255, 240, 240)  # Light red background
+    def change_visualization(self):
+        self.viz_mode = self.viz_var.get()
+        self.update_pygame_visualization()
+    
+    def update_lod_threshold(self, *args):
+        try:
+            threshold = int(self.lod_var.get())
+        except ValueError:
+            return  # Keep the previous threshold while the entry is being edited
+        if threshold > 0:
+            self.renderer.lod_threshold = threshold
+    
+    def start_ensemble(self):
+        if self.ensemble_running:
+            return
+        try:
+            replicates = int(self.replicates_var.get())
+            if replicates < 2:
+                raise ValueError("an ensemble needs at least 2 replicates")
+            params = self.read_parameters()
+            if params["max_generations"] <= 0:
+                raise ValueError("set Max Generations above 0 for an ensemble")
+            seed = self.read_seed()
+        except ValueError as e:
+            self.status_var.set(f"Error starting ensemble: {str(e)}")
+            return
+        
+        population_mode = self.mode_var.get()
+        self.ensemble_token += 1
+        token = self.ensemble_token
+        self.ensemble_running = True
+        self.ensemble_button.config(state=tk.DISABLED)
+        self.status_var.set(f"Running ensemble of {replicates} replicates...")
+        
+        def report_progress(done, total):
+            # Throttle status updates to roughly one per percent
+            if done % max(1, total // 100) == 0 or done == total:
+                self.task_events.put((self.show_ensemble_progress, (token, done, total)))
+        
+        def worker():
+            try:
+                stats = run_ensemble(params, replicates, population_mode=population_mode,
+                                     on_progress=report_progress,
+                                     should_stop=lambda: self.ensemble_token != token,
+                                     seed=seed)
+                if self.ensemble_token == token:
+                    self.task_events.put((self.finish_ensemble, (token, stats.result())))
+            except Exception as e:
+                self.task_events.put((self.finish_ensemble, (token, None, str(e))))
+        
+        self.ensemble_thread = threading.Thread(target=worker)
+        self.ensemble_thread.daemon = True
+        self.ensemble_thread.start()
+    
+    def show_ensemble_progress(self, token, done, total):
+        if token == self.ensemble_token:
+            self.status_var.set(f"Ensemble: {done}/{total} replicates finished")
+    
+    def finish_ensemble(self, token, result, error=None):
+        if token != self.ensemble_token:
+            return  # cancelled by a reset or superseded
+        self.ensemble_running = False
+        self.ensemble_button.config(state=tk.NORMAL)
+        if error is not None:
+            self.status_var.set(f"Ensemble failed: {error}")
+            return
+        
+        self.ensemble_result = result
+        self.charts.set_ensemble(result)
+        self.update_charts()
+        extinction = result["extinction_probability"][-1]
+        self.status_var.set(f"Ensemble of {result['replicates']} replicates (seed {result['seed']}) finished. "
+                            f"Extinction probability by the last generation: {extinction:.1%}")
+    
+    def current_surrogate(self):
+        """Surrogate for the current fixed parameters, loading a saved one when needed"""
+        try:
+            params = self.read_parameters()
+        except ValueError:
+            return None
+        population_mode = self.mode_var.get()
+        if self.surrogate is None or not self.surrogate.matches(params, population_mode):
+            self.surrogate = load_cached_surrogate(params, population_mode)
+        return self.surrogate
+    
+    def schedule_preview(self, value=None):
+        # Slider drags fire many events; predict once they are drained
+        if self.preview_job is None:
+            self.preview_job = self.master.after_idle(self.show_preview)
+    
+    def show_preview(self):
+        self.preview_job = None
+        if not self.preview_var.get():
+            self.charts.set_preview(None)
+            self.charts.draw(self.canvas)
+            return
+        surrogate = self.current_surrogate()
+        if surrogate is None:
+            self.charts.set_preview(None)
+            self.charts.draw(self.canvas)
+            if not self.surrogate_building:
+                self.status_var.set("No slider preview for these parameters yet; press Build Preview.")
+            return
+        
+        prediction = surrogate.predict(antibiotic_concentration=self.antibiotic_var.get(),
+                                       mutation_std=self.mutation_var.get(),
+                                       reproduction_rate=self.reproduction_var.get())
+        self.charts.set_preview(prediction)
+        self.charts.draw(self.canvas)
+        if not self.running:
+            extinction = prediction["extinction_probability"][-1]
+            if extinction < 1:
+                outcome = (f"~{prediction['population'][-1]:.0f} bacteria, "
+                           f"mean resistance {prediction['resistance'][-1]:.3f}")
             else:
-                color = self.hex_to_rgb(COLORS["secondary"])
-                cell_color = (240, 255, 240)  # Light green background
-            
-            # Size based on resistance vs antibiotic 
-            resistance_diff = abs(resistance - self.antibiotic_concentration)
-            size = max(3, min(cell_width // 2 - 2, 10 - int(resistance_diff * 15)))
-            
-            # Draw cell background
-            pygame.draw.rect(self.pygame_surface, cell_color, 
-                           (col * cell_width, row * cell_height, cell_width, cell_height))
-            
-            # Draw bacterium
-            pygame.draw.circle(self.pygame_surface, color, (x, y), size)
-            
-            # Add a small indicator of resistance value
-            font = pygame.font.SysFont('Arial', 8)
-            text = font.render(f'{resistance:.2f}', True, (100, 100, 100))
-            text_rect = text.get_rect(center=(x, y + cell_height//2 - 8))
-            self.pygame_surface.blit(text, text_rect)
-    
-    def hex_to_rgb(self, hex_color):
-        """Convert hex color to RGB tuple"""
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-    
-    def start_simulation(self):
+                outcome = "extinct"
+            self.status_var.set(f"Preview after {surrogate.generations} generations: {outcome} "
+                                f"({extinction:.0%} chance of extinction)")
+    
+    def start_surrogate_build(self):
+        if self.surrogate_building:
+            return
+        try:
+            params = self.read_parameters()
+        except ValueError as e:
+            self.status_var.set(f"Error building preview: {str(e)}")
+            return
+        
+        population_mode = self.mode_var.get()
+        self.surrogate_token += 1
+        token = self.surrogate_token
+        self.surrogate_building = True
+        self.surrogate_button.config(state=tk.DISABLED)
+        self.status_var.set("Building slider preview...")
+        
+        def report_progress(done, total):
+            if done % max(1, total // 100) == 0 or done == total:
+                self.task_events.put((self.show_surrogate_progress, (token, done, total)))
+        
+        def worker():
+            try:
+                surrogate = build_surrogate(params, population_mode, on_progress=report_progress,
+                                            should_stop=lambda: self.surrogate_token != token)
+                if self.surrogate_token == token:
+                    self.task_events.put((self.finish_surrogate_build, (token, surrogate)))
+            except Exception as e:
+                self.task_events.put((self.finish_surrogate_build, (token, None, str(e))))
+        
+        self.surrogate_thread = threading.Thread(target=worker)
+        self.surrogate_thread.daemon = True
+        self.surrogate_thread.start()
+    
+    def show_surrogate_progress(self, token, done, total):
+        if token == self.surrogate_token:
+            self.status_var.set(f"Slider preview: {done}/{total} grid points finished")
+    
+    def finish_surrogate_build(self, token, surrogate, error=None):
+        if token != self.surrogate_token:
+            return  # cancelled
+        self.surrogate_building = False
+        self.surrogate_button.config(state=tk.NORMAL)
+        if error is not None:
+            self.status_var.set(f"Building the slider preview failed: {error}")
+            return
+        
+        self.surrogate = surrogate
+        self.status_var.set("Slider preview ready.")
+        self.schedule_preview()
+    
+    def start_simulation(self, fast_forward=0):
+        if self.running:
+            return
+        self.stop_worker()  # the previous worker may still be exiting
+        
         # Update parameters
         try:
-            self.population_size = int(self.population_var.get())
-            self.carrying_capacity = int(self.capacity_var.get())
-            self.max_generations = int(self.max_gen_var.get())
-            min_res = float(self.min_resistance_var.get())
-            max_res = float(self.max_resistance_var.get())
-            self.initial_resistance_range = (min_res, max_res)
+            self.engine.set_parameters(**self.read_parameters())
             
-            # Handle initialization if needed
-            if not self.bacteria_population:
-                self.initialize_population()
-                
-            # If population is extinct, initialize again
-            if len(self.bacteria_population) == 0:
+            # Handle initialization if needed, or re-initialize after extinction
+            if self.engine.is_extinct():
                 self.initialize_population()
             
-            # Start the simulation thread if not already running
-            if not self.running:
-                self.running = True
-                self.paused = False
-                self.simulation_thread = threading.Thread(target=self.run_simulation)
-                self.simulation_thread.daemon = True
-                self.simulation_thread.start()
-                
-                # Update button states
-                self.start_button.config(state=tk.DISABLED)
-                self.pause_button.config(state=tk.NORMAL, text="Pause")
-                
+            # A fresh run with fixed parameters may already be in the run cache
+            self.read_live_parameters()
+            self.cache_key = self.cached_run_key(fast_forward)
+            if self.cache_key is not None and self.load_cached_run(self.cache_key):
+                return
+            self.cache_params = dict(self.live_params)
+            
+            # Start the simulation thread
+            if fast_forward > 0:
+                self.fast_forward_requests.put((fast_forward, True))
+            self.running = True
+            self.paused = False
+            self.frame_requested.set()
+            self.simulation_thread = threading.Thread(target=self.run_simulation)
+            self.simulation_thread.daemon = True
+            self.simulation_thread.start()
+            
+            # Update button states
+            self.start_button.config(state=tk.DISABLED)
+            self.pause_button.config(state=tk.NORMAL, text="Pause")
+            
+            if fast_forward > 0:
+                self.status_var.set(f"Fast-forwarding {fast_forward:,} generations...")
+            else:
                 self.status_var.set("Simulation running...")
         except ValueError as e:
             self.status_var.set(f"Error starting simulation: {str(e)}")
     
+    def cached_run_key(self, fast_forward=0):
+        """Run cache key of the run about to start, or None if it cannot be cached"""
+        engine = self.engine
+        if engine.generation != 0 or engine.max_generations <= 0:
+            return None
+        if 0 < fast_forward < engine.max_generations:
+            return None  # stops short of the end of the run
+        if self.initialized_with != (engine.population_size, engine.initial_resistance_range):
+            return None  # the setup was edited after the population was drawn
+        return run_key(engine)
+    
+    def load_cached_run(self, key):
+        """Show the finished run cached under key; returns False on a miss"""
+        if not self.run_cache.load(key, self.engine):
+            return False
+        self.cache_key = None
+        self.update_info_labels()
+        self.update_charts()
+        self.update_pygame_visualization()
+        self.status_var.set(f"Loaded finished run from cache: generation {self.engine.generation}, "
+                            f"seed {self.engine.seed_sequence.entropy}.")
+        return True
+    
+    def start_fast_forward(self):
+        try:
+            generations = int(self.fast_forward_var.get())
+            if generations <= 0:
+                raise ValueError("enter a positive number of generations")
+        except ValueError as e:
+            self.status_var.set(f"Error starting fast-forward: {str(e)}")
+            return
+        
+        if self.running:
+            # Jump ahead, then carry on at the normal pace
+            self.fast_forward_requests.put((generations, False))
+            self.status_var.set(f"Fast-forwarding {generations:,} generations...")
+        else:
+            # Jump ahead from a stopped simulation and stop again when done
+            self.start_simulation(fast_forward=generations)
+    
     def pause_simulation(self):
         if self.running:
             self.paused = not self.paused
@@ -1102,22 +1526,94 @@ class BacterialResistanceSimulation:
                 self.pause_button.config(text="Pause")
                 self.status_var.set("Simulation resumed.")
     
-    def reset_simulation(self):
-        # Stop any running simulation
+    def stop_worker(self):
+        """Stop the simulation thread and discard snapshots it left behind"""
         self.running = False
-        self.paused = False
         
-        # Wait for thread to finish
+        # Wait for the thread to finish its generation; the caller may touch the engine
+        # next. No timeout: the loop and publish_snapshot() check self.running, so the
+        # wait is at most one (possibly long) generation.
         if hasattr(self, 'simulation_thread') and self.simulation_thread.is_alive():
-            self.simulation_thread.join(timeout=1.0)
+            self.simulation_thread.join()
         
-        # Reset variables
-        self.bacteria_population = []
-        self.generation = 0
-        self.avg_resistance_history = []
-        self.population_history = []
+        # Drop undelivered snapshots and fast-forward requests
+        while True:
+            try:
+                self.snapshots.get_nowait()
+            except queue.Empty:
+                break
+        while True:
+            try:
+                self.fast_forward_requests.get_nowait()
+            except queue.Empty:
+                break
+        self.fast_forward_remaining = 0
+        self.frame_requested.clear()
+        
+        # Saves requested after the worker's last check are written here
+        while True:
+            try:
+                path = self.checkpoint_requests.get_nowait()
+            except queue.Empty:
+                break
+            self.save_checkpoint_to(path)
+    
+    def save_checkpoint_to(self, path):
+        try:
+            save_checkpoint(self.engine, path)
+            self.status_var.set(f"Checkpoint saved at generation {self.engine.generation}: {path}")
+        except OSError as e:
+            self.status_var.set(f"Error saving checkpoint: {str(e)}")
+    
+    def save_checkpoint_file(self):
+        path = filedialog.asksaveasfilename(defaultextension=".npz",
+                                            filetypes=[("Simulation checkpoint", "*.npz")])
+        if not path:
+            return
+        if self.running:
+            # The worker owns the engine while running; it saves between generations
+            self.checkpoint_requests.put(path)
+            self.status_var.set("Saving checkpoint...")
+        else:
+            self.save_checkpoint_to(path)
+    
+    def load_checkpoint_file(self):
+        path = filedialog.askopenfilename(filetypes=[("Simulation checkpoint", "*.npz")])
+        if not path:
+            return
+        self.stop_worker()
+        self.paused = False
+        try:
+            load_checkpoint(path, self.engine)
+        except (OSError, KeyError, ValueError) as e:
+            self.status_var.set(f"Error loading checkpoint: {str(e)}")
+            return
+        self.initialized_with = None
+        
+        # Show the restored parameters and state
+        self.show_engine_parameters()
+        self.update_info_labels()
+        self.update_charts()
+        self.update_pygame_visualization()
+        
+        self.start_button.config(state=tk.NORMAL)
+        self.pause_button.config(state=tk.DISABLED, text="Pause")
+        self.status_var.set(f"Restored generation {self.engine.generation} from {path}. "
+                            "Press Start to resume.")
+    
+    def reset_simulation(self):
+        # Stop any running simulation
+        self.stop_worker()
+        self.paused = False
+        
+        # Cancel any ensemble in progress and drop its bands
+        self.ensemble_token += 1
+        self.ensemble_running = False
+        self.ensemble_result = None
+        self.charts.set_ensemble(None)
+        self.ensemble_button.config(state=tk.NORMAL)
         
-        # Initialize new population
+        # Initialize new population (also resets generation and history)
         self.initialize_population()
         
         # Reset buttons
@@ -1127,45 +1623,75 @@ class BacterialResistanceSimulation:
         self.status_var.set("Simulation reset.")
     
     def run_simulation(self):
+        # Worker thread: no Tk calls here, only the engine and the snapshot queue
         while self.running:
             if not self.paused:
-                # Check if extinction occurred
-                if len(self.bacteria_population) == 0:
-                    self.status_var.set("Population extinct! Reset to start a new simulation.")
+                # Jump ahead when a fast-forward was requested
+                self.take_fast_forward_requests()
+                if self.fast_forward_remaining > 0:
+                    if self.fast_forward():
+                        self.running = False
+                        break
+                    continue
+                
+                # Perform simulation step and hand its snapshot to the Tk thread
+                self.write_requested_checkpoints()
+                snapshot = self.simulation_step()
+                self.publish_snapshot(snapshot)
+                if snapshot["event"] is not None:
                     self.running = False
-                    # Update buttons on main thread
-                    self.master.after(0, lambda: self.start_button.config(state=tk.NORMAL))
-                    self.master.after(0, lambda: self.pause_button.config(state=tk.DISABLED))
                     break
                 
-                # Perform simulation step
-                if self.simulation_step():
-                    break  # Simulation completed due to max generations
-                
                 # Sleep based on simulation speed
-                time.sleep(0.5 / self.speed_var.get())
+                time.sleep(0.5 / self.live_speed)
             else:
-                # When paused, just wait a bit
+                # When paused, still answer explicit redraw and save requests
+                self.write_requested_checkpoints()
+                if self.frame_requested.is_set():
+                    self.frame_requested.clear()
+                    self.publish_snapshot(self.make_snapshot(with_frame=True))
                 time.sleep(0.1)
     
     def on_resize(self, event):
         # Only handle resize events from the main window
         if event.widget == self.master:
-            # Redraw charts on window resize
-            self.fig.tight_layout()
-            self.canvas.draw()
+            # Recompute the chart layout once the window stops changing size
+            if self.resize_job is not None:
+                self.master.after_cancel(self.resize_job)
+            self.resize_job = self.master.after(150, self.relayout_charts)
+    
+    def relayout_charts(self):
+        self.resize_job = None
+        self.charts.mark_layout_dirty()
+        self.charts.draw(self.canvas)
     
     def on_closing(self):
-        # Stop simulation thread
-        self.running = False
-        self.paused = True
+        # Stop polling and the simulation thread
+        if self.poll_job is not None:
+            self.master.after_cancel(self.poll_job)
+        self.stop_worker()
         
-        # Wait for thread to finish
-        if hasattr(self, 'simulation_thread') and self.simulation_thread.is_alive():
-            self.simulation_thread.join(timeout=1.0)
+        # Keep the final state when autosave is on
+        if self.live_autosave > 0:
+            try:
+                save_checkpoint(self.engine, AUTOSAVE_PATH)
+            except OSError:
+                pass
+        
+        if self.engine.telemetry is not None:
+            self.engine.telemetry.close()
+        
+        # Stop a slider preview build (its pool is terminated at the next grid point)
+        self.surrogate_token += 1
+        
+        # Remove the session's history store
+        self.history.close()
+        shutil.rmtree(self.history_dir, ignore_errors=True)
         
         # Close the window
-        pygame.quit()
+        if self.renderer is not None:
+            import pygame
+            pygame.quit()
         self.master.destroy()
         sys.exit()
 
@@ -0,0 +1,263 @@
+"""Headless batch runs of scenario files
+
+Runs one or more scenarios described in a JSON or TOML file to completion
+and writes their results to a JSON file. Only the engine is imported, so
+batch runs need no display and do not load tkinter, pygame, PIL or
+matplotlib.
+
+A scenario file holds the model parameters (population_size,
+initial_resistance_range, antibiotic_concentration, mutation_std,
+reproduction_rate, carrying_capacity, max_generations) plus optional
+population_mode, num_bins, seed and kernel backend (numpy unless set; the
+backend used is recorded with each result). Either the file is a single
+scenario, or its top-level values are shared defaults and a "scenario"
+list holds the individual runs, each with an optional name:
+
+    max_generations = 500
+    seed = 12345
+
+    [[scenario]]
+    name = "low dose"
+    antibiotic_concentration = 0.1
+
+    [[scenario]]
+    name = "high dose"
+    antibiotic_concentration = 0.5
+    population_mode = "binned"
+
+Scenarios without their own seed get a stream spawned from the file's seed
+by position, so a batch replays exactly when run again. Finished runs are
+kept in the run cache (see run_cache.py), so scenarios already run with the
+same parameters and seed are loaded instead of recomputed.
+
+Example:
+    python batch.py scenarios.toml results.json --history
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from engine import DEFAULT_PARAMETERS, POPULATION_MODES, SimulationEngine, seed_sequence
+from run_cache import CACHE_DIR, RunCache, run_key
+from telemetry import TelemetryPublisher
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+# Scenario keys besides the model parameters
+SCENARIO_OPTIONS = ("name", "population_mode", "num_bins", "seed", "backend")
+
+
+def read_scenario_file(path):
+    """Parsed contents of a JSON or TOML scenario file"""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("TOML scenario files need Python 3.11 or later (tomllib)")
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_scenarios(path):
+    """Read a JSON or TOML scenario file into (scenarios, root seed)
+
+    Each scenario is a dict of engine parameters with its name,
+    population_mode, num_bins and seed filled in.
+    """
+    return parse_scenarios(read_scenario_file(path), path)
+
+
+def parse_scenarios(document, source="scenarios"):
+    """(scenarios, root seed) of a scenario document already parsed from JSON or TOML
+
+    source names the document in error messages.
+    """
+    if not isinstance(document, dict):
+        raise ValueError(f"{source}: expected a table of parameters at the top level")
+
+    defaults = dict(document)
+    entries = defaults.pop("scenario", None)
+    if entries is None:
+        entries = defaults.pop("scenarios", None)
+    if entries is None:
+        entries = [{}]
+    root = seed_sequence(defaults.pop("seed", None))
+
+    scenarios = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"{source}: scenario {index} is not a table of parameters")
+        scenario = dict(defaults, **entry)
+        for key in scenario:
+            if key not in DEFAULT_PARAMETERS and key not in SCENARIO_OPTIONS:
+                raise ValueError(f"{source}: unknown scenario key: {key}")
+        scenario.setdefault("name", f"scenario_{index}")
+        scenario.setdefault("population_mode", "agents")
+        if scenario["population_mode"] not in POPULATION_MODES:
+            raise ValueError(f"{source}: unknown population mode: {scenario['population_mode']}")
+        if "seed" in scenario:
+            scenario["seed"] = seed_sequence(scenario["seed"])
+        else:
+            scenario["seed"] = np.random.SeedSequence(root.entropy,
+                                                      spawn_key=root.spawn_key + (index,))
+        scenarios.append(scenario)
+    return scenarios, root
+
+
+def build_engine(scenario):
+    """Fresh engine set up for a scenario from load_scenarios()"""
+    params = {name: value for name, value in scenario.items() if name in DEFAULT_PARAMETERS}
+    for option in ("num_bins", "backend"):
+        if option in scenario:
+            params[option] = scenario[option]
+    engine = SimulationEngine(seed=scenario["seed"], population_mode=scenario["population_mode"],
+                              **params)
+    if engine.max_generations <= 0:
+        raise ValueError(f"{scenario['name']}: max_generations must be positive for a batch run")
+    return engine
+
+
+def run_scenario(scenario, history=False, cache=None, on_generation=None, telemetry=None):
+    """Run one scenario to max_generations and return its results entry
+
+    With a RunCache, a run cached under the same key is loaded instead, and
+    a computed run is added to the cache. on_generation(generation) is
+    called after every computed generation; an exception it raises ends
+    the run. telemetry is a HOST:PORT the computed generations are
+    published to (see telemetry.py).
+    """
+    seed = scenario["seed"]
+    engine = build_engine(scenario)
+
+    start = time.perf_counter()
+    key = run_key(engine) if cache is not None else None
+    cached = key is not None and cache.load(key, engine)
+    if not cached:
+        if telemetry is not None:
+            engine.telemetry = TelemetryPublisher(telemetry, scenario["name"])
+        try:
+            if on_generation is None:
+                engine.run()
+            else:
+                while not engine.is_finished():
+                    engine.step()
+                    on_generation(engine.generation)
+        finally:
+            if engine.telemetry is not None:
+                engine.telemetry.close()
+        if key is not None:
+            cache.store(key, engine)
+    result = {
+        "name": scenario["name"],
+        "population_mode": engine.population.mode,
+        "backend": engine.backend,
+        "parameters": engine.get_parameters(),
+        "seed": {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key)},
+        "summary": engine.summary(),
+        "elapsed_seconds": time.perf_counter() - start,
+        "cached": cached,
+    }
+    if history:
+        result["history"] = {name: values.tolist()
+                             for name, values in engine.get_history().items()}
+    return result
+
+
+def _run_task(task):
+    return run_scenario(*task)
+
+
+def run_batch(scenarios, history=False, processes=1, on_result=None, cache=None, telemetry=None):
+    """Run scenarios, in parallel when processes > 1; results keep scenario order
+
+    on_result(result, done, total) is called as each scenario finishes.
+    cache is an optional RunCache shared by all workers, and telemetry an
+    optional HOST:PORT every run publishes its metrics to.
+    """
+    tasks = [(scenario, history, cache, None, telemetry) for scenario in scenarios]
+    results = []
+    if processes == 1:
+        outcomes = map(_run_task, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        outcomes = pool.imap(_run_task, tasks)
+    try:
+        for result in outcomes:
+            results.append(result)
+            if on_result is not None:
+                on_result(result, len(results), len(tasks))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return results
+
+
+def json_default(value):
+    """json.dump default= hook for NumPy scalars"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_results(path, document):
+    """Write the results document atomically"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(document, f, indent=2, default=json_default)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run resistance model scenarios headlessly")
+    parser.add_argument("scenarios", help="scenario file (.json or .toml)")
+    parser.add_argument("output", help="JSON results file")
+    parser.add_argument("--history", action="store_true",
+                        help="include every generation's population and mean resistance")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes (default 1; 0 = all cores)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="run cache directory")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always recompute and leave the run cache untouched")
+    parser.add_argument("--telemetry", metavar="HOST:PORT",
+                        help="publish per-generation metrics to a telemetry collector")
+    args = parser.parse_args(argv)
+
+    try:
+        scenarios, root = load_scenarios(args.scenarios)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    print(f"Batch seed: {root.entropy}", flush=True)
+
+    def report(result, done, total):
+        summary = result["summary"]
+        print(f"[{done}/{total}] {result['name']}: {summary['generations']} generations, "
+              f"mean resistance {summary['final_mean_resistance']:.4f}, "
+              f"final population {summary['final_population']} "
+              f"({result['elapsed_seconds']:.2f} s{', cached' if result['cached'] else ''})", flush=True)
+
+    cache = None if args.no_cache else RunCache(args.cache_dir)
+    try:
+        results = run_batch(scenarios, args.history, args.processes or None, on_result=report,
+                            cache=cache, telemetry=args.telemetry)
+    except ValueError as e:
+        parser.error(str(e))
+    write_results(args.output, {
+        "source": os.path.abspath(args.scenarios),
+        "seed": root.entropy,
+        "results": results,
+    })
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""Many independent agent-mode replicates stepped together
+
+Running small replicates one after another pays NumPy's per-call overhead,
+and the Python around it, once per replicate and generation. For
+populations of a few thousand cells that overhead is most of the cost.
+BatchedEngine keeps R replicates in one ragged array instead: every
+replicate's resistance values back to back, with sizes[r] cells in
+replicate r. Selection, reproduction and mutation are then one vectorized
+pass over all of them. The carrying capacity is applied per replicate:
+each crowded replicate keeps the cells with its capacity smallest random
+keys, and only keys close to the cut-off are ever sorted.
+
+The replicates share one random stream, so they are independent samples
+of the model, but replicate r does not reproduce the run of a
+SimulationEngine seeded with the r-th child seed. Only the agent model is
+batched.
+
+Example:
+    python batched.py --replicates 1000 --generations 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from engine import (DEFAULT_PARAMETERS, NULL_TIMER, RandomBlocks, SimulationEngine,
+                    normalize_parameters, seed_sequence)
+
+# Half-width of the sorted key window around each replicate's expected cut-off
+WINDOW_SIGMAS = 6
+
+
+def group_sums(x, sizes, dtype=None):
+    """Sums of consecutive groups of x with the given sizes (0 for empty groups)"""
+    totals = np.zeros(sizes.size, dtype=dtype or x.dtype)
+    nonempty = sizes > 0
+    if x.size:
+        # Each segment runs to the next nonempty group's start, the end of its own group
+        starts = (np.cumsum(sizes) - sizes)[nonempty]
+        totals[nonempty] = np.add.reduceat(x, starts, dtype=totals.dtype)
+    return totals
+
+
+def batched_generation_kernel(values, sizes, concentration, mutation_std, reproduction_rate,
+                              capacity, rng, timer=NULL_TIMER):
+    """generation_kernel applied to every replicate of a ragged batch
+
+    values holds the replicates back to back with sizes[r] cells in
+    replicate r. Returns the next generation's (values, sizes) in the same
+    layout. Replicates stay contiguous through every step (boolean
+    indexing and np.repeat keep the order), so per-replicate counts are
+    group sums and no per-cell replicate index is ever built.
+    """
+    with timer.phase("selection"):
+        survived = rng.random(values.size) < 1 - (concentration - values)
+        parents = values[survived]
+        parent_sizes = group_sums(survived, sizes, np.int64)
+
+    with timer.phase("reproduction"):
+        base_offspring = int(np.floor(reproduction_rate))
+        extra_prob = reproduction_rate - base_offspring
+        num_offspring = base_offspring + (rng.random(parents.size) < extra_prob)
+        next_gen = np.repeat(parents, num_offspring)
+        next_sizes = group_sums(num_offspring, parent_sizes, np.int64)
+
+    with timer.phase("mutation"):
+        next_gen += rng.normal(0, mutation_std, next_gen.size)
+        np.clip(next_gen, 0, 1, out=next_gen)
+
+    with timer.phase("capacity"):
+        if next_sizes.max(initial=0) > capacity:
+            next_gen = next_gen[_capacity_mask(next_sizes, capacity, rng)]
+            next_sizes = np.minimum(next_sizes, capacity)
+
+    return next_gen, next_sizes
+
+
+def _capacity_mask(sizes, capacity, rng):
+    """Mask keeping a uniform sample of capacity cells of every crowded replicate
+
+    Every cell gets a uniform key and each crowded replicate keeps its
+    capacity smallest keys, which is a uniform sample without replacement.
+    Sorting all keys would cost O(n log n), so only keys in a window around
+    the expected cut-off capacity / size are sorted: keys below the window
+    are kept and keys above it dropped. A replicate whose cut-off lands
+    outside its window (rare at WINDOW_SIGMAS standard deviations) has all
+    its keys sorted instead.
+    """
+    keys = rng.random(int(sizes.sum()))
+    over = sizes > capacity
+
+    # The capacity-th smallest of n uniform keys lies near p = capacity / n with
+    # standard deviation about sqrt(p (1 - p) / n); uncrowded replicates keep everything
+    n = np.maximum(sizes, 1).astype(np.float64)
+    p = np.minimum(capacity / n, 1.0)
+    spread = WINDOW_SIGMAS * np.sqrt(p * (1 - p) / n) + 1 / n
+    low = np.where(over, p - spread, 2.0)
+    high = np.where(over, p + spread, 2.0)
+    missed = np.zeros(sizes.size, dtype=bool)
+    while True:
+        low[missed] = -1.0  # sort the whole replicate
+        high[missed] = 2.0
+        keep = keys < np.repeat(low, sizes)
+        window = ~keep & (keys < np.repeat(high, sizes))
+        kept_counts = group_sums(keep, sizes, np.int64)
+        window_counts = group_sums(window, sizes, np.int64)
+        newly_missed = over & ~missed & ((kept_counts > capacity) |
+                                         (kept_counts + window_counts < capacity))
+        if not newly_missed.any():
+            break
+        missed |= newly_missed
+
+    # Add the (capacity - kept) smallest window keys of each crowded replicate
+    candidates = np.flatnonzero(window)
+    group = np.repeat(np.arange(sizes.size), window_counts)
+    order = candidates[np.lexsort((keys[candidates], group))]
+    starts = np.cumsum(window_counts) - window_counts
+    rank = np.arange(order.size) - np.repeat(starts, window_counts)
+    keep[order[rank < (capacity - kept_counts)[group]]] = True
+    return keep
+
+
+class BatchedEngine:
+    """R independent agent-mode replicates of one parameter set in a ragged array"""
+    def __init__(self, replicates, seed=None, **params):
+        if int(replicates) < 1:
+            raise ValueError("BatchedEngine needs at least one replicate")
+        self.replicates = int(replicates)
+        self.seed_sequence = seed_sequence(seed)
+        self.rng = np.random.Generator(np.random.PCG64(self.seed_sequence))
+        self.draws = RandomBlocks(self.rng)
+        self.timer = NULL_TIMER
+
+        for name, value in DEFAULT_PARAMETERS.items():
+            setattr(self, name, value)
+        self.set_parameters(**params)
+        self.initialize_population()
+
+    def set_parameters(self, **params):
+        """Update model parameters; changes apply from the next step"""
+        for name, value in normalize_parameters(params).items():
+            setattr(self, name, value)
+
+    def get_parameters(self):
+        return {name: getattr(self, name) for name in DEFAULT_PARAMETERS}
+
+    def initialize_population(self):
+        """Draw fresh populations for every replicate and reset the history"""
+        min_res, max_res = self.initial_resistance_range
+        self.values = self.rng.uniform(min_res, max_res, self.replicates * self.population_size)
+        self.sizes = np.full(self.replicates, self.population_size, dtype=np.int64)
+        self.generation = 0
+        self.population_history = []
+        self.resistance_history = []
+        self.peak_population = np.zeros(self.replicates, dtype=np.int64)
+        self.extinction_generation = np.full(self.replicates, -1, dtype=np.int64)
+        self.record_generation()
+
+    def step(self):
+        """Advance every replicate by one generation"""
+        with self.timer.phase("generation"):
+            self.values, self.sizes = batched_generation_kernel(
+                self.values, self.sizes, self.antibiotic_concentration, self.mutation_std,
+                self.reproduction_rate, self.carrying_capacity, self.draws, self.timer)
+            self.generation += 1
+            with self.timer.phase("history"):
+                self.record_generation()
+
+    def record_generation(self):
+        self.population_history.append(self.sizes.copy())
+        self.resistance_history.append(self.mean_resistance())
+        np.maximum(self.peak_population, self.sizes, out=self.peak_population)
+        self.extinction_generation[(self.sizes == 0) & (self.extinction_generation < 0)] = self.generation
+
+    def run(self, n=None):
+        """Step n generations, or until max_generations when n is None
+
+        Stops early once every replicate is extinct. Returns the number of
+        generations actually simulated.
+        """
+        if n is None:
+            if self.max_generations <= 0:
+                raise ValueError("run() needs n when max_generations is unlimited")
+            n = max(0, self.max_generations - self.generation)
+
+        steps = 0
+        while steps < n and not self.all_extinct():
+            self.step()
+            steps += 1
+        return steps
+
+    def all_extinct(self):
+        return not self.sizes.any()
+
+    def is_finished(self):
+        if self.all_extinct():
+            return True
+        return self.max_generations > 0 and self.generation >= self.max_generations
+
+    def offsets(self):
+        """Start of each replicate in values, plus the total size"""
+        return np.concatenate([[0], np.cumsum(self.sizes)])
+
+    def mean_resistance(self):
+        """Mean resistance per replicate (0 for extinct replicates)"""
+        totals = group_sums(self.values, self.sizes)
+        return np.divide(totals, self.sizes, out=np.zeros(self.replicates), where=self.sizes > 0)
+
+    def replicate_values(self, replicate):
+        """Copy of one replicate's resistance values"""
+        offsets = self.offsets()
+        return self.values[offsets[replicate]:offsets[replicate + 1]].copy()
+
+    def get_history(self):
+        """Per-generation history as (generations + 1, replicates) arrays"""
+        return {
+            "population": np.array(self.population_history),
+            "avg_resistance": np.array(self.resistance_history),
+        }
+
+    def summaries(self):
+        """SimulationEngine.summary() of every replicate"""
+        # A replicate that died out stopped there; the batch carried it along empty
+        generations = np.where(self.extinction_generation >= 0, self.extinction_generation,
+                               self.generation)
+        means = self.mean_resistance()
+        return [{
+            "generations": int(generations[r]),
+            "final_population": int(self.sizes[r]),
+            "final_mean_resistance": float(means[r]),
+            "extinction_generation": (int(self.extinction_generation[r])
+                                      if self.extinction_generation[r] >= 0 else None),
+            "peak_population": int(self.peak_population[r]),
+        } for r in range(self.replicates)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time R replicates batched in one process against running them one by one")
+    parser.add_argument("--replicates", type=int, default=200)
+    parser.add_argument("--population-size", type=int, default=DEFAULT_PARAMETERS["population_size"])
+    parser.add_argument("--carrying-capacity", type=int, default=DEFAULT_PARAMETERS["carrying_capacity"])
+    parser.add_argument("--concentration", type=float, dest="antibiotic_concentration",
+                        default=DEFAULT_PARAMETERS["antibiotic_concentration"])
+    parser.add_argument("--reproduction-rate", type=float, default=DEFAULT_PARAMETERS["reproduction_rate"])
+    parser.add_argument("--generations", type=int, default=DEFAULT_PARAMETERS["max_generations"])
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    params = {
+        "population_size": args.population_size,
+        "carrying_capacity": args.carrying_capacity,
+        "antibiotic_concentration": args.antibiotic_concentration,
+        "reproduction_rate": args.reproduction_rate,
+        "max_generations": args.generations,
+    }
+    root = seed_sequence(args.seed)
+
+    start = time.perf_counter()
+    engine = BatchedEngine(args.replicates, seed=root, **params)
+    engine.run()
+    batched = time.perf_counter() - start
+    batched_means = [summary["final_mean_resistance"] for summary in engine.summaries()]
+
+    start = time.perf_counter()
+    single_means = []
+    for child in root.spawn(args.replicates):
+        single = SimulationEngine(seed=child, backend="numpy", **params)
+        single.run()
+        single_means.append(single.summary()["final_mean_resistance"])
+    sequential = time.perf_counter() - start
+
+    print(f"{args.replicates} replicates x {args.generations} generations")
+    print(f"  batched:                   {batched:8.2f} s  final mean resistance {np.mean(batched_means):.4f}")
+    print(f"  sequential (numpy kernel): {sequential:8.2f} s  final mean resistance {np.mean(single_means):.4f}")
+    print(f"  speedup:                   {sequential / batched:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
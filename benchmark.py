@@ -0,0 +1,305 @@
+"""Headless benchmarks for generation throughput, rendering and charts
+
+Measures, for each population model and size:
+    generations_per_second  engine.step() throughput at a steady population
+    render_ms               one scatter frame: LOD sampling plus PopulationRenderer.render()
+    chart_ms                one blitted ResistanceCharts update on an Agg canvas
+    chart_full_ms           one full chart redraw (axis change, resize)
+
+Results are written as JSON, so a run can be kept as a baseline and later
+runs compared against it.
+
+The startup command times GUI cold start in fresh interpreters: importing
+the GUI module (all that runs before the window appears), the pygame,
+matplotlib and PIL imports deferred until after it appears, and font
+discovery with and without the font cache. It reports the time to the
+window against loading everything up front.
+
+Example:
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --output current.json
+    python benchmark.py compare baseline.json current.json --threshold 0.1
+    python benchmark.py startup
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from engine import SimulationEngine
+
+DEFAULT_SIZES = (10**3, 10**4, 10**5, 10**6, 10**7)
+DEFAULT_MODES = ("agents", "binned")
+
+# Metrics and whether larger values are better
+METRICS = {
+    "generations_per_second": True,
+    "render_ms": False,
+    "chart_ms": False,
+    "chart_full_ms": False,
+}
+
+# Generations of history shown on the charts while timing them
+CHART_HISTORY = 1000
+
+# Startup measurements: (setup, timed statement), each run in a fresh interpreter
+STARTUP_STEPS = {
+    "gui_import_ms": ("", "import Simulasi"),
+    "deferred_import_ms": ("import Simulasi",
+                           "import pygame, PIL.ImageTk, renderer, charts, "
+                           "matplotlib.backends.backend_tkagg"),
+    "font_scan_ms": ("from fonts import find_font",
+                     "find_font('Roboto-Regular.ttf', cache_path=None)"),
+    "font_cached_ms": ("from fonts import find_font; find_font('Roboto-Regular.ttf', cache_path={cache!r})",
+                       "find_font('Roboto-Regular.ttf', cache_path={cache!r})"),
+}
+
+
+def make_engine(population_mode, size, seed=0, backend="numpy"):
+    """Engine that holds its population near size (every cell survives and the cap binds)"""
+    engine = SimulationEngine(seed=seed, population_mode=population_mode, backend=backend,
+                              population_size=size, carrying_capacity=size,
+                              initial_resistance_range=(0.0, 0.1),
+                              antibiotic_concentration=0.1, reproduction_rate=1.5,
+                              max_generations=0)
+    engine.step()  # warm up caches (mutation kernel, random blocks)
+    return engine
+
+
+def time_generations(engine, min_time):
+    """Generations per second over at least min_time seconds and three generations"""
+    steps = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while steps < 3 or elapsed < min_time:
+        engine.step()
+        steps += 1
+        elapsed = time.perf_counter() - start
+    return steps / elapsed
+
+
+def time_calls(func, min_time, min_calls=5):
+    """Median milliseconds per call of func()"""
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < min_calls or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def time_render(engine, min_time):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from renderer import PopulationRenderer
+
+    renderer = PopulationRenderer((600, 400))
+
+    def frame():
+        count = engine.population_count()
+        if count > renderer.lod_threshold:
+            values = engine.stratified_values(renderer.lod_threshold)
+        else:
+            values = engine.resistance_values(count)
+        renderer.render(values, engine.antibiotic_concentration, "scatter", count)
+
+    return time_calls(frame, min_time)
+
+
+def time_charts(engine, min_time):
+    """(blitted update ms, full redraw ms) for the three-panel charts"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from charts import ResistanceCharts
+
+    fig = Figure(figsize=(12, 6), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    charts = ResistanceCharts(fig)
+    rng = np.random.default_rng(0)
+    population = engine.population_count() * (1 + 0.01 * rng.standard_normal(CHART_HISTORY))
+    resistance = np.linspace(0.05, engine.average_resistance(), CHART_HISTORY)
+    counts, _ = engine.histogram(bins=charts.histogram_bins)
+    charts.update(population, resistance, counts, engine.antibiotic_concentration)
+    charts.draw(canvas)
+
+    def update():
+        charts.update(population, resistance, counts, engine.antibiotic_concentration)
+        charts.draw(canvas)
+
+    def full_redraw():
+        charts.mark_layout_dirty()
+        charts.draw(canvas)
+
+    return time_calls(update, min_time), time_calls(full_redraw, min_time)
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, modes=DEFAULT_MODES, min_time=1.0,
+                   render=True, charts=True, on_result=None, backend="numpy"):
+    """Benchmark every (mode, size) pair and return the results document"""
+    results = []
+    for mode in modes:
+        for size in sizes:
+            engine = make_engine(mode, size, backend=backend)
+            result = {
+                "mode": mode,
+                "population": size,
+                "generations_per_second": time_generations(engine, min_time),
+            }
+            if render:
+                result["render_ms"] = time_render(engine, min_time)
+            if charts:
+                result["chart_ms"], result["chart_full_ms"] = time_charts(engine, min_time)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPUs)",
+        "min_time": min_time,
+        "backend": engine.backend,
+        "results": results,
+    }
+
+
+def time_startup_step(setup, statement, repeat):
+    """Median milliseconds of statement, each sample in a new interpreter"""
+    code = f"{setup}\nimport time\nstart = time.perf_counter()\n{statement}\n" \
+           "print((time.perf_counter() - start) * 1000)"
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=env, capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.split()[-1]))
+    return statistics.median(samples)
+
+
+def run_startup(repeat=5):
+    """Cold-start timings plus the time to the window, deferred vs eager"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = os.path.join(directory, "fonts.json")
+        result = {name: time_startup_step(setup.format(cache=cache), statement.format(cache=cache), repeat)
+                  for name, (setup, statement) in STARTUP_STEPS.items()}
+    # Before lazy loading, every import and an uncached font scan ran before the window
+    result["window_ms"] = result["gui_import_ms"]
+    result["eager_window_ms"] = (result["gui_import_ms"] + result["deferred_import_ms"]
+                                 + result["font_scan_ms"])
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPUs)",
+        "repeat": repeat,
+        "startup": result,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """Rows of (mode, population, metric, baseline, current, change, regressed)
+
+    change is the relative slowdown: positive when the current run is worse,
+    whichever direction the metric improves in.
+    """
+    base_results = {(r["mode"], r["population"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        base = base_results.get((result["mode"], result["population"]))
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in result or metric not in base or base[metric] <= 0:
+                continue
+            ratio = result[metric] / base[metric]
+            change = (1 / ratio - 1) if higher_is_better else (ratio - 1)
+            rows.append((result["mode"], result["population"], metric,
+                         base[metric], result[metric], change, change > threshold))
+    return rows
+
+
+def format_result(result):
+    parts = [f"{result['mode']:>6} {result['population']:>10,}",
+             f"{result['generations_per_second']:10.1f} gen/s"]
+    if "render_ms" in result:
+        parts.append(f"render {result['render_ms']:7.2f} ms")
+    if "chart_ms" in result:
+        parts.append(f"chart {result['chart_ms']:7.2f} ms (full {result['chart_full_ms']:.1f} ms)")
+    return "  ".join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the resistance model, renderer and charts")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write a JSON results file")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    run_parser.add_argument("--modes", nargs="+", choices=DEFAULT_MODES, default=list(DEFAULT_MODES))
+    run_parser.add_argument("--min-time", type=float, default=1.0,
+                            help="seconds spent timing each measurement")
+    run_parser.add_argument("--no-render", action="store_true", help="skip the renderer benchmark")
+    run_parser.add_argument("--no-charts", action="store_true", help="skip the chart benchmark")
+    run_parser.add_argument("--backend", choices=("auto", "numpy", "numba"), default="numpy",
+                            help="agent-mode generation kernel (see kernels.py)")
+
+    startup_parser = commands.add_parser("startup", help="time GUI cold start in fresh interpreters")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="interpreters started per measurement")
+    startup_parser.add_argument("--output", default=None, help="also write the timings as JSON")
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative slowdown reported as a regression (default 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        document = run_benchmarks(args.sizes, args.modes, args.min_time,
+                                  render=not args.no_render, charts=not args.no_charts,
+                                  on_result=lambda result: print(format_result(result), flush=True),
+                                  backend=args.backend)
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.output}")
+        return 0
+
+    if args.command == "startup":
+        document = run_startup(args.repeat)
+        startup = document["startup"]
+        for name in STARTUP_STEPS:
+            print(f"{name:>20}: {startup[name]:8.1f} ms")
+        print(f"Window after {startup['window_ms']:.0f} ms "
+              f"(loading everything first: {startup['eager_window_ms']:.0f} ms, "
+              f"{startup['eager_window_ms'] / startup['window_ms']:.1f}x slower)")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(document, f, indent=2)
+            print(f"Results written to {args.output}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    regressions = 0
+    for mode, population, metric, before, after, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{mode:>6} {population:>10,} {metric:>22}: {before:10.2f} -> {after:10.2f} "
+              f"slowdown {change:+6.1%} {flag}")
+        regressions += regressed
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
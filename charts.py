@@ -0,0 +1,268 @@
+"""Matplotlib charts for population size, mean resistance and distribution
+
+The line, fill, histogram-bar and annotation artists are created once and
+updated in place. They are marked animated, so a full canvas draw only
+renders the static background (axes, ticks, grid, ensemble bands). Regular
+updates restore the cached per-axes background, redraw the data artists
+and blit just those axes. Full redraws happen only when an axis range has
+to grow or shrink, when ensemble bands change, or after a resize. Surrogate
+previews (see surrogate.py) follow the sliders, so they are animated too.
+"""
+import matplotlib.style
+import numpy as np
+
+from theme import COLORS
+
+# Headroom factors used when an axis range has to change
+X_GROWTH = 1.5
+Y_GROWTH = 1.25
+
+# Pixels around each axes saved and restored with it, so antialiased edges
+# of clipped artists never accumulate across blits
+BLIT_PADDING = 2
+
+
+def _style_axes(ax, title, xlabel, ylabel):
+    ax.set_facecolor('#f8f9fa')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['bottom'].set_color('#cccccc')
+    ax.spines['left'].set_color('#cccccc')
+    ax.tick_params(colors='#666666', labelsize=9)
+    ax.grid(True, linestyle='--', alpha=0.7, color='#dddddd')
+    ax.set_title(title, color='#333333', fontsize=13, fontweight='bold')
+    ax.set_xlabel(xlabel, color='#333333', fontsize=11)
+    ax.set_ylabel(ylabel, color='#333333', fontsize=11)
+
+
+def _area_vertices(x, y):
+    """Polygon vertices for the shaded area between y and zero"""
+    if len(x) == 0:
+        return np.zeros((0, 2))
+    top = np.column_stack([x, y])
+    return np.vstack([[x[0], 0], top, [x[-1], 0]])
+
+
+def _band_vertices(x, low, high):
+    """Polygon vertices for the area between two curves, skipping NaNs"""
+    valid = ~(np.isnan(low) | np.isnan(high))
+    x, low, high = x[valid], low[valid], high[valid]
+    if len(x) == 0:
+        return np.zeros((0, 2))
+    return np.vstack([np.column_stack([x, high]), np.column_stack([x[::-1], low[::-1]])])
+
+
+class ResistanceCharts:
+    """Three-panel chart with persistent artists and blitted updates"""
+    def __init__(self, fig, histogram_bins=30):
+        matplotlib.style.use('ggplot')
+        self.fig = fig
+        self.histogram_bins = histogram_bins
+        self.canvas = None
+        self.backgrounds = None
+        self.layout_dirty = True
+        self.limits_fixed = False
+
+        # Create subplots with more space
+        fig.subplots_adjust(bottom=0.15, top=0.9, wspace=0.3)
+        self.ax1 = fig.add_subplot(131)  # Population size
+        self.ax2 = fig.add_subplot(132)  # Average resistance
+        self.ax3 = fig.add_subplot(133)  # Resistance distribution
+
+        _style_axes(self.ax1, "Population Size Over Time", "Generation", "Population Size")
+        _style_axes(self.ax2, "Average Resistance Over Time", "Generation", "Resistance Value")
+        _style_axes(self.ax3, "Resistance Distribution", "Resistance Value", "Number of Bacteria")
+        self.ax1.set_xlim(0, 10)
+        self.ax1.set_ylim(0, 1)
+        self.ax2.set_xlim(0, 10)
+        self.ax2.set_ylim(0, 1)
+        self.ax3.set_xlim(0, 1)
+        self.ax3.set_ylim(0, 1)
+
+        # Ensemble bands are static between ensembles, so they live in the background
+        self.population_band = self.ax1.fill(np.zeros(0), np.zeros(0), color=COLORS["tertiary"],
+                                             alpha=0.35, linewidth=0)[0]
+        self.population_median, = self.ax1.plot([], [], color=COLORS["primary"],
+                                                linestyle='--', linewidth=1, alpha=0.8)
+        self.resistance_band = self.ax2.fill(np.zeros(0), np.zeros(0), color=COLORS["tertiary"],
+                                             alpha=0.35, linewidth=0)[0]
+        self.resistance_median, = self.ax2.plot([], [], color=COLORS["secondary"],
+                                                linestyle='--', linewidth=1, alpha=0.8)
+
+        # Surrogate previews of the expected trajectories for the current sliders
+        self.population_preview, = self.ax1.plot([], [], color=COLORS["accent"],
+                                                 linestyle=':', linewidth=1.5)
+        self.resistance_preview, = self.ax2.plot([], [], color=COLORS["accent"],
+                                                 linestyle=':', linewidth=1.5)
+
+        # Population size over time, with shaded area under the curve
+        self.population_line, = self.ax1.plot([], [], color=COLORS["primary"], linewidth=2)
+        self.population_fill = self.ax1.fill(np.zeros(0), np.zeros(0), color=COLORS["primary"],
+                                             alpha=0.2, linewidth=0)[0]
+
+        # Average resistance over time, with shaded area and concentration line
+        self.resistance_line, = self.ax2.plot([], [], color=COLORS["secondary"], linewidth=2)
+        self.resistance_fill = self.ax2.fill(np.zeros(0), np.zeros(0), color=COLORS["secondary"],
+                                             alpha=0.2, linewidth=0)[0]
+        self.concentration_hline = self.ax2.axhline(y=0, color=COLORS["accent"],
+                                                    linestyle='--', alpha=0.8, linewidth=1.5)
+        self.concentration_label = self.ax2.text(0, 0, "", color=COLORS["accent"], fontsize=10)
+
+        # Resistance distribution histogram, with concentration marker
+        edges = np.linspace(0, 1, histogram_bins + 1)
+        self.bin_centers = 0.5 * (edges[:-1] + edges[1:])
+        self.bars = self.ax3.bar(self.bin_centers, np.zeros(histogram_bins), width=1 / histogram_bins,
+                                 color=COLORS["tertiary"], alpha=0.7)
+        self.concentration_vline = self.ax3.axvline(x=0, color='black',
+                                                    linestyle='--', alpha=0.8, linewidth=1.5)
+        self.histogram_label = self.ax3.text(0, 0, "Antibiotic\nConcentration",
+                                             color='black', fontsize=10)
+
+        # Data artists per axes, redrawn on every update
+        self.animated = {
+            self.ax1: [self.population_fill, self.population_line, self.population_preview],
+            self.ax2: [self.resistance_fill, self.resistance_line, self.resistance_preview,
+                       self.concentration_hline, self.concentration_label],
+            self.ax3: list(self.bars) + [self.concentration_vline, self.histogram_label],
+        }
+        for artists in self.animated.values():
+            for artist in artists:
+                artist.set_animated(True)
+        # Blits only restore the axes area, so labels must not spill outside it
+        self.concentration_label.set_clip_path(self.ax2.patch)
+        self.histogram_label.set_clip_path(self.ax3.patch)
+
+        self.needs_full_redraw = True
+        fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def mark_layout_dirty(self):
+        """Recompute the layout on the next draw (call after a resize)"""
+        self.layout_dirty = True
+        self.needs_full_redraw = True
+
+    def fix_limits(self, last_generation, peak_population, peak_count):
+        """Pin every axis range (for offline export, so all frames share one scale)"""
+        for ax in (self.ax1, self.ax2):
+            ax.set_xlim(0, max(10, last_generation))
+        self.ax1.set_ylim(0, max(peak_population, 1) * Y_GROWTH)
+        self.ax3.set_ylim(0, max(peak_count, 1) * Y_GROWTH)
+        self.limits_fixed = True
+        self.needs_full_redraw = True
+
+    def set_ensemble(self, result):
+        """Show ensemble 5-95% bands and medians, or clear them with None"""
+        if result is None:
+            for band in (self.population_band, self.resistance_band):
+                band.set_xy(np.zeros((0, 2)))
+            for median in (self.population_median, self.resistance_median):
+                median.set_data([], [])
+        else:
+            x = np.arange(len(result["population_mean"]))
+            pop_q = result["population_quantiles"]
+            res_q = result["resistance_quantiles"]
+            self.population_band.set_xy(_band_vertices(x, pop_q[0.05], pop_q[0.95]))
+            self.population_median.set_data(x, pop_q[0.5])
+            self.resistance_band.set_xy(_band_vertices(x, res_q[0.05], res_q[0.95]))
+            self.resistance_median.set_data(x, res_q[0.5])
+            self._fit_x(len(x) - 1, exact=True)
+            self._fit_y(self.ax1, np.nanmax(pop_q[0.95]))
+        self.needs_full_redraw = True
+
+    def set_preview(self, prediction):
+        """Show a Surrogate.predict() result as dotted lines, or clear them with None"""
+        if prediction is None:
+            self.population_preview.set_data([], [])
+            self.resistance_preview.set_data([], [])
+            return
+        x = np.arange(len(prediction["population"]))
+        self.population_preview.set_data(x, prediction["population"])
+        self.resistance_preview.set_data(x, prediction["resistance"])
+        if not self.limits_fixed:
+            self._fit_x(len(x) - 1)
+            self._fit_y(self.ax1, np.max(prediction["population"]))
+
+    def update(self, population_history, resistance_history, histogram_counts, concentration,
+               generations=None):
+        """Update all data artists in place
+
+        generations gives the x position of each history value (for down-sampled
+        history); by default the values are consecutive generations from 0.
+        """
+        if generations is None:
+            x = np.arange(len(population_history))
+        else:
+            x = np.asarray(generations)
+        population = np.asarray(population_history, dtype=np.float64)
+        resistance = np.asarray(resistance_history, dtype=np.float64)
+
+        self.population_line.set_data(x, population)
+        self.population_fill.set_xy(_area_vertices(x, population))
+        self.resistance_line.set_data(x, resistance)
+        self.resistance_fill.set_xy(_area_vertices(x, resistance))
+
+        self.concentration_hline.set_ydata([concentration, concentration])
+        self.concentration_label.set_position((0, concentration + 0.02))
+        self.concentration_label.set_text(f"Antibiotic Concentration: {concentration:.2f}")
+
+        # Color the bins based on their relationship to antibiotic concentration
+        counts = np.asarray(histogram_counts, dtype=np.float64)
+        for bar, height, center in zip(self.bars, counts, self.bin_centers):
+            bar.set_height(height)
+            bar.set_facecolor(COLORS["accent"] if center < concentration else COLORS["secondary"])
+
+        has_bacteria = counts.sum() > 0
+        peak = counts.max() if has_bacteria else 0
+        self.concentration_vline.set_xdata([concentration, concentration])
+        self.concentration_vline.set_visible(has_bacteria)
+        self.histogram_label.set_position((concentration + 0.02, peak * 0.9))
+        self.histogram_label.set_visible(has_bacteria)
+
+        # Only change axis ranges when the data leaves them (or the histogram shrinks a lot)
+        if self.limits_fixed:
+            return
+        if len(x):
+            self._fit_x(x[-1])
+            self._fit_y(self.ax1, population.max())
+        self._fit_y(self.ax3, peak, allow_shrink=True)
+
+    def _fit_x(self, last_generation, exact=False):
+        for ax in (self.ax1, self.ax2):
+            right = ax.get_xlim()[1]
+            if last_generation > right or (exact and last_generation != right):
+                ax.set_xlim(0, max(10, last_generation if exact else last_generation * X_GROWTH))
+                self.needs_full_redraw = True
+
+    def _fit_y(self, ax, peak, allow_shrink=False):
+        if not np.isfinite(peak) or peak <= 0:
+            return
+        top = ax.get_ylim()[1]
+        if peak > top or (allow_shrink and peak < top / (Y_GROWTH * Y_GROWTH * 2)):
+            ax.set_ylim(0, peak * Y_GROWTH)
+            self.needs_full_redraw = True
+
+    def draw(self, canvas):
+        """Render pending changes: blit when possible, full redraw otherwise"""
+        self.canvas = canvas
+        if self.needs_full_redraw or self.backgrounds is None:
+            if self.layout_dirty:
+                self.fig.tight_layout()
+                self.layout_dirty = False
+            # The draw event captures the new backgrounds and draws the data artists
+            canvas.draw()
+            return
+
+        for ax, artists in self.animated.items():
+            canvas.restore_region(self.backgrounds[ax])
+            for artist in artists:
+                ax.draw_artist(artist)
+            canvas.blit(ax.bbox.padded(BLIT_PADDING))
+
+    def _on_draw(self, event):
+        """After any full draw, cache the static backgrounds and redraw the data"""
+        canvas = self.fig.canvas
+        self.backgrounds = {ax: canvas.copy_from_bbox(ax.bbox.padded(BLIT_PADDING))
+                            for ax in self.animated}
+        for ax, artists in self.animated.items():
+            for artist in artists:
+                ax.draw_artist(artist)
+        self.needs_full_redraw = False
@@ -0,0 +1,613 @@
+"""Headless simulation engine for the antibiotic resistance model
+
+All model state and stepping logic lives here. This module deliberately
+imports no tkinter, pygame or matplotlib so it can be driven from scripts,
+batch jobs and worker processes on machines without a display.
+"""
+import functools
+import math
+import time
+
+import numpy as np
+
+from history_store import MemoryHistory
+from profiling import NULL_TIMER
+
+# Bumped whenever a change alters the run a given seed and parameters produce
+# (cached runs are keyed on it, see run_cache.py)
+ENGINE_VERSION = 1
+
+# Default model parameters (the same defaults the GUI starts with)
+DEFAULT_PARAMETERS = {
+    "population_size": 1000,
+    "initial_resistance_range": (0.0, 0.1),
+    "antibiotic_concentration": 0.3,
+    "mutation_std": 0.01,
+    "reproduction_rate": 1.2,
+    "carrying_capacity": 2000,
+    "max_generations": 100,  # 0 = unlimited
+}
+
+# Population representations: one float per cell, or cell counts per resistance bin
+POPULATION_MODES = ("agents", "binned")
+DEFAULT_NUM_BINS = 1000
+
+# Resistance strata used for level-of-detail sampling
+DEFAULT_STRATA = 256
+
+# NumPy's exact hypergeometric samplers only accept totals below this
+_HYPERGEOMETRIC_LIMIT = 10**9
+
+# Uniform and normal variates pre-generated per refill of a RandomBlocks buffer
+DEFAULT_BLOCK_SIZE = 65536
+
+
+def normalize_parameters(params):
+    """Model parameters converted to their canonical types; rejects unknown names"""
+    normalized = {}
+    for name, value in params.items():
+        if name not in DEFAULT_PARAMETERS:
+            raise ValueError(f"Unknown simulation parameter: {name}")
+        if name == "initial_resistance_range":
+            value = (float(value[0]), float(value[1]))
+        elif name in ("population_size", "carrying_capacity", "max_generations"):
+            value = int(value)
+        else:
+            value = float(value)
+        normalized[name] = value
+    return normalized
+
+
+def seed_sequence(seed=None):
+    """SeedSequence for an int seed, an existing SeedSequence, or fresh entropy"""
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+class RandomBlocks:
+    """Generator front end that serves uniform and normal draws from blocks
+
+    random() and normal() hand out slices of large pre-generated buffers,
+    so the per-generation kernels pay NumPy's per-call overhead once per
+    block instead of once per draw. Every other method is passed through to
+    the wrapped Generator. The unused parts of the buffers belong to the
+    random state and are saved in checkpoints alongside the Generator state.
+    """
+    def __init__(self, rng, block_size=DEFAULT_BLOCK_SIZE, uniform=None, normal=None):
+        self.rng = rng
+        self.block_size = block_size
+        self.uniform_block = np.empty(0) if uniform is None else np.asarray(uniform, dtype=np.float64)
+        self.normal_block = np.empty(0) if normal is None else np.asarray(normal, dtype=np.float64)
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+    def random(self, size=None):
+        if size is None:
+            return float(self._take_uniform(1)[0])
+        return self._take_uniform(int(size))
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        if size is None:
+            return self.rng.normal(loc, scale)
+        return loc + scale * self._take_normal(int(size))
+
+    def _take_uniform(self, n):
+        block = self.uniform_block
+        if n > block.size:
+            block = np.concatenate([block, self.rng.random(max(self.block_size, n - block.size))])
+        values, self.uniform_block = block[:n], block[n:]
+        return values
+
+    def _take_normal(self, n):
+        block = self.normal_block
+        if n > block.size:
+            block = np.concatenate([block, self.rng.standard_normal(max(self.block_size, n - block.size))])
+        values, self.normal_block = block[:n], block[n:]
+        return values
+
+
+def generation_kernel(population, concentration, mutation_std, reproduction_rate, capacity, rng,
+                      timer=NULL_TIMER):
+    """Selection, reproduction, mutation and capacity cap for one generation"""
+    # Apply selection (bacteria survival based on resistance)
+    # Higher resistance means higher survival probability under antibiotic pressure
+    with timer.phase("selection"):
+        survival_prob = 1 - (concentration - population)
+        survived = population[rng.random(population.size) < survival_prob]
+
+    # Reproduction: each survivor has floor(rate) offspring plus one more
+    # with probability equal to the fractional part of the rate
+    with timer.phase("reproduction"):
+        base_offspring = int(np.floor(reproduction_rate))
+        extra_prob = reproduction_rate - base_offspring
+        num_offspring = base_offspring + (rng.random(survived.size) < extra_prob)
+        next_gen = np.repeat(survived, num_offspring)
+
+    # Apply mutation and keep resistance within [0, 1]
+    with timer.phase("mutation"):
+        next_gen += rng.normal(0, mutation_std, next_gen.size)
+        np.clip(next_gen, 0, 1, out=next_gen)
+
+    # Apply carrying capacity limit
+    with timer.phase("capacity"):
+        if next_gen.size > capacity:
+            next_gen = rng.choice(next_gen, capacity, replace=False)
+
+    return next_gen
+
+
+def multivariate_hypergeometric(counts, nsample, rng):
+    """Draw nsample items without replacement from bins holding counts items
+
+    Works for totals beyond NumPy's 1e9 limit by drawing bin by bin from the
+    conditional hypergeometric marginals, using a normal approximation for
+    bins too large for the exact sampler.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total < _HYPERGEOMETRIC_LIMIT:
+        return rng.multivariate_hypergeometric(counts, nsample, method="marginals")
+
+    draws = np.zeros_like(counts)
+    remaining_total = total
+    remaining_sample = int(nsample)
+    for i in np.flatnonzero(counts):
+        if remaining_sample == 0:
+            break
+        good = int(counts[i])
+        bad = remaining_total - good
+        if bad == 0:
+            draws[i] = remaining_sample
+            break
+        if good < _HYPERGEOMETRIC_LIMIT and bad < _HYPERGEOMETRIC_LIMIT:
+            taken = int(rng.hypergeometric(good, bad, remaining_sample))
+        else:
+            p = good / remaining_total
+            variance = (remaining_sample * p * (1 - p)
+                        * (remaining_total - remaining_sample) / (remaining_total - 1))
+            taken = int(round(rng.normal(remaining_sample * p, math.sqrt(variance))))
+            taken = min(max(taken, remaining_sample - bad, 0), good, remaining_sample)
+        draws[i] = taken
+        remaining_total -= good
+        remaining_sample -= taken
+    return draws
+
+
+def stratified_sample(counts, edges, k, rng):
+    """k values whose histogram matches counts as closely as integers allow
+
+    Each bin gets its proportional share of k (largest-remainder rounding)
+    and its values are spread uniformly within the bin, so the resistance
+    distribution survives the subsampling intact.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+    k = int(min(k, total))
+    if k <= 0:
+        return np.empty(0)
+
+    quota = counts * (k / total)
+    alloc = np.floor(quota).astype(np.int64)
+    short = k - int(alloc.sum())
+    if short > 0:
+        alloc[np.argsort(alloc - quota)[:short]] += 1
+
+    lower = np.repeat(edges[:-1], alloc)
+    width = np.repeat(np.diff(edges), alloc)
+    values = lower + rng.random(lower.size) * width
+    rng.shuffle(values)
+    return values
+
+
+@functools.lru_cache(maxsize=4)
+def mutation_kernel(num_bins, mutation_std):
+    """Row-stochastic matrix P(child bin | parent bin) for clipped Gaussian mutation"""
+    n = num_bins
+    if mutation_std <= 0:
+        return np.eye(n)
+
+    # Upper edge of child bin j sits (j - i + 0.5) bin widths above parent center i,
+    # so the whole matrix only needs the normal CDF at 2n offsets
+    offsets = np.arange(-n, n) + 0.5
+    scale = math.sqrt(2) * mutation_std * n
+    cdf = np.array([0.5 * (1 + math.erf(d / scale)) for d in offsets])
+    index = np.arange(n)[None, :] - np.arange(n)[:, None] + n
+    upper = cdf[index]
+
+    # Mass clipped below 0 or above 1 lands in the edge bins
+    upper[:, -1] = 1.0
+    kernel = np.diff(upper, axis=1, prepend=0.0)
+    return kernel / kernel.sum(axis=1, keepdims=True)
+
+
+class AgentPopulation:
+    """One float resistance value per bacterium, stepped by a generation kernel"""
+    mode = "agents"
+
+    def __init__(self, values, kernel=generation_kernel):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.kernel = kernel
+
+    @classmethod
+    def uniform(cls, size, min_res, max_res, rng, kernel=generation_kernel):
+        return cls(rng.uniform(min_res, max_res, size), kernel)
+
+    def size(self):
+        return int(self.values.size)
+
+    def mean(self):
+        if self.values.size == 0:
+            return 0.0
+        return float(np.mean(self.values))
+
+    def fraction_at_least(self, threshold):
+        if self.values.size == 0:
+            return 0.0
+        return np.count_nonzero(self.values >= threshold) / self.values.size
+
+    def histogram(self, bins=30):
+        """Counts and edges of the resistance distribution over [0, 1]"""
+        return np.histogram(self.values, bins=bins, range=(0, 1))
+
+    def sample(self, k, rng):
+        """Up to k resistance values drawn without replacement"""
+        if self.values.size <= k:
+            return self.values
+        return rng.choice(self.values, k, replace=False)
+
+    def step(self, concentration, mutation_std, reproduction_rate, capacity, rng, timer=NULL_TIMER):
+        return AgentPopulation(self.kernel(
+            self.values, concentration, mutation_std, reproduction_rate, capacity, rng, timer),
+            self.kernel)
+
+    def copy_data(self):
+        return self.values.copy()
+
+
+class BinnedPopulation:
+    """Cell counts per resistance bin; cost scales with bins, not cells"""
+    mode = "binned"
+
+    def __init__(self, counts):
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.num_bins = self.counts.size
+        self.edges = np.linspace(0, 1, self.num_bins + 1)
+        self.centers = 0.5 * (self.edges[:-1] + self.edges[1:])
+
+    @classmethod
+    def uniform(cls, size, min_res, max_res, num_bins, rng):
+        edges = np.linspace(0, 1, num_bins + 1)
+        if max_res > min_res:
+            # Fraction of [min_res, max_res] that falls in each bin
+            overlap = np.clip(np.minimum(edges[1:], max_res) - np.maximum(edges[:-1], min_res), 0, None)
+            probs = overlap / overlap.sum()
+        else:
+            probs = np.zeros(num_bins)
+            probs[min(int(min_res * num_bins), num_bins - 1)] = 1.0
+        return cls(rng.multinomial(size, probs))
+
+    def size(self):
+        return int(self.counts.sum())
+
+    def mean(self):
+        total = self.counts.sum()
+        if total == 0:
+            return 0.0
+        return float(np.dot(self.counts, self.centers) / total)
+
+    def fraction_at_least(self, threshold):
+        total = self.counts.sum()
+        if total == 0:
+            return 0.0
+        return float(self.counts[self.centers >= threshold].sum() / total)
+
+    def histogram(self, bins=30):
+        """Counts and edges of the resistance distribution over [0, 1]"""
+        coarse = np.minimum((self.centers * bins).astype(np.int64), bins - 1)
+        counts = np.bincount(coarse, weights=self.counts, minlength=bins)
+        return counts, np.linspace(0, 1, bins + 1)
+
+    def sample(self, k, rng):
+        """Up to k resistance values, jittered uniformly within their bins"""
+        draws = multivariate_hypergeometric(self.counts, min(k, self.size()), rng)
+        values = np.repeat(self.centers, draws)
+        values += rng.uniform(-0.5, 0.5, values.size) / self.num_bins
+        rng.shuffle(values)
+        return np.clip(values, 0, 1)
+
+    def step(self, concentration, mutation_std, reproduction_rate, capacity, rng, timer=NULL_TIMER):
+        # Survival: binomial draw per bin
+        with timer.phase("selection"):
+            survival_prob = np.clip(1 - (concentration - self.centers), 0, 1)
+            survived = rng.binomial(self.counts, survival_prob)
+
+        # Reproduction: floor(rate) offspring each plus a binomial number of extras,
+        # the exact per-bin total of the agent model's offspring rule
+        with timer.phase("reproduction"):
+            base_offspring = int(np.floor(reproduction_rate))
+            extra_prob = reproduction_rate - base_offspring
+            offspring = base_offspring * survived + rng.binomial(survived, extra_prob)
+
+        # Mutation: spread each parent bin's offspring over child bins
+        with timer.phase("mutation"):
+            counts = np.zeros(self.num_bins, dtype=np.int64)
+            parents = np.flatnonzero(offspring)
+            if parents.size:
+                kernel = mutation_kernel(self.num_bins, mutation_std)
+                counts = rng.multinomial(offspring[parents], kernel[parents]).sum(axis=0)
+
+        # Apply carrying capacity limit by sampling without replacement
+        with timer.phase("capacity"):
+            if counts.sum() > capacity:
+                counts = multivariate_hypergeometric(counts, capacity, rng)
+
+        return BinnedPopulation(counts)
+
+    def copy_data(self):
+        return self.counts.copy()
+
+
+class SimulationEngine:
+    """Model state and generation stepping, independent of any GUI"""
+    def __init__(self, seed=None, population_mode="agents", num_bins=DEFAULT_NUM_BINS,
+                 history=None, backend="numpy", **params):
+        self.reseed(seed)
+        self.set_backend(backend)
+        # Separate stream for display sampling so drawing never perturbs the model
+        self.sample_rng = np.random.default_rng()
+        self.set_population_mode(population_mode, num_bins)
+
+        # Model parameters
+        for name, value in DEFAULT_PARAMETERS.items():
+            setattr(self, name, value)
+        self.set_parameters(**params)
+
+        # Model state. The per-generation history is a MemoryHistory unless an
+        # on-disk HistoryStore is passed in; peak and extinction are tracked here.
+        self.population = AgentPopulation(np.empty(0), self.kernel)
+        self.generation = 0
+        self.history = history if history is not None else MemoryHistory()
+        self.timer = NULL_TIMER  # attach a profiling.PhaseTimer to time each phase
+        self.telemetry = None  # attach a telemetry.TelemetryPublisher to stream metrics
+        self.recorded_metrics = None  # (count, mean, resistant fraction) of the last generation
+        self.peak_population = 0
+        self.extinction_generation = None
+
+        self.initialize_population()
+
+    def reseed(self, seed=None):
+        """Start a new model random stream
+
+        seed may be an int, a SeedSequence (e.g. one spawned per replicate or
+        worker) or None for fresh entropy. seed_sequence.entropy and
+        seed_sequence.spawn_key are enough to replay the run exactly.
+        """
+        self.seed_sequence = seed_sequence(seed)
+        self.rng = np.random.Generator(np.random.PCG64(self.seed_sequence))
+        # Kernel draws come in pre-generated blocks from the same stream
+        self.draws = RandomBlocks(self.rng)
+
+    def set_parameters(self, **params):
+        """Update model parameters; changes apply from the next step"""
+        for name, value in normalize_parameters(params).items():
+            setattr(self, name, value)
+
+    def set_population_mode(self, population_mode, num_bins=None):
+        """Choose the representation used by the next initialize_population()
+
+        "agents" keeps one resistance value per cell; "binned" keeps cell
+        counts per resistance bin so cost depends on num_bins, not on the
+        population size.
+        """
+        if population_mode not in POPULATION_MODES:
+            raise ValueError(f"Unknown population mode: {population_mode}")
+        if num_bins is not None:
+            if int(num_bins) < 2:
+                raise ValueError("num_bins must be at least 2")
+            self.num_bins = int(num_bins)
+        self.population_mode = population_mode
+
+    def set_backend(self, backend):
+        """Choose the agent-mode generation kernel: "numpy", "numba" or "auto"
+
+        See kernels.py; runs only replay across machines with the same
+        backend. Takes effect from the next step.
+        """
+        from kernels import make_kernel
+
+        self.backend, self.kernel = make_kernel(backend)
+        if isinstance(getattr(self, "population", None), AgentPopulation):
+            self.population.kernel = self.kernel
+
+    def get_parameters(self):
+        """Return the current model parameters as a dict"""
+        return {name: getattr(self, name) for name in DEFAULT_PARAMETERS}
+
+    def initialize_population(self):
+        """Create a fresh population and reset generation and history"""
+        self.population = self.create_population()
+        self.generation = 0
+        self.history.clear()
+        self.peak_population = 0
+        self.extinction_generation = None
+        self.record_generation()
+
+    def create_population(self):
+        """Initial population drawn from the current parameters"""
+        min_res, max_res = self.initial_resistance_range
+        if self.population_mode == "binned":
+            return BinnedPopulation.uniform(
+                self.population_size, min_res, max_res, self.num_bins, self.rng)
+        return AgentPopulation.uniform(self.population_size, min_res, max_res, self.rng,
+                                       self.kernel)
+
+    def step(self):
+        """Advance the simulation by one generation"""
+        start = time.perf_counter()
+        with self.timer.phase("generation"):
+            self.population = self.population.step(
+                self.antibiotic_concentration, self.mutation_std,
+                self.reproduction_rate, self.carrying_capacity, self.draws, self.timer)
+            self.generation += 1
+            with self.timer.phase("history"):
+                self.record_generation()
+        if self.telemetry is not None:
+            self.telemetry.record(self, time.perf_counter() - start)
+
+    def record_generation(self):
+        """Append the current generation to the history and running summary"""
+        # Average resistance is recorded as 0 on extinction
+        count = self.population_count()
+        mean = self.average_resistance()
+        self.history.append(count, mean)
+        self.peak_population = max(self.peak_population, count)
+        if count == 0 and self.extinction_generation is None:
+            self.extinction_generation = self.generation
+        # Telemetry publishes these figures instead of recomputing them
+        if self.telemetry is not None:
+            self.recorded_metrics = (count, mean, self.resistant_fraction())
+
+        every = self.history.snapshot_every
+        if every > 0 and self.generation % every == 0:
+            counts, _ = self.population.histogram(self.history.snapshot_bins)
+            self.history.add_distribution(self.generation, counts)
+
+    def run(self, n=None):
+        """Step n generations, or until max_generations when n is None
+
+        Stops early on extinction. Returns the number of generations
+        actually simulated.
+        """
+        if n is None:
+            if self.max_generations <= 0:
+                raise ValueError("run() needs n when max_generations is unlimited")
+            n = max(0, self.max_generations - self.generation)
+
+        steps = 0
+        while steps < n and not self.is_extinct():
+            self.step()
+            steps += 1
+        return steps
+
+    def population_count(self):
+        return self.population.size()
+
+    def average_resistance(self):
+        return self.population.mean()
+
+    def resistant_fraction(self):
+        """Fraction of cells whose resistance is at least the antibiotic concentration
+
+        These cells survive selection with certainty.
+        """
+        return self.population.fraction_at_least(self.antibiotic_concentration)
+
+    def is_extinct(self):
+        return self.population.size() == 0
+
+    def is_finished(self):
+        """True when the population is extinct or max_generations is reached"""
+        if self.is_extinct():
+            return True
+        return self.max_generations > 0 and self.generation >= self.max_generations
+
+    def get_population(self):
+        """Return a copy of the raw population data
+
+        Resistance values in agent mode, per-bin counts in binned mode.
+        """
+        return self.population.copy_data()
+
+    def resistance_values(self, max_count):
+        """Up to max_count resistance values for drawing, in either mode"""
+        return self.population.sample(max_count, self.sample_rng)
+
+    def stratified_values(self, max_count, strata=DEFAULT_STRATA):
+        """At most max_count values with the population's resistance distribution
+
+        Cost is O(population) for agents and O(bins) for binned populations,
+        independent of max_count beyond the output itself.
+        """
+        counts, edges = self.population.histogram(strata)
+        return stratified_sample(counts, edges, max_count, self.sample_rng)
+
+    def histogram(self, bins=30):
+        """Counts and edges of the resistance distribution over [0, 1]"""
+        return self.population.histogram(bins)
+
+    def summary(self):
+        """Headline results of the run so far"""
+        return {
+            "generations": self.generation,
+            "final_population": self.population_count(),
+            "final_mean_resistance": self.average_resistance(),
+            "extinction_generation": self.extinction_generation,
+            "peak_population": self.peak_population,
+        }
+
+    def get_state(self):
+        """Complete model state: arrays plus JSON-serializable metadata
+
+        Includes the model RNG state and its unused pre-generated blocks, so a
+        restored engine continues with exactly the draws the original would
+        have made.
+        """
+        return {
+            "metadata": {
+                "parameters": self.get_parameters(),
+                "population_mode": self.population.mode,
+                "num_bins": self.num_bins,
+                "backend": self.backend,
+                "generation": self.generation,
+                "peak_population": self.peak_population,
+                "extinction_generation": self.extinction_generation,
+                "seed": {"entropy": self.seed_sequence.entropy,
+                         "spawn_key": list(self.seed_sequence.spawn_key)},
+                "rng_state": self.rng.bit_generator.state,
+            },
+            "population": self.population.copy_data(),
+            "uniform_block": self.draws.uniform_block.copy(),
+            "normal_block": self.draws.normal_block.copy(),
+            "population_history": self.history.read("population"),
+            "avg_resistance_history": self.history.read("avg_resistance"),
+        }
+
+    def set_state(self, state):
+        """Restore a state produced by get_state()"""
+        metadata = state["metadata"]
+        self.set_parameters(**metadata["parameters"])
+        self.set_population_mode(metadata["population_mode"], metadata["num_bins"])
+        backend = metadata.get("backend", self.backend)
+        if backend != self.backend:
+            try:
+                self.set_backend(backend)
+            except ValueError:
+                pass  # not installed here: the run continues statistically, not bit-exactly
+        if self.population_mode == "binned":
+            self.population = BinnedPopulation(state["population"])
+        else:
+            self.population = AgentPopulation(state["population"], self.kernel)
+        self.generation = int(metadata["generation"])
+
+        seed = metadata["seed"]
+        self.seed_sequence = np.random.SeedSequence(seed["entropy"], spawn_key=seed["spawn_key"])
+        rng_state = metadata["rng_state"]
+        bit_generator = getattr(np.random, rng_state["bit_generator"])()
+        bit_generator.state = rng_state
+        self.rng = np.random.Generator(bit_generator)
+        self.draws = RandomBlocks(self.rng, uniform=state["uniform_block"],
+                                  normal=state["normal_block"])
+
+        self.peak_population = int(metadata["peak_population"])
+        self.extinction_generation = metadata["extinction_generation"]
+        self.history.clear()
+        self.history.extend(state["population_history"], state["avg_resistance_history"])
+
+    def get_history(self):
+        """Return per-generation history as arrays"""
+        return {
+            "population": self.history.read("population"),
+            "avg_resistance": self.history.read("avg_resistance"),
+        }
@@ -0,0 +1,195 @@
+"""Monte Carlo replicate ensembles with streaming aggregate statistics
+
+Runs many independent replicates of one parameter set and folds each
+finished trajectory into per-generation accumulators: Welford mean and
+variance, fixed-bin histograms for quantiles, and extinction counts.
+Memory is O(generations) however many replicates are run. Agent-mode
+replicates are stepped in batches of about BATCH_CELLS cells by a
+BatchedEngine (see batched.py), which removes most of the per-replicate
+overhead for small populations. Each batch, or each binned replicate, gets
+an independent random stream spawned from one ensemble seed.
+"""
+import multiprocessing
+
+import numpy as np
+
+from batched import BatchedEngine
+from engine import DEFAULT_PARAMETERS, SimulationEngine, seed_sequence
+
+# Quantiles reported for the ensemble bands
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Cells per batched task: enough replicates to amortize the per-call overhead
+# of small populations, while the arrays stay cache-sized
+BATCH_CELLS = 2**16
+
+
+class RunningStats:
+    """Per-generation Welford mean/variance plus a fixed-bin histogram
+
+    Values outside [low, high] are clamped into the edge bins, so quantiles
+    are accurate to one bin width.
+    """
+    def __init__(self, length, low, high, bins=200):
+        self.count = np.zeros(length, dtype=np.int64)
+        self.mean = np.zeros(length)
+        self.m2 = np.zeros(length)
+        self.low = float(low)
+        self.high = float(high)
+        self.bins = bins
+        self.hist = np.zeros((length, bins), dtype=np.int64)
+
+    def add(self, values, mask=None):
+        """Fold one trajectory in; mask selects the generations that count"""
+        values = np.asarray(values, dtype=np.float64)
+        if mask is None:
+            mask = np.ones(values.size, dtype=bool)
+        idx = np.flatnonzero(mask)
+        x = values[idx]
+
+        # Welford update, one generation per element
+        self.count[idx] += 1
+        delta = x - self.mean[idx]
+        self.mean[idx] += delta / self.count[idx]
+        self.m2[idx] += delta * (x - self.mean[idx])
+
+        width = (self.high - self.low) / self.bins
+        b = np.clip(((x - self.low) / width).astype(np.int64), 0, self.bins - 1)
+        self.hist[idx, b] += 1
+
+    def variance(self):
+        """Sample variance per generation (NaN with fewer than two values)"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    def quantile(self, q):
+        """Per-generation quantile, interpolated within histogram bins"""
+        width = (self.high - self.low) / self.bins
+        cum = np.cumsum(self.hist, axis=1)
+        target = q * self.count
+        result = np.full(self.count.size, np.nan)
+        rows = np.flatnonzero(self.count > 0)
+        b = np.argmax(cum[rows] >= target[rows, None], axis=1)
+        below = np.where(b > 0, cum[rows, b - 1], 0)
+        in_bin = self.hist[rows, b]
+        frac = np.where(in_bin > 0, (target[rows] - below) / np.maximum(in_bin, 1), 0.5)
+        result[rows] = self.low + (b + np.clip(frac, 0, 1)) * width
+        return result
+
+
+class EnsembleStats:
+    """Streaming aggregate of replicate trajectories for one parameter set"""
+    def __init__(self, generations, population_max, bins=200, seed=None):
+        length = generations + 1  # generation 0 included
+        self.seed = seed  # entropy of the ensemble's root SeedSequence
+        self.replicates = 0
+        self.population = RunningStats(length, 0, population_max, bins)
+        self.resistance = RunningStats(length, 0, 1, bins)
+        self.extinct = np.zeros(length, dtype=np.int64)
+
+    def add(self, population, resistance):
+        """Fold in one replicate's padded population and resistance trajectories"""
+        population = np.asarray(population)
+        alive = population > 0
+        self.replicates += 1
+        self.population.add(population)
+        # Mean resistance is only defined while the replicate is alive
+        self.resistance.add(resistance, alive)
+        self.extinct += ~alive
+
+    def extinction_probability(self):
+        return self.extinct / max(self.replicates, 1)
+
+    def result(self):
+        """Per-generation summary arrays for plotting or export"""
+        return {
+            "replicates": self.replicates,
+            "seed": self.seed,
+            "population_mean": self.population.mean.copy(),
+            "population_var": self.population.variance(),
+            "population_quantiles": {q: self.population.quantile(q) for q in QUANTILES},
+            "resistance_mean": np.where(self.resistance.count > 0, self.resistance.mean, np.nan),
+            "resistance_var": self.resistance.variance(),
+            "resistance_quantiles": {q: self.resistance.quantile(q) for q in QUANTILES},
+            "extinction_probability": self.extinction_probability(),
+        }
+
+
+def run_replicate(task):
+    """Run one replicate and return trajectories padded to max_generations"""
+    params, population_mode, seed = task
+    engine = SimulationEngine(seed=seed, population_mode=population_mode, **params)
+    engine.run()
+    history = engine.get_history()
+
+    length = engine.max_generations + 1
+    population = np.zeros(length, dtype=np.int64)
+    resistance = np.zeros(length)
+    population[:history["population"].size] = history["population"]
+    resistance[:history["avg_resistance"].size] = history["avg_resistance"]
+    return population, resistance
+
+
+def run_replicate_batch(task):
+    """Run a batch of agent-mode replicates together; returns padded (population, resistance) rows"""
+    params, replicates, seed = task
+    engine = BatchedEngine(replicates, seed=seed, **params)
+    engine.run()
+    history = engine.get_history()
+
+    length = engine.max_generations + 1
+    population = np.zeros((replicates, length), dtype=np.int64)
+    resistance = np.zeros((replicates, length))
+    population[:, :history["population"].shape[0]] = history["population"].T
+    resistance[:, :history["avg_resistance"].shape[0]] = history["avg_resistance"].T
+    return population, resistance
+
+
+def batch_sizes(params, replicates):
+    """Replicates per batched task, depending only on the parameters (not on processes)"""
+    cells = max(int(params["population_size"]), int(params["carrying_capacity"]), 1)
+    per_batch = max(1, BATCH_CELLS // cells)
+    return [min(per_batch, replicates - start) for start in range(0, replicates, per_batch)]
+
+
+def run_ensemble(params, replicates, population_mode="agents", processes=None,
+                 on_progress=None, should_stop=None, seed=None, batched=True):
+    """Run replicates across a process pool and aggregate them as they finish
+
+    params must include a positive max_generations. on_progress(done, total)
+    is called after each replicate; should_stop() is polled so a caller can
+    abandon the ensemble early. Each replicate, or each batch of agent-mode
+    replicates when batched is true, gets a child of seed (int, SeedSequence
+    or None for fresh entropy). Returns an EnsembleStats.
+    """
+    root = seed_sequence(seed)
+    params = dict(DEFAULT_PARAMETERS, **params)
+    generations = int(params["max_generations"])
+    if generations <= 0:
+        raise ValueError("Ensembles need a positive max_generations")
+
+    population_max = max(int(params["population_size"]), int(params["carrying_capacity"]))
+    stats = EnsembleStats(generations, population_max, seed=root.entropy)
+
+    if batched and population_mode == "agents":
+        sizes = batch_sizes(params, replicates)
+        tasks = [(params, size, child) for size, child in zip(sizes, root.spawn(len(sizes)))]
+        function, chunksize = run_replicate_batch, 1
+    else:
+        tasks = [(params, population_mode, child) for child in root.spawn(replicates)]
+        function = run_replicate
+        chunksize = max(1, replicates // (8 * (processes or multiprocessing.cpu_count())))
+    # Spawned, not forked: the GUI runs ensembles after pygame has taken over SIGTERM,
+    # and forked workers would inherit that handler and never exit on terminate()
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        for population, resistance in pool.imap_unordered(function, tasks, chunksize):
+            if function is run_replicate:
+                population, resistance = [population], [resistance]
+            for row in zip(population, resistance):
+                stats.add(*row)
+                if on_progress is not None:
+                    on_progress(stats.replicates, replicates)
+            if should_stop is not None and should_stop():
+                pool.terminate()
+                break
+    return stats
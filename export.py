@@ -0,0 +1,331 @@
+"""Offline frame and video export rendered across a process pool
+
+Exporting has two steps. "record" runs a scenario headlessly and keeps,
+for every exported frame, exactly what the GUI would draw: the sampled
+resistance values for the scatter or grid view, the distribution
+histogram and the antibiotic concentration, plus the full per-generation
+history for the charts. "render" draws those frames off-screen with the
+GUI's PopulationRenderer and ResistanceCharts (on an Agg canvas), spread
+over worker processes, and writes a PNG sequence or, with ffmpeg on the
+PATH, an MP4. Export speed therefore scales with cores and does not depend
+on how fast the live GUI runs.
+
+Chart ranges are pinned to the whole recording and scatter placement is
+seeded per generation, so every frame is the same however the work is split.
+
+Example:
+    python export.py record scenarios.toml run.npz --every 2
+    python export.py render run.npz run.mp4 --fps 30
+    python export.py render run.npz frames/
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from batch import build_engine, load_scenarios
+from history_store import MemoryHistory
+from theme import COLORS, hex_to_rgb
+
+SURFACE_SIZE = (600, 400)  # the GUI's pygame view
+FIGURE_SIZE = (12, 6)  # inches at FIGURE_DPI, as in the GUI
+FIGURE_DPI = 100
+HISTOGRAM_BINS = 30
+CHART_POINTS = 2000
+
+VIEWS = ("scatter", "grid")
+
+# Bumped whenever the recording layout changes
+RECORDING_VERSION = 1
+
+
+def record_run(engine, every=1, view="scatter", generations=None, sample_seed=0):
+    """Run the engine and collect the data of every exported frame
+
+    A frame is kept for the starting state, every every-th generation and
+    the last generation. Stops after generations steps (default: at
+    max_generations) or on extinction. Returns the recording as a dict of
+    arrays plus a "metadata" dict.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from renderer import PopulationRenderer
+
+    if view not in VIEWS:
+        raise ValueError(f"Unknown view: {view}")
+    if generations is None:
+        if engine.max_generations <= 0:
+            raise ValueError("record_run() needs generations when max_generations is unlimited")
+        generations = max(0, engine.max_generations - engine.generation)
+
+    # Only the thresholds are used here; nothing is drawn
+    renderer = PopulationRenderer(SURFACE_SIZE)
+    engine.sample_rng = np.random.default_rng(sample_seed)
+
+    frames = {"generation": [], "population_count": [], "mean_resistance": [],
+              "concentration": [], "histogram": []}
+    values = []
+
+    def capture():
+        count = engine.population_count()
+        if view == "scatter":
+            if count > renderer.lod_threshold:
+                sample = engine.stratified_values(renderer.lod_threshold)
+            else:
+                sample = engine.resistance_values(count)
+        else:
+            sample = engine.resistance_values(renderer.grid_cells(count))
+        counts, _ = engine.histogram(bins=HISTOGRAM_BINS)
+        frames["generation"].append(engine.generation)
+        frames["population_count"].append(count)
+        frames["mean_resistance"].append(engine.average_resistance() if count else np.nan)
+        frames["concentration"].append(engine.antibiotic_concentration)
+        frames["histogram"].append(counts)
+        values.append(np.asarray(sample, dtype=np.float64))
+
+    capture()
+    for step in range(1, generations + 1):
+        if engine.is_extinct():
+            break
+        engine.step()
+        if step % every == 0 or step == generations or engine.is_extinct():
+            capture()
+
+    history = engine.get_history()
+    return {
+        "metadata": {"view": view, "every": every, "parameters": engine.get_parameters(),
+                     "population_mode": engine.population.mode},
+        "generation": np.array(frames["generation"], dtype=np.int64),
+        "population_count": np.array(frames["population_count"], dtype=np.int64),
+        "mean_resistance": np.array(frames["mean_resistance"], dtype=np.float64),
+        "concentration": np.array(frames["concentration"], dtype=np.float64),
+        "histogram": np.array(frames["histogram"], dtype=np.float64),
+        "value_offsets": np.cumsum([0] + [v.size for v in values]).astype(np.int64),
+        "values": np.concatenate(values),
+        "population_history": history["population"],
+        "avg_resistance_history": history["avg_resistance"],
+    }
+
+
+def save_recording(recording, path):
+    """Write a recording as one .npz file, atomically"""
+    arrays = dict(recording)
+    metadata = dict(arrays.pop("metadata"), version=RECORDING_VERSION)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, metadata=np.array(json.dumps(metadata)), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_recording(path):
+    with np.load(path, allow_pickle=False) as data:
+        recording = {name: data[name] for name in data.files}
+    recording["metadata"] = json.loads(str(recording["metadata"]))
+    if recording["metadata"].get("version") != RECORDING_VERSION:
+        raise ValueError(f"{path}: unsupported recording version")
+    return recording
+
+
+class FrameRenderer:
+    """Draws frames of a recording: the population view, a stats panel and the charts"""
+    def __init__(self, recording):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import pygame
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        from charts import ResistanceCharts
+        from renderer import PopulationRenderer
+
+        self.recording = recording
+        self.view = recording["metadata"]["view"]
+        self.history = MemoryHistory()
+        self.history.extend(recording["population_history"], recording["avg_resistance_history"])
+
+        self.renderer = PopulationRenderer(SURFACE_SIZE)
+        self.panel = pygame.Surface(SURFACE_SIZE)
+
+        fig = Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI, facecolor=COLORS["background"])
+        self.canvas = FigureCanvasAgg(fig)
+        self.charts = ResistanceCharts(fig, histogram_bins=HISTOGRAM_BINS)
+        population = recording["population_history"]
+        self.charts.fix_limits(recording["generation"][-1],
+                               population.max() if population.size else 0,
+                               recording["histogram"].max())
+
+        chart_width, chart_height = self.canvas.get_width_height()
+        self.size = (max(chart_width, SURFACE_SIZE[0] * 2), SURFACE_SIZE[1] + chart_height)
+
+    def __len__(self):
+        return len(self.recording["generation"])
+
+    def _draw_panel(self, index):
+        recording = self.recording
+        self.panel.fill(hex_to_rgb(COLORS["background"]))
+        count = int(recording["population_count"][index])
+        mean = recording["mean_resistance"][index]
+        lines = [
+            ("Generation", f"{int(recording['generation'][index]):,}"),
+            ("Population Size", f"{count:,}"),
+            ("Average Resistance", f"{mean:.3f}" if count else "N/A (Extinct)"),
+            ("Antibiotic Concentration", f"{recording['concentration'][index]:.2f}"),
+        ]
+        y = 40
+        for label, value in lines:
+            self.panel.blit(self.renderer.font(16).render(label, True, hex_to_rgb(COLORS["text_light"])),
+                            (40, y))
+            self.panel.blit(self.renderer.font(28).render(value, True, hex_to_rgb(COLORS["primary"])),
+                            (40, y + 22))
+            y += 80
+
+    def render(self, index):
+        """PIL image of frame index"""
+        import pygame
+        from PIL import Image
+
+        recording = self.recording
+        generation = int(recording["generation"][index])
+        start, stop = recording["value_offsets"][index:index + 2]
+        concentration = float(recording["concentration"][index])
+
+        # Scatter placement depends only on the generation, not on which worker draws it
+        self.renderer.rng = np.random.default_rng(generation)
+        surface = self.renderer.render(recording["values"][start:stop], concentration,
+                                       self.view, int(recording["population_count"][index]))
+        self._draw_panel(index)
+
+        generations, population = self.history.downsample("population", CHART_POINTS, generation + 1)
+        _, resistance = self.history.downsample("avg_resistance", CHART_POINTS, generation + 1)
+        self.charts.update(population, resistance, recording["histogram"][index],
+                           concentration, generations)
+        self.charts.draw(self.canvas)
+
+        image = Image.new("RGB", self.size, hex_to_rgb(COLORS["background"]))
+        image.paste(Image.frombytes("RGB", SURFACE_SIZE, pygame.image.tostring(surface, "RGB")), (0, 0))
+        image.paste(Image.frombytes("RGB", SURFACE_SIZE, pygame.image.tostring(self.panel, "RGB")),
+                    (SURFACE_SIZE[0], 0))
+        chart = Image.frombuffer("RGBA", self.canvas.get_width_height(), self.canvas.buffer_rgba())
+        image.paste(chart.convert("RGB"), (0, SURFACE_SIZE[1]))
+        return image
+
+
+# Per-process state of the render pool
+_worker = None
+
+
+def _init_worker(recording_path):
+    global _worker
+    _worker = FrameRenderer(load_recording(recording_path))
+
+
+def _render_chunk(task):
+    start, stop, directory = task
+    for index in range(start, stop):
+        _worker.render(index).save(os.path.join(directory, f"frame_{index:06d}.png"), compress_level=1)
+    return stop - start
+
+
+def render_frames(recording_path, directory, processes=None, on_progress=None):
+    """Render every frame of a saved recording into directory as PNGs
+
+    on_progress(done, total) is called as chunks of frames finish. Returns
+    the number of frames written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with np.load(recording_path, allow_pickle=False) as data:
+        total = len(data["generation"])
+    processes = processes or os.cpu_count() or 1
+    # Several chunks per process keep the pool busy to the end
+    chunk = max(1, -(-total // (processes * 4)))
+    tasks = [(start, min(start + chunk, total), directory) for start in range(0, total, chunk)]
+
+    done = 0
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(recording_path,)) as pool:
+        for count in pool.imap_unordered(_render_chunk, tasks):
+            done += count
+            if on_progress is not None:
+                on_progress(done, total)
+    return total
+
+
+def encode_video(directory, output_path, fps=30):
+    """Encode a frame_%06d.png sequence to a video file with ffmpeg"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg was not found on the PATH; export a PNG sequence instead")
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps),
+                    "-i", os.path.join(directory, "frame_%06d.png"),
+                    "-c:v", "libx264", "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                    output_path], check=True)
+
+
+def export(recording_path, output, fps=30, processes=None, on_progress=None):
+    """Render a recording to a PNG sequence (output is a directory) or a video file"""
+    if os.path.splitext(output)[1].lower() not in (".mp4", ".mkv", ".mov"):
+        return render_frames(recording_path, output, processes, on_progress)
+    with tempfile.TemporaryDirectory(prefix="simulasi-frames-") as directory:
+        total = render_frames(recording_path, directory, processes, on_progress)
+        encode_video(directory, output, fps)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record a run and export it as frames or video")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="run a scenario and save its frame data")
+    record_parser.add_argument("scenarios", help="scenario file (.json or .toml), as for batch.py")
+    record_parser.add_argument("output", help="recording file (.npz)")
+    record_parser.add_argument("--scenario", default=None, help="scenario name (default: the first)")
+    record_parser.add_argument("--every", type=int, default=1, help="generations between frames")
+    record_parser.add_argument("--view", choices=VIEWS, default="scatter")
+
+    render_parser = commands.add_parser("render", help="render a recording to PNGs or a video")
+    render_parser.add_argument("recording")
+    render_parser.add_argument("output", help="directory for a PNG sequence, or a .mp4/.mkv/.mov file")
+    render_parser.add_argument("--fps", type=int, default=30)
+    render_parser.add_argument("--processes", type=int, default=None,
+                               help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        if args.every < 1:
+            parser.error("--every must be at least 1")
+        try:
+            scenarios, _ = load_scenarios(args.scenarios)
+            if args.scenario is not None:
+                scenarios = [s for s in scenarios if s["name"] == args.scenario]
+                if not scenarios:
+                    raise ValueError(f"no scenario named {args.scenario!r}")
+            engine = build_engine(scenarios[0])
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        recording = record_run(engine, args.every, args.view)
+        save_recording(recording, args.output)
+        print(f"Recorded {len(recording['generation'])} frames over {engine.generation} generations "
+              f"to {args.output}")
+        return 0
+
+    def report(done, total):
+        print(f"\r{done}/{total} frames", end="", flush=True)
+
+    start = time.perf_counter()
+    try:
+        total = export(args.recording, args.output, args.fps, args.processes, report)
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        print()
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - start
+    print(f"\nExported {total} frames to {args.output} in {elapsed:.1f} s ({total / elapsed:.1f} frames/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Font file discovery with a persistent cache
+
+Finding a font on Linux means walking every directory under the system
+font roots, which can take a noticeable part of startup. The results are
+kept in a small JSON cache under the user's cache directory, together
+with the modification time of every directory that was searched. Adding
+or removing a font changes the mtime of the directory holding it, so a
+cached result is reused only while all recorded mtimes still match.
+"""
+import json
+import os
+import platform
+
+CACHE_PATH = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                          "simulasi-resistensi-bakteri", "fonts.json")
+
+CACHE_VERSION = 1
+
+
+def font_dirs(system=None):
+    """(directories, recursive) searched for fonts on this platform"""
+    system = system or platform.system()
+    if system == "Windows":
+        return [r"C:\Windows\Fonts"], False
+    if system == "Darwin":  # macOS
+        return ["/Library/Fonts", "/System/Library/Fonts", os.path.expanduser("~/Library/Fonts")], False
+    if system == "Linux":
+        return ["/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts")], True
+    return [], False
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _scan(filename, roots, recursive):
+    """(paths of filename, {searched directory: mtime_ns})"""
+    paths = []
+    searched = {}
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        if not recursive:
+            searched[root] = _mtime(root)
+            if os.path.exists(os.path.join(root, filename)):
+                paths.append(os.path.join(root, filename))
+            continue
+        for directory, _, files in os.walk(root):
+            searched[directory] = _mtime(directory)
+            if filename in files:
+                paths.append(os.path.join(directory, filename))
+    return paths, searched
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("fonts", {})
+
+
+def _save_cache(cache_path, fonts):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CACHE_VERSION, "fonts": fonts}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # a read-only cache directory only costs a rescan next time
+
+
+def find_font(filename, roots=None, recursive=None, cache_path=CACHE_PATH):
+    """Paths of every font file called filename under the font directories
+
+    Reuses the cached result while the searched directories are unchanged
+    and no missing root has appeared; otherwise rescans and updates the cache.
+    Pass cache_path=None to always scan.
+    """
+    if roots is None:
+        roots, default_recursive = font_dirs()
+        recursive = default_recursive if recursive is None else recursive
+    roots = list(roots)
+    recursive = bool(recursive)
+    key = json.dumps([filename, roots, recursive])
+
+    fonts = _load_cache(cache_path) if cache_path else {}
+    entry = fonts.get(key)
+    if entry is not None:
+        searched = entry["searched"]
+        unchanged = all(_mtime(directory) == mtime for directory, mtime in searched.items())
+        appeared = any(root not in searched and os.path.isdir(root) for root in roots)
+        if unchanged and not appeared:
+            return list(entry["paths"])
+
+    paths, searched = _scan(filename, roots, recursive)
+    if cache_path:
+        fonts[key] = {"paths": paths, "searched": searched}
+        _save_cache(cache_path, fonts)
+    return paths
@@ -0,0 +1,297 @@
+"""Per-generation history: in memory, or as an append-only on-disk store
+
+Both classes record the population size and mean resistance of every
+generation and share one read interface, so the engine, charts and
+exports do not care where the history lives.
+
+MemoryHistory keeps growable NumPy arrays and is the default for short
+scripted runs. HistoryStore streams the same columns into fixed-size
+.npy chunks in a directory and opens them as memory maps, so RAM use stays
+constant however many generations are recorded. It can also keep
+down-sampled resistance distributions every few generations. Readers only
+see rows up to the committed length, and a store reopened after a crash
+continues from the length recorded in its metadata.
+"""
+import json
+import os
+
+import numpy as np
+
+# Columns recorded for every generation
+COLUMNS = {
+    "population": np.int64,
+    "avg_resistance": np.float64,
+}
+
+DEFAULT_CHUNK_SIZE = 65536  # generations per chunk file
+DEFAULT_SNAPSHOT_BINS = 64
+SNAPSHOT_CHUNK_SIZE = 1024  # distribution snapshots per chunk file
+
+# The store's metadata (committed length) is rewritten at least this often
+FLUSH_EVERY = 4096
+
+# Read-only chunk maps kept open at once
+_MAX_OPEN_CHUNKS = 64
+
+
+def _stride(length, max_points):
+    """Row stride that keeps a read of length rows to about max_points"""
+    if length <= max_points:
+        return 1
+    return -(-length // max(1, max_points - 1))  # ceiling division
+
+
+class MemoryHistory:
+    """History held in growable in-memory arrays"""
+    snapshot_every = 0
+    snapshot_bins = DEFAULT_SNAPSHOT_BINS
+
+    def __init__(self):
+        self._columns = {name: np.zeros(1024, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _reserve(self, rows):
+        size = self._columns["population"].size
+        if self.length + rows <= size:
+            return
+        while self.length + rows > size:
+            size *= 2
+        for name, column in self._columns.items():
+            grown = np.zeros(size, dtype=column.dtype)
+            grown[:self.length] = column[:self.length]
+            self._columns[name] = grown
+
+    def append(self, population, avg_resistance):
+        self._reserve(1)
+        self._columns["population"][self.length] = population
+        self._columns["avg_resistance"][self.length] = avg_resistance
+        self.length += 1
+
+    def extend(self, population, avg_resistance):
+        """Append many generations at once"""
+        rows = len(population)
+        self._reserve(rows)
+        self._columns["population"][self.length:self.length + rows] = population
+        self._columns["avg_resistance"][self.length:self.length + rows] = avg_resistance
+        self.length += rows
+
+    def add_distribution(self, generation, counts):
+        pass  # distribution snapshots are only kept by HistoryStore
+
+    def read(self, column, start=0, stop=None, step=1):
+        """Copy of rows [start:stop:step] of a column"""
+        stop = self.length if stop is None else min(stop, self.length)
+        return self._columns[column][start:stop:step].copy()
+
+    def read_distributions(self, start=0, stop=None):
+        return np.zeros(0, dtype=np.int64), np.zeros((0, self.snapshot_bins), dtype=np.int64)
+
+    def downsample(self, column, max_points, stop=None):
+        """(generations, values) with at most about max_points evenly spaced rows"""
+        return _downsample(self, column, max_points, stop)
+
+    def clear(self):
+        self.length = 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _ChunkedColumn:
+    """One column stored as fixed-size .npy chunks, written through a memory map"""
+    def __init__(self, directory, name, dtype, chunk_rows, row_shape=()):
+        self.directory = directory
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.chunk_rows = chunk_rows
+        self.row_shape = tuple(row_shape)
+        self._writer_index = None
+        self._writer = None
+        self._readers = {}
+
+    def path(self, index):
+        return os.path.join(self.directory, f"{self.name}_{index:06d}.npy")
+
+    def _open_writer(self, index):
+        if index == self._writer_index:
+            return self._writer
+        self.flush()
+        path = self.path(index)
+        if os.path.exists(path):
+            self._writer = np.load(path, mmap_mode="r+")
+        else:
+            self._writer = np.lib.format.open_memmap(
+                path, mode="w+", dtype=self.dtype, shape=(self.chunk_rows,) + self.row_shape)
+        self._writer_index = index
+        return self._writer
+
+    def write(self, row, value):
+        index, offset = divmod(row, self.chunk_rows)
+        self._open_writer(index)[offset] = value
+
+    def write_block(self, start, values):
+        """Write consecutive rows from start on, chunk by chunk"""
+        done = 0
+        while done < len(values):
+            index, offset = divmod(start + done, self.chunk_rows)
+            count = min(self.chunk_rows - offset, len(values) - done)
+            self._open_writer(index)[offset:offset + count] = values[done:done + count]
+            done += count
+
+    def read(self, start, stop, step=1):
+        """Rows [start:stop:step], gathered chunk by chunk from read-only maps"""
+        parts = []
+        row = start
+        while row < stop:
+            index, offset = divmod(row, self.chunk_rows)
+            chunk_stop = min(stop - index * self.chunk_rows, self.chunk_rows)
+            parts.append(np.array(self._reader(index)[offset:chunk_stop:step]))
+            # First row of the next chunk that lies on the stride
+            row += -(-(chunk_stop - offset) // step) * step
+        if not parts:
+            return np.zeros((0,) + self.row_shape, dtype=self.dtype)
+        return np.concatenate(parts)
+
+    def _reader(self, index):
+        if index not in self._readers:
+            if len(self._readers) >= _MAX_OPEN_CHUNKS:
+                self._readers.clear()
+            self._readers[index] = np.load(self.path(index), mmap_mode="r")
+        return self._readers[index]
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        self.flush()
+        self._writer = None
+        self._writer_index = None
+        self._readers.clear()
+
+
+class HistoryStore:
+    """Append-only, chunked, columnar history on disk
+
+    Opening an existing directory continues that store. snapshot_every > 0
+    also records a snapshot_bins-bin resistance histogram every
+    snapshot_every generations.
+    """
+    def __init__(self, directory, chunk_size=DEFAULT_CHUNK_SIZE, snapshot_every=0,
+                 snapshot_bins=DEFAULT_SNAPSHOT_BINS):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            chunk_size = meta["chunk_size"]
+            snapshot_every = meta["snapshot_every"]
+            snapshot_bins = meta["snapshot_bins"]
+            self.length = meta["length"]
+            self.snapshot_length = meta["snapshot_length"]
+        else:
+            self.length = 0
+            self.snapshot_length = 0
+        self.chunk_size = int(chunk_size)
+        self.snapshot_every = int(snapshot_every)
+        self.snapshot_bins = int(snapshot_bins)
+
+        self._columns = {name: _ChunkedColumn(directory, name, dtype, self.chunk_size)
+                         for name, dtype in COLUMNS.items()}
+        self._snapshot_generations = _ChunkedColumn(
+            directory, "snapshot_generation", np.int64, SNAPSHOT_CHUNK_SIZE)
+        self._snapshot_counts = _ChunkedColumn(
+            directory, "snapshot_counts", np.int64, SNAPSHOT_CHUNK_SIZE, (self.snapshot_bins,))
+        self._unflushed = 0
+        self.flush()
+
+    def __len__(self):
+        return self.length
+
+    def append(self, population, avg_resistance):
+        self._columns["population"].write(self.length, population)
+        self._columns["avg_resistance"].write(self.length, avg_resistance)
+        self.length += 1
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def extend(self, population, avg_resistance):
+        """Append many generations at once"""
+        population = np.asarray(population, dtype=np.int64)
+        avg_resistance = np.asarray(avg_resistance, dtype=np.float64)
+        self._columns["population"].write_block(self.length, population)
+        self._columns["avg_resistance"].write_block(self.length, avg_resistance)
+        self.length += population.size
+        self.flush()
+
+    def add_distribution(self, generation, counts):
+        """Record a snapshot_bins-bin resistance histogram for a generation"""
+        self._snapshot_generations.write(self.snapshot_length, generation)
+        self._snapshot_counts.write(self.snapshot_length, counts)
+        self.snapshot_length += 1
+
+    def read(self, column, start=0, stop=None, step=1):
+        """Rows [start:stop:step] of a column, read lazily from the chunk files"""
+        stop = self.length if stop is None else min(stop, self.length)
+        return self._columns[column].read(start, stop, step)
+
+    def read_distributions(self, start=0, stop=None):
+        """(generations, counts) of the distribution snapshots in [start, stop)"""
+        stop = self.snapshot_length if stop is None else min(stop, self.snapshot_length)
+        return (self._snapshot_generations.read(start, stop),
+                self._snapshot_counts.read(start, stop))
+
+    def downsample(self, column, max_points, stop=None):
+        """(generations, values) with at most about max_points evenly spaced rows"""
+        return _downsample(self, column, max_points, stop)
+
+    def clear(self):
+        self.length = 0
+        self.snapshot_length = 0
+        self.flush()
+
+    def flush(self):
+        """Write pending rows and commit the current length"""
+        for column in self._columns.values():
+            column.flush()
+        self._snapshot_generations.flush()
+        self._snapshot_counts.flush()
+        meta = {
+            "chunk_size": self.chunk_size,
+            "snapshot_every": self.snapshot_every,
+            "snapshot_bins": self.snapshot_bins,
+            "length": self.length,
+            "snapshot_length": self.snapshot_length,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        self._unflushed = 0
+
+    def close(self):
+        self.flush()
+        for column in self._columns.values():
+            column.close()
+        self._snapshot_generations.close()
+        self._snapshot_counts.close()
+
+
+def _downsample(history, column, max_points, stop=None):
+    length = len(history) if stop is None else min(stop, len(history))
+    step = _stride(length, max_points)
+    x = np.arange(0, length, step)
+    values = history.read(column, 0, length, step)
+    if length and x[-1] != length - 1:
+        # Always end on the newest generation
+        x = np.append(x, length - 1)
+        values = np.append(values, history.read(column, length - 1, length))
+    return x, values
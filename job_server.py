@@ -0,0 +1,430 @@
+"""Local HTTP/JSON job queue for simulation runs
+
+People sharing one machine can send their runs to a single service instead
+of each running simulations side by side. The server listens on localhost
+only, queues jobs and runs them on a fixed number of worker processes, so
+the cores are shared instead of oversubscribed.
+
+A job body is a scenario document in the batch.py format: model parameters
+plus optional name, population_mode, num_bins, seed and backend. A document
+with a "scenario" list queues one job per entry, seeded exactly as batch.py
+would run them. Set "history": true to get every generation's population
+and mean resistance in the results. Finished runs go through the run cache
+(see run_cache.py).
+
+    POST /jobs               queue the scenario document in the body
+    GET  /jobs               status and progress of every job
+    GET  /jobs/<id>          one job, with its results once done
+    POST /jobs/<id>/cancel   cancel a queued or running job
+
+A job is queued, running, done, failed or cancelled. A running job's
+progress is its current generation; a cancelled run stops after the
+generation in progress.
+
+Example:
+    python job_server.py serve --workers 8
+    python job_server.py submit scenarios.toml --wait --output results.json
+"""
+import argparse
+import collections
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from batch import json_default, parse_scenarios, read_scenario_file, run_scenario, write_results
+from engine import DEFAULT_PARAMETERS
+from run_cache import CACHE_DIR, RunCache
+
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://127.0.0.1:{DEFAULT_PORT}"
+
+# Seconds between status requests while a client waits for its jobs
+POLL_INTERVAL = 0.5
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker to stop a run cancelled from the server"""
+
+
+# Worker-side views of the queue's shared progress and cancel arrays, one slot per worker
+_progress = None
+_cancel = None
+
+
+def _init_worker(progress, cancel):
+    global _progress, _cancel
+    _progress, _cancel = progress, cancel
+
+
+def _run_job(scenario, slot, history, cache, telemetry):
+    def on_generation(generation):
+        _progress[slot] = generation
+        if _cancel[slot]:
+            raise JobCancelled()
+
+    return run_scenario(scenario, history, cache, on_generation, telemetry)
+
+
+class Job:
+    """One queued scenario and what became of it"""
+    def __init__(self, job_id, scenario, history):
+        self.id = job_id
+        self.scenario = scenario
+        self.history = history
+        self.state = "queued"
+        self.slot = None  # worker slot while running
+        self.executor = None  # the pool the job was submitted to
+        self.generation = 0
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+
+class JobQueue:
+    """Jobs waiting for, or running on, a bounded pool of worker processes
+
+    Every running job holds one of the workers' slots in two shared arrays:
+    the worker writes its current generation into one and polls a cancel
+    flag in the other, so status requests never wait on a worker.
+    """
+    def __init__(self, workers=None, cache=None, telemetry=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        self.telemetry = telemetry  # HOST:PORT the runs publish their metrics to
+        # Spawned, not forked: the server forks from request threads otherwise
+        self.context = multiprocessing.get_context("spawn")
+        self.progress = self.context.RawArray("q", self.workers)
+        self.cancel_flags = self.context.RawArray("b", self.workers)
+        self.executor = self._new_executor()
+        self.lock = threading.RLock()
+        self.jobs = {}
+        self.pending = collections.deque()
+        self.free_slots = list(range(self.workers - 1, -1, -1))
+        self.next_id = 1
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(self.workers, mp_context=self.context, initializer=_init_worker,
+                                   initargs=(self.progress, self.cancel_flags))
+
+    def _replace_executor(self, broken):
+        """Swap in a new pool for a broken one, unless that already happened (lock held)
+
+        When a worker dies, every job running on its pool fails; only the
+        first of them may replace the pool, or later ones would shut down
+        the replacement the others' successors already run on.
+        """
+        if broken is self.executor:
+            broken.shutdown(wait=False)
+            self.executor = self._new_executor()
+
+    def submit(self, document, history=False):
+        """Queue one job per scenario in document; returns (jobs, root seed)"""
+        scenarios, root = parse_scenarios(document, "job")
+        for scenario in scenarios:
+            if int(scenario.get("max_generations", DEFAULT_PARAMETERS["max_generations"])) <= 0:
+                raise ValueError(f"{scenario['name']}: max_generations must be positive for a job")
+        with self.lock:
+            jobs = []
+            for scenario in scenarios:
+                job = Job(str(self.next_id), scenario, history)
+                self.next_id += 1
+                self.jobs[job.id] = job
+                self.pending.append(job)
+                jobs.append(job)
+            self._dispatch()
+        return jobs, root
+
+    def _dispatch(self):
+        """Start queued jobs while workers are free (lock held)"""
+        while self.pending and self.free_slots:
+            job = self.pending.popleft()
+            job.slot = self.free_slots.pop()
+            self.progress[job.slot] = 0
+            self.cancel_flags[job.slot] = 0
+            job.state = "running"
+            job.started = time.time()
+            args = (_run_job, job.scenario, job.slot, job.history, self.cache, self.telemetry)
+            job.executor = self.executor
+            try:
+                future = job.executor.submit(*args)
+            except BrokenProcessPool:
+                # Broken before any of its jobs reported it
+                self._replace_executor(job.executor)
+                job.executor = self.executor
+                future = job.executor.submit(*args)
+            future.add_done_callback(functools.partial(self._finished, job))
+
+    def _finished(self, job, future):
+        with self.lock:
+            job.generation = self.progress[job.slot]
+            self.free_slots.append(job.slot)
+            job.slot = None
+            job.finished = time.time()
+            error = future.exception()
+            if error is None:
+                job.state = "done"
+                job.result = future.result()
+                job.generation = job.result["summary"]["generations"]
+            elif isinstance(error, JobCancelled):
+                job.state = "cancelled"
+            else:
+                job.state = "failed"
+                job.error = str(error) or type(error).__name__
+                if isinstance(error, BrokenProcessPool):
+                    self._replace_executor(job.executor)
+            job.executor = None
+            self._dispatch()
+
+    def cancel(self, job_id):
+        """Cancel a queued job now, or ask a running one to stop; returns its status"""
+        with self.lock:
+            job = self.jobs[job_id]
+            if job.state == "queued":
+                self.pending.remove(job)
+                job.state = "cancelled"
+                job.finished = time.time()
+            elif job.state == "running":
+                self.cancel_flags[job.slot] = 1
+            return self.describe(job)
+
+    def status(self, job_id, with_result=True):
+        with self.lock:
+            return self.describe(self.jobs[job_id], with_result)
+
+    def list(self):
+        with self.lock:
+            return [self.describe(job) for job in self.jobs.values()]
+
+    def describe(self, job, with_result=False):
+        """JSON-ready status of a job (lock held)"""
+        scenario = job.scenario
+        status = {
+            "id": job.id,
+            "name": scenario["name"],
+            "state": job.state,
+            "generation": self.progress[job.slot] if job.state == "running" else job.generation,
+            "max_generations": int(scenario.get("max_generations",
+                                                DEFAULT_PARAMETERS["max_generations"])),
+            "queue_position": (self.pending.index(job) + 1) if job.state == "queued" else None,
+            "submitted": job.submitted,
+            "started": job.started,
+            "finished": job.finished,
+            "error": job.error,
+        }
+        if with_result:
+            status["result"] = job.result
+        return status
+
+    def close(self):
+        """Stop running jobs and the workers"""
+        with self.lock:
+            self.pending.clear()
+            for slot in range(self.workers):
+                self.cancel_flags[slot] = 1
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """JSON API over the server's JobQueue"""
+    server_version = "SimulasiJobs/1"
+
+    def _send(self, status, document):
+        body = json.dumps(document, default=json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _parts(self):
+        return [part for part in urlsplit(self.path).path.split("/") if part]
+
+    def _not_found(self):
+        self._send(404, {"error": f"Not found: {self.path}"})
+
+    def do_GET(self):
+        parts = self._parts()
+        jobs = self.server.jobs
+        if parts == ["jobs"]:
+            self._send(200, {"jobs": jobs.list()})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            try:
+                self._send(200, jobs.status(parts[1]))
+            except KeyError:
+                self._send(404, {"error": f"No such job: {parts[1]}"})
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        parts = self._parts()
+        jobs = self.server.jobs
+        if parts == ["jobs"]:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                document = json.loads(self.rfile.read(length) or b"{}")
+                history = bool(document.pop("history", False)) if isinstance(document, dict) else False
+                submitted, root = jobs.submit(document, history)
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+            with jobs.lock:
+                described = [jobs.describe(job) for job in submitted]
+            self._send(201, {"seed": root.entropy, "jobs": described})
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            try:
+                self._send(200, jobs.cancel(parts[1]))
+            except KeyError:
+                self._send(404, {"error": f"No such job: {parts[1]}"})
+        else:
+            self._not_found()
+
+
+def serve(port=DEFAULT_PORT, workers=None, cache=None, telemetry=None):
+    """Run the job server on localhost until interrupted"""
+    jobs = JobQueue(workers, cache, telemetry)
+    server = ThreadingHTTPServer(("127.0.0.1", port), JobHandler)
+    server.jobs = jobs
+    print(f"Serving jobs on http://127.0.0.1:{server.server_port} with {jobs.workers} workers",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        jobs.close()
+
+
+def request(url, method="GET", document=None):
+    """Send a JSON request to a job server and return the decoded reply"""
+    data = None if document is None else json.dumps(document, default=json_default).encode()
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.load(e).get("error", str(e))
+        except ValueError:
+            message = str(e)
+        raise ValueError(message) from None
+
+
+def format_job(job):
+    line = f"{job['id']:>5}  {job['name']:<24} {job['state']:<10} {job['generation']}/{job['max_generations']}"
+    if job["state"] == "queued":
+        line += f"  (#{job['queue_position']} in queue)"
+    if job["error"]:
+        line += f"  {job['error']}"
+    return line
+
+
+def wait_for(url, jobs):
+    """Poll until every job has finished, printing changes; returns the final statuses"""
+    job_ids = [job["id"] for job in jobs]
+    statuses = {}
+    shown = {job["id"]: (job["state"], job["generation"]) for job in jobs}
+    while len(statuses) < len(job_ids):
+        for job_id in job_ids:
+            if job_id in statuses:
+                continue
+            job = request(f"{url}/jobs/{job_id}")
+            progress = (job["state"], job["generation"])
+            if shown.get(job_id) != progress:
+                shown[job_id] = progress
+                print(format_job(job), flush=True)
+            if job["state"] in FINISHED_STATES:
+                statuses[job_id] = job
+        if len(statuses) < len(job_ids):
+            time.sleep(POLL_INTERVAL)
+    return [statuses[job_id] for job_id in job_ids]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared job queue for simulation runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the job server on localhost")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--workers", type=int, default=None,
+                              help="jobs run at once (default: all cores)")
+    serve_parser.add_argument("--cache-dir", default=CACHE_DIR, help="run cache directory")
+    serve_parser.add_argument("--no-cache", action="store_true",
+                              help="always recompute and leave the run cache untouched")
+    serve_parser.add_argument("--telemetry", metavar="HOST:PORT",
+                              help="publish every job's per-generation metrics to a telemetry collector")
+
+    submit_parser = commands.add_parser("submit", help="queue the scenarios of a scenario file")
+    submit_parser.add_argument("scenarios", help="scenario file (.json or .toml, as for batch.py)")
+    submit_parser.add_argument("--history", action="store_true",
+                               help="include every generation's population and mean resistance")
+    submit_parser.add_argument("--wait", action="store_true", help="wait for the jobs to finish")
+    submit_parser.add_argument("--output", help="with --wait, write the results here (JSON)")
+
+    status_parser = commands.add_parser("status", help="show every job, or one job's results")
+    status_parser.add_argument("job", nargs="?")
+
+    cancel_parser = commands.add_parser("cancel", help="cancel a job")
+    cancel_parser.add_argument("job")
+
+    for command in (submit_parser, status_parser, cancel_parser):
+        command.add_argument("--url", default=DEFAULT_URL, help=f"job server (default {DEFAULT_URL})")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.port, args.workers, None if args.no_cache else RunCache(args.cache_dir),
+              args.telemetry)
+        return 0
+
+    url = args.url.rstrip("/")
+    try:
+        if args.command == "submit":
+            document = read_scenario_file(args.scenarios)
+            if args.history:
+                document["history"] = True
+            reply = request(f"{url}/jobs", "POST", document)
+            print(f"Queued {len(reply['jobs'])} jobs (seed {reply['seed']})", flush=True)
+            for job in reply["jobs"]:
+                print(format_job(job), flush=True)
+            if args.wait:
+                jobs = wait_for(url, reply["jobs"])
+                if args.output:
+                    write_results(args.output, {
+                        "source": os.path.abspath(args.scenarios),
+                        "seed": reply["seed"],
+                        "results": [job["result"] for job in jobs if job["result"] is not None],
+                    })
+                    print(f"Results written to {args.output}")
+                return 0 if all(job["state"] == "done" for job in jobs) else 1
+        elif args.command == "status":
+            if args.job is None:
+                for job in request(f"{url}/jobs")["jobs"]:
+                    print(format_job(job))
+            else:
+                print(json.dumps(request(f"{url}/jobs/{args.job}"), indent=2))
+        else:
+            print(format_job(request(f"{url}/jobs/{args.job}/cancel", "POST")))
+    except (OSError, ValueError) as e:
+        # URLError is an OSError: no server listening
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""Pluggable generation kernels for the agent model
+
+A kernel takes one generation of resistance values to the next (selection,
+reproduction, mutation and the carrying capacity cap) with the signature
+of engine.generation_kernel. Two backends are provided:
+
+    numpy  engine.generation_kernel: vectorized, but it allocates several
+           population-sized temporaries per generation (draws, masks, the
+           repeated offspring array and a full permutation for the cap)
+    numba  one JIT-compiled loop that writes each surviving parent's mutated
+           offspring straight into a reused buffer, then a partial
+           Fisher-Yates shuffle for the cap; the only allocation per
+           generation is the returned array
+
+NumPy is the default everywhere. numba, or "auto" (numba when it is
+installed and NumPy otherwise), is opt-in: the two backends consume random
+numbers differently, so the same seed gives different (but statistically
+equivalent) runs, and a default that depended on what is installed would
+make a seed replay differently from machine to machine. Numba is imported
+and the loops compiled (and cached on disk) on the first call, so choosing
+the backend costs nothing at startup. Check the equivalence with:
+
+    python kernels.py check --replicates 300
+"""
+import argparse
+import importlib.util
+import math
+import sys
+
+import numpy as np
+
+from engine import NULL_TIMER, RandomBlocks, SimulationEngine, generation_kernel
+
+BACKENDS = ("numpy", "numba")
+
+
+def numba_available():
+    return importlib.util.find_spec("numba") is not None
+
+
+def resolve_backend(backend="numpy"):
+    """Name of the backend "auto" (or an explicit choice) stands for"""
+    if backend == "auto":
+        return "numba" if numba_available() else "numpy"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend: {backend}")
+    if backend == "numba" and not numba_available():
+        raise ValueError("The numba kernel backend needs numba installed")
+    return backend
+
+
+def make_kernel(backend="numpy"):
+    """(backend name, kernel) for a backend name or "auto" """
+    backend = resolve_backend(backend)
+    if backend == "numba":
+        return backend, NumbaKernel()
+    return backend, generation_kernel
+
+
+def _expand(parents, concentration, mutation_std, base_offspring, extra_prob, rng, out):
+    """Write the mutated offspring of every surviving parent into out; returns the count"""
+    count = 0
+    for i in range(parents.size):
+        parent = parents[i]
+        if rng.random() < 1.0 - (concentration - parent):
+            offspring = base_offspring
+            if rng.random() < extra_prob:
+                offspring += 1
+            for _ in range(offspring):
+                child = parent + mutation_std * rng.standard_normal()
+                out[count] = min(max(child, 0.0), 1.0)
+                count += 1
+    return count
+
+
+def _subsample(values, count, capacity, rng):
+    """Move a uniform sample of capacity of the first count values to the front
+
+    Partial Fisher-Yates over whichever is smaller: the values kept or the
+    values dropped (which are swapped out to the back). Indices come from
+    rng.random(), which compiles to a much cheaper call than rng.integers();
+    the rounding bias is below count / 2**53.
+    """
+    dropped = count - capacity
+    if capacity <= dropped:
+        for i in range(capacity):
+            j = i + int(rng.random() * (count - i))
+            values[i], values[j] = values[j], values[i]
+    else:
+        for i in range(dropped):
+            last = count - 1 - i
+            j = int(rng.random() * (last + 1))
+            values[j], values[last] = values[last], values[j]
+
+
+_compiled = None
+
+
+def _compile():
+    global _compiled
+    if _compiled is None:
+        import numba
+
+        _compiled = (numba.njit(cache=True)(_expand), numba.njit(cache=True)(_subsample))
+    return _compiled
+
+
+class NumbaKernel:
+    """Fused JIT kernel with a reused offspring buffer (not thread-safe; one per engine)"""
+    def __init__(self):
+        self.buffer = np.empty(0)
+
+    def __call__(self, population, concentration, mutation_std, reproduction_rate, capacity, rng,
+                 timer=NULL_TIMER):
+        expand, subsample = _compile()
+        if isinstance(rng, RandomBlocks):
+            rng = rng.rng  # compiled code draws from the Generator itself
+
+        base_offspring = int(np.floor(reproduction_rate))
+        extra_prob = reproduction_rate - base_offspring
+        bound = population.size * (base_offspring + (extra_prob > 0))
+        if self.buffer.size < bound:
+            self.buffer = np.empty(int(bound * 1.25))
+
+        with timer.phase("fused"):
+            count = expand(np.ascontiguousarray(population, dtype=np.float64), float(concentration),
+                           float(mutation_std), base_offspring, float(extra_prob), rng, self.buffer)
+        with timer.phase("capacity"):
+            if count > capacity:
+                subsample(self.buffer, count, int(capacity), rng)
+                count = int(capacity)
+        return self.buffer[:count].copy()
+
+
+def ks_test(a, b):
+    """Two-sample Kolmogorov-Smirnov statistic and asymptotic p-value"""
+    a = np.sort(np.asarray(a, dtype=np.float64))
+    b = np.sort(np.asarray(b, dtype=np.float64))
+    points = np.concatenate([a, b])
+    d = float(np.max(np.abs(np.searchsorted(a, points, side="right") / a.size
+                            - np.searchsorted(b, points, side="right") / b.size)))
+    n = a.size * b.size / (a.size + b.size)
+    lam = (math.sqrt(n) + 0.12 + 0.11 / math.sqrt(n)) * d
+    if lam < 0.2:
+        return d, 1.0
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam) for k in range(1, 101))
+    return d, min(max(p, 0.0), 1.0)
+
+
+# Outcomes compared between backends
+CHECK_METRICS = ("final_population", "final_mean_resistance", "peak_population")
+
+
+def compare_backends(params, replicates=100, backends=BACKENDS, seed=0):
+    """KS test of each CHECK_METRICS outcome across replicate runs of two backends
+
+    Returns {metric: (backend means, KS statistic, p-value)}.
+    """
+    root = np.random.SeedSequence(seed)
+    outcomes = {}
+    for backend in backends:
+        rows = []
+        for child in root.spawn(replicates):
+            engine = SimulationEngine(seed=child, backend=backend, **params)
+            engine.run()
+            summary = engine.summary()
+            rows.append([summary[metric] for metric in CHECK_METRICS])
+        outcomes[backend] = np.array(rows, dtype=np.float64)
+
+    first, second = (outcomes[backend] for backend in backends)
+    report = {}
+    for column, metric in enumerate(CHECK_METRICS):
+        d, p = ks_test(first[:, column], second[:, column])
+        report[metric] = ((first[:, column].mean(), second[:, column].mean()), d, p)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generation kernel backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the available backends")
+    check_parser = commands.add_parser("check", help="test numpy and numba for statistical equivalence")
+    check_parser.add_argument("--replicates", type=int, default=100)
+    check_parser.add_argument("--population-size", type=int, default=5000)
+    check_parser.add_argument("--carrying-capacity", type=int, default=10000)
+    # Defaults keep the population below capacity, so its size is informative
+    check_parser.add_argument("--concentration", type=float, default=0.42)
+    check_parser.add_argument("--reproduction-rate", type=float, default=1.4)
+    check_parser.add_argument("--generations", type=int, default=40)
+    check_parser.add_argument("--alpha", type=float, default=0.001,
+                              help="p-value below which a metric counts as different")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for backend in BACKENDS:
+            available = backend != "numba" or numba_available()
+            print(f"{backend}: {'available' if available else 'not installed'}")
+        print(f"auto -> {resolve_backend('auto')}")
+        return 0
+
+    if not numba_available():
+        print("numba is not installed; nothing to compare", file=sys.stderr)
+        return 1
+    params = {
+        "population_size": args.population_size,
+        "carrying_capacity": args.carrying_capacity,
+        "antibiotic_concentration": args.concentration,
+        "reproduction_rate": args.reproduction_rate,
+        "max_generations": args.generations,
+    }
+    report = compare_backends(params, args.replicates)
+    failed = 0
+    for metric, ((mean_numpy, mean_numba), d, p) in report.items():
+        verdict = "ok" if p >= args.alpha else "DIFFERENT"
+        failed += p < args.alpha
+        print(f"{metric:>22}: numpy {mean_numpy:12.4f}  numba {mean_numba:12.4f}  "
+              f"KS D={d:.3f} p={p:.3f}  {verdict}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Low-overhead per-phase timing for the hot paths
+
+A PhaseTimer records how long each named phase takes (perf_counter_ns)
+into fixed-size ring buffers, so memory stays bounded and recording costs
+a couple of list writes. Rolling p50/p95 and call rates are computed on
+demand, and the most recent events can be exported in the Chrome trace
+event format (open in chrome://tracing or https://ui.perfetto.dev).
+
+Each phase should be recorded from one thread; different phases may be
+recorded from different threads. The engine uses NULL_TIMER unless a
+PhaseTimer is attached, which skips timing entirely.
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Durations kept per phase for the rolling statistics
+DEFAULT_WINDOW = 512
+
+# Events kept for trace export
+DEFAULT_TRACE_EVENTS = 100000
+
+
+class _Ring:
+    """Start times and durations of a phase's most recent calls"""
+    __slots__ = ("starts", "durations", "index", "count")
+
+    def __init__(self, size):
+        self.starts = [0] * size
+        self.durations = [0] * size
+        self.index = 0
+        self.count = 0
+
+    def add(self, start, duration):
+        i = self.index
+        self.starts[i] = start
+        self.durations[i] = duration
+        self.index = (i + 1) % len(self.starts)
+        self.count += 1
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTimer:
+    """Timer interface that records nothing"""
+    enabled = False
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def record(self, name, start_ns, end_ns):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class PhaseTimer:
+    """Rolling per-phase timings plus a bounded trace of recent events"""
+    enabled = True
+
+    def __init__(self, window=DEFAULT_WINDOW, trace_events=DEFAULT_TRACE_EVENTS):
+        self.window = window
+        self._rings = {}
+        self._trace = collections.deque(maxlen=trace_events)
+        self._lock = threading.Lock()  # only taken when a new phase first appears
+
+    def phase(self, name):
+        """Context manager timing one call of the named phase"""
+        return _Phase(self, name)
+
+    def record(self, name, start_ns, end_ns):
+        ring = self._rings.get(name)
+        if ring is None:
+            with self._lock:
+                ring = self._rings.setdefault(name, _Ring(self.window))
+        ring.add(start_ns, end_ns - start_ns)
+        self._trace.append((name, start_ns, end_ns - start_ns, threading.get_ident()))
+
+    def phases(self):
+        return list(self._rings)
+
+    def stats(self, name):
+        """p50/p95 milliseconds and calls per second over the phase's window, or None"""
+        ring = self._rings.get(name)
+        if ring is None or ring.count == 0:
+            return None
+        n = min(ring.count, len(ring.durations))
+        durations = np.array(ring.durations[:n], dtype=np.float64) / 1e6
+        starts = np.array(ring.starts[:n], dtype=np.int64)
+        span = (starts.max() - starts.min()) / 1e9
+        return {
+            "p50_ms": float(np.percentile(durations, 50)),
+            "p95_ms": float(np.percentile(durations, 95)),
+            "rate": float((n - 1) / span) if span > 0 else 0.0,
+            "count": ring.count,
+        }
+
+    def summary(self, names=None):
+        """{phase: stats} for the given phases (default: all recorded phases)"""
+        names = self.phases() if names is None else names
+        return {name: stats for name in names
+                if (stats := self.stats(name)) is not None}
+
+    def reset(self):
+        with self._lock:
+            self._rings = {}
+            self._trace.clear()
+
+    def export_chrome_trace(self, path):
+        """Write recent events as a Chrome trace (JSON, complete "X" events)"""
+        events = list(self._trace)
+        origin = min((start for _, start, _, _ in events), default=0)
+        pid = os.getpid()
+        trace = {
+            "traceEvents": [
+                {"name": name, "ph": "X", "pid": pid, "tid": tid,
+                 "ts": (start - origin) / 1000, "dur": duration / 1000}
+                for name, start, duration, tid in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+        with open(path, "w") as f:
+            json.dump(trace, f)
+        return len(events)
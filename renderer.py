@@ -0,0 +1,234 @@
+"""Off-screen pygame renderer for the bacteria visualization
+
+Draws the scatter and grid views onto one reusable surface. Fonts, text
+labels, glow sprites, circle stamps and the static background are cached,
+and the bulk of the scatter points is written straight into the pixel
+buffer with surfarray, so frame time stays flat as the population grows.
+This module does not import tkinter; the GUI converts the surface for display.
+"""
+import numpy as np
+import pygame
+
+from theme import COLORS, hex_to_rgb
+
+SUSCEPTIBLE_COLOR = hex_to_rgb(COLORS["accent"])
+RESISTANT_COLOR = hex_to_rgb(COLORS["secondary"])
+
+# Height of the antibiotic concentration bar at the bottom of the view
+INDICATOR_HEIGHT = 10
+
+# Largest grid drawn in grid view (cells per side)
+MAX_GRID_SIZE = 30
+
+# Default level-of-detail threshold: one drawn bacterium per this many pixels.
+# Beyond that the scatter view is saturated and extra circles add cost, not information.
+PIXELS_PER_DRAWN_BACTERIUM = 48
+
+
+class PopulationRenderer:
+    """Renders resistance values to a pygame surface with cached resources"""
+    def __init__(self, size):
+        if not pygame.font.get_init():
+            pygame.font.init()
+        self.size = size
+        # 32-bit so the pixel buffer can be written as one mapped int per pixel
+        self.surface = pygame.Surface(size, depth=32)
+        self.rng = np.random.default_rng()
+        self.lod_threshold = (size[0] * size[1]) // PIXELS_PER_DRAWN_BACTERIUM
+        self._fonts = {}
+        self._labels = {}
+        self._glows = {}
+        self._disks = {}
+        self._backgrounds = {}
+
+    # Cached resources
+
+    def font(self, size):
+        if size not in self._fonts:
+            self._fonts[size] = pygame.font.SysFont('Arial', size)
+        return self._fonts[size]
+
+    def label(self, text, size, color):
+        key = (text, size, color)
+        if key not in self._labels:
+            self._labels[key] = self.font(size).render(text, True, color)
+        return self._labels[key]
+
+    def glow(self, color, radius):
+        """Semi-transparent halo sprite drawn behind near-threshold bacteria"""
+        key = (color, radius)
+        if key not in self._glows:
+            sprite = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, (*color, 100), (radius, radius), radius)
+            self._glows[key] = sprite
+        return self._glows[key]
+
+    def disk(self, radius):
+        """Pixel offsets covered by a filled circle of the given radius"""
+        if radius not in self._disks:
+            dx, dy = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+            inside = dx * dx + dy * dy <= radius * radius
+            self._disks[radius] = (dx[inside], dy[inside])
+        return self._disks[radius]
+
+    def background(self, mode):
+        """Static background for a view: white fill, grid lines and legend"""
+        if mode in self._backgrounds:
+            return self._backgrounds[mode]
+
+        width, height = self.size
+        background = pygame.Surface(self.size, depth=32)
+        background.fill((255, 255, 255))
+        if mode == "scatter":
+            # Draw a subtle grid background
+            grid_spacing = 50
+            for x in range(0, width, grid_spacing):
+                pygame.draw.line(background, (240, 240, 240), (x, 0), (x, height))
+            for y in range(0, height, grid_spacing):
+                pygame.draw.line(background, (240, 240, 240), (0, y), (width, y))
+
+            # Draw legend
+            legend_y = 20
+            legend_x = width - 150
+            pygame.draw.circle(background, SUSCEPTIBLE_COLOR, (legend_x, legend_y), 6)
+            background.blit(self.label('Susceptible', 12, (50, 50, 50)), (legend_x + 15, legend_y - 6))
+            pygame.draw.circle(background, RESISTANT_COLOR, (legend_x, legend_y + 25), 6)
+            background.blit(self.label('Resistant', 12, (50, 50, 50)), (legend_x + 15, legend_y + 19))
+        self._backgrounds[mode] = background
+        return background
+
+    # Drawing
+
+    def grid_cells(self, population_count):
+        """Number of cells shown in grid view for a population of this size"""
+        grid_size = min(MAX_GRID_SIZE, int(np.sqrt(population_count)))
+        return grid_size * grid_size if grid_size >= 2 else 0
+
+    def scatter_count(self, population_count):
+        """Number of bacteria drawn in scatter view (capped by the LOD threshold)"""
+        return min(population_count, self.lod_threshold)
+
+    def render(self, values, concentration, mode="scatter", population_count=None):
+        """Draw the given resistance values and return the surface
+
+        population_count is the true population size; when it exceeds the
+        number of values given, the scatter view is labelled as a sample.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if population_count is None:
+            population_count = values.size
+        self.surface.blit(self.background(mode), (0, 0))
+        self._draw_indicator(concentration)
+        if mode == "scatter":
+            self._draw_scatter(values, concentration)
+            if population_count > values.size:
+                self._draw_lod_caption(values.size, population_count)
+        else:
+            self._draw_grid(values, concentration, population_count)
+        return self.surface
+
+    def _draw_lod_caption(self, shown, population_count):
+        text = self.font(12).render(f'Stratified sample: {shown:,} of {population_count:,}',
+                                    True, (50, 50, 50), (255, 255, 255))
+        self.surface.blit(text, (10, 8))
+
+    def _draw_indicator(self, concentration):
+        width, height = self.size
+        pygame.draw.rect(self.surface, (240, 240, 240),
+                         (0, height - INDICATOR_HEIGHT, width, INDICATOR_HEIGHT))
+        conc_x = int(width * concentration)
+        pygame.draw.rect(self.surface, SUSCEPTIBLE_COLOR,
+                         (0, height - INDICATOR_HEIGHT, conc_x, INDICATOR_HEIGHT))
+
+    def _draw_scatter(self, values, concentration):
+        if values.size == 0:
+            return
+        width, height = self.size
+
+        # Random placement, leaving space for the indicator
+        xs = self.rng.integers(10, width - 9, values.size)
+        ys = self.rng.integers(10, height - 19, values.size)
+
+        susceptible = values < concentration
+        # Size based on how close the resistance is to antibiotic concentration
+        resistance_diff = np.abs(values - concentration)
+        sizes = np.maximum(3, 8 - (resistance_diff * 10).astype(np.int64))
+
+        # Glow effect for bacteria near the antibiotic concentration (batched blits)
+        near = np.flatnonzero(resistance_diff < 0.05)
+        if near.size:
+            glows = []
+            for i in near:
+                glow_size = int(sizes[i]) + 4
+                color = SUSCEPTIBLE_COLOR if susceptible[i] else RESISTANT_COLOR
+                glows.append((self.glow(color, glow_size), (int(xs[i]) - glow_size, int(ys[i]) - glow_size)))
+            self.surface.blits(glows, doreturn=False)
+
+        # Stamp all circles of one size and color straight into the pixel buffer.
+        # Placement keeps every circle (radius <= 8) inside the surface, so no clipping is needed.
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        try:
+            rows = pixels.T  # (height, width), C-contiguous unless rows are padded
+            flat = rows.reshape(-1) if rows.flags.c_contiguous else None
+            for size in np.unique(sizes):
+                dx, dy = self.disk(int(size))
+                for mask, color in ((susceptible, SUSCEPTIBLE_COLOR), (~susceptible, RESISTANT_COLOR)):
+                    idx = np.flatnonzero(mask & (sizes == size))
+                    if idx.size == 0:
+                        continue
+                    px = xs[idx, None] + dx[None, :]
+                    py = ys[idx, None] + dy[None, :]
+                    mapped = self.surface.map_rgb(color)
+                    if flat is not None:
+                        flat[(py * width + px).ravel()] = mapped
+                    else:
+                        pixels[px, py] = mapped
+        finally:
+            del pixels  # release the surface lock
+
+    def _draw_grid(self, values, concentration, population_count):
+        width, height = self.size
+
+        # Create a grid representation of bacteria
+        grid_size = min(MAX_GRID_SIZE, int(np.sqrt(population_count)))
+        if grid_size < 2:
+            return  # Not enough bacteria for grid
+
+        cell_width = width // grid_size
+        cell_height = height // grid_size
+        values = values[:grid_size * grid_size]
+
+        # Draw grid background
+        for i in range(grid_size + 1):
+            pygame.draw.line(self.surface, (230, 230, 230),
+                             (0, i * cell_height), (width, i * cell_height), 1)
+            pygame.draw.line(self.surface, (230, 230, 230),
+                             (i * cell_width, 0), (i * cell_width, height), 1)
+
+        # Draw bacteria in grid cells
+        labels = []
+        for i, resistance in enumerate(values):
+            row = i // grid_size
+            col = i % grid_size
+            x = col * cell_width + cell_width // 2
+            y = row * cell_height + cell_height // 2
+
+            # Determine color based on resistance vs antibiotic concentration
+            if resistance < concentration:
+                color = SUSCEPTIBLE_COLOR
+                cell_color = (255, 240, 240)  # Light red background
+            else:
+                color = RESISTANT_COLOR
+                cell_color = (240, 255, 240)  # Light green background
+
+            # Size based on resistance vs antibiotic
+            resistance_diff = abs(resistance - concentration)
+            size = max(3, min(cell_width // 2 - 2, 10 - int(resistance_diff * 15)))
+
+            self.surface.fill(cell_color, (col * cell_width, row * cell_height, cell_width, cell_height))
+            pygame.draw.circle(self.surface, color, (x, y), size)
+
+            # Small indicator of resistance value (at most 101 distinct cached labels)
+            text = self.label(f'{resistance:.2f}', 8, (100, 100, 100))
+            labels.append((text, text.get_rect(center=(x, y + cell_height // 2 - 8))))
+        self.surface.blits(labels, doreturn=False)
@@ -0,0 +1,172 @@
+"""Content-addressed on-disk cache of completed runs
+
+Sweeps, batch files and GUI exploration keep re-running the same parameters
+with the same seed. A finished run is stored under the SHA-256 of
+everything that determines it: the model parameters, population mode (and
+bin count), generation kernel backend, seed and ENGINE_VERSION. Entries are
+checkpoint files (see checkpoint.py), so a hit restores the complete final
+state, history included, and the restored run can be continued bit-exactly.
+
+The cache is bounded in bytes with least-recently-used eviction: a hit
+refreshes the entry's modification time, and storing an entry deletes the
+oldest ones until the cache fits. Entries are written atomically and an
+entry evicted by another process is just a miss, so sweep and batch workers
+can share one cache directory.
+
+Only plain SimulationEngine runs from generation 0 with fixed parameters
+are cached; the key says nothing about parameters changed mid-run or about
+sharding.
+
+Example:
+    python run_cache.py info
+    python run_cache.py clear
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import zipfile
+
+from checkpoint import read_checkpoint, save_checkpoint
+from engine import ENGINE_VERSION
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                         "simulasi-resistensi-bakteri", "runs")
+
+DEFAULT_MAX_BYTES = 1024**3  # 1 GiB
+
+# Errors that mean an entry is unreadable (truncated, foreign or from an older layout)
+_BAD_ENTRY = (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile)
+
+
+def run_key(engine):
+    """Hex digest of everything that determines the run engine makes from generation 0"""
+    seed = engine.seed_sequence
+    record = {
+        "engine_version": ENGINE_VERSION,
+        "parameters": engine.get_parameters(),
+        "population_mode": engine.population_mode,
+        "seed": {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key)},
+    }
+    if engine.population_mode == "binned":
+        record["num_bins"] = engine.num_bins
+    else:
+        record["backend"] = engine.backend  # binned populations do not use the kernel
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+class RunCache:
+    """Finished runs in a directory, evicted least recently used first beyond max_bytes"""
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def load(self, key, engine):
+        """Restore the run cached under key into engine; returns False on a miss"""
+        path = self.path(key)
+        try:
+            state = read_checkpoint(path)
+        except FileNotFoundError:
+            return False
+        except _BAD_ENTRY:
+            self._remove(path)
+            return False
+        # A damaged entry can fail part-way through restoring, so put the
+        # engine back the way the caller handed it over
+        previous = engine.get_state()
+        try:
+            engine.set_state(state)
+        except _BAD_ENTRY:
+            engine.set_state(previous)
+            self._remove(path)
+            return False
+        try:
+            os.utime(path)  # most recently used
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, engine):
+        """Cache the engine's finished run under key; returns the entry path
+
+        Returns None when the entry cannot be written: a cache that cannot
+        store only costs a recomputation next time.
+        """
+        path = self.path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            save_checkpoint(engine, path)
+        except OSError:
+            return None
+        self.evict()
+        return path
+
+    def entries(self):
+        """(mtime, size, path) of every entry, least recently used first"""
+        entries = []
+        try:
+            listing = os.scandir(self.directory)
+        except FileNotFoundError:
+            return entries
+        with listing:
+            for entry in listing:
+                if not entry.name.endswith(".npz"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # evicted meanwhile
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None):
+        """Delete the least recently used entries until the cache fits; returns how many"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        return self.evict(0)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the run cache")
+    parser.add_argument("command", choices=("info", "clear"))
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    cache = RunCache(args.cache_dir)
+    if args.command == "clear":
+        print(f"Removed {cache.clear()} cached runs from {cache.directory}")
+        return 0
+    entries = cache.entries()
+    total = sum(size for _, size, _ in entries)
+    print(f"{cache.directory}: {len(entries)} cached runs, {total / 1024**2:.1f} MiB "
+          f"(limit {cache.max_bytes / 1024**2:.0f} MiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""One agent-mode run sharded across worker processes
+
+For populations too large for one process to step quickly, ShardedEngine
+splits the cells across worker processes. Each worker keeps its slice in
+a multiprocessing.shared_memory buffer and does selection, reproduction
+and mutation on it locally. The carrying capacity is then applied
+globally: the coordinator draws how many of the kept cells come from each
+shard (a multivariate hypergeometric draw over the shard sizes) and each
+shard samples its quota without replacement. Together this is exactly a
+uniform sample of capacity cells from the whole offspring generation, as
+in generation_kernel. Counts and resistance sums are reduced across
+shards for the history and summary.
+
+Each shard draws from its own stream, spawned from the engine seed by
+(generation, shard), so a run replays exactly for the same seed and number
+of shards. The coordinator reads slices straight from shared memory for
+histograms, display samples and checkpoints.
+
+Example:
+    python sharded.py --population-size 100000000 --carrying-capacity 100000000 \\
+        --shards 8 --generations 20
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from engine import DEFAULT_PARAMETERS, NULL_TIMER, SimulationEngine, multivariate_hypergeometric
+from kernels import make_kernel
+
+# Shared buffers are grown with this much headroom to avoid reallocating every generation
+GROWTH = 1.25
+
+
+def _shard_seed(entropy, spawn_key, generation, shard):
+    return np.random.SeedSequence(entropy, spawn_key=tuple(spawn_key) + (generation, shard))
+
+
+class _Slice:
+    """A worker's population slice in a shared memory segment it owns"""
+    def __init__(self):
+        self.segment = None
+        self.count = 0
+
+    def view(self):
+        return np.ndarray((self.count,), dtype=np.float64, buffer=self.segment.buf)
+
+    def store(self, values):
+        if self.segment is None or self.segment.size < values.nbytes:
+            self.release()
+            self.segment = shared_memory.SharedMemory(
+                create=True, size=max(8, int(values.nbytes * GROWTH)))
+        self.count = values.size
+        self.view()[:] = values
+
+    def release(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+
+
+def _summary(local, threshold=None):
+    """Shared-memory name, count, sum and (when threshold is given) count at or above it"""
+    values = local.view()
+    at_least = None if threshold is None else int(np.count_nonzero(values >= threshold))
+    return local.segment.name, local.count, float(values.sum()), at_least
+
+
+def _shard_main(conn, shard):
+    """Worker loop: serve commands from the coordinator until "close" """
+    local = _Slice()
+    pending = None
+    rng = None
+    kernels = {}
+    try:
+        while True:
+            command, *args = conn.recv()
+            if command == "uniform":
+                size, low, high, entropy, spawn_key, generation = args
+                rng = np.random.default_rng(_shard_seed(entropy, spawn_key, generation, shard))
+                local.store(rng.uniform(low, high, size))
+                conn.send(_summary(local))
+            elif command == "load":
+                values, = args
+                local.store(np.asarray(values, dtype=np.float64))
+                conn.send(_summary(local))
+            elif command == "step":
+                (concentration, mutation_std, reproduction_rate,
+                 entropy, spawn_key, generation, backend) = args
+                rng = np.random.default_rng(_shard_seed(entropy, spawn_key, generation, shard))
+                if backend not in kernels:
+                    kernels[backend] = make_kernel(backend)[1]
+                # Capacity is applied globally in "commit"
+                pending = kernels[backend](local.view(), concentration, mutation_std,
+                                           reproduction_rate, np.inf, rng)
+                conn.send(pending.size)
+            elif command == "commit":
+                quota, threshold = args
+                if quota < pending.size:
+                    pending = rng.choice(pending, quota, replace=False)
+                local.store(pending)
+                pending = None
+                conn.send(_summary(local, threshold))
+            elif command == "at_least":
+                threshold, = args
+                conn.send(int(np.count_nonzero(local.view() >= threshold)))
+            elif command == "histogram":
+                bins, = args
+                conn.send(np.histogram(local.view(), bins=bins, range=(0, 1))[0])
+            elif command == "sample":
+                k, seed = args
+                values = local.view()
+                conn.send(np.random.default_rng(seed).choice(values, k, replace=False)
+                          if k < values.size else values.copy())
+            elif command == "close":
+                break
+    finally:
+        local.release()
+        conn.close()
+
+
+class ShardPool:
+    """Worker processes, each holding one slice of the population"""
+    def __init__(self, shards):
+        context = multiprocessing.get_context()
+        # Workers must share the coordinator's tracker, or segments the coordinator
+        # attaches to are reported as leaked (and unlinked twice) at exit
+        resource_tracker.ensure_running()
+        self.connections = []
+        self.processes = []
+        for shard in range(shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=_shard_main, args=(child, shard), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        self.names = [None] * shards
+        self.counts = np.zeros(shards, dtype=np.int64)
+        self.sums = np.zeros(shards)
+        # Resistant count taken during the last commit, valid for that threshold only
+        self.threshold = None
+        self.at_least = None
+        self._attached = {}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def _broadcast(self, messages):
+        """Send one message per shard, then collect the replies (shards work in parallel)"""
+        for conn, message in zip(self.connections, messages):
+            conn.send(message)
+        return [conn.recv() for conn in self.connections]
+
+    def _update(self, replies, threshold=None):
+        for shard, (name, count, total, _) in enumerate(replies):
+            self.names[shard] = name
+            self.counts[shard] = count
+            self.sums[shard] = total
+        self.threshold = threshold
+        self.at_least = None if threshold is None else sum(reply[3] for reply in replies)
+
+    def initialize(self, size, low, high, seed_sequence, generation=0):
+        base, extra = divmod(int(size), len(self))
+        sizes = [base + (shard < extra) for shard in range(len(self))]
+        self._update(self._broadcast(
+            [("uniform", n, low, high, seed_sequence.entropy, seed_sequence.spawn_key, generation)
+             for n in sizes]))
+
+    def load(self, values, counts=None):
+        """Split an existing population across the shards, evenly or into counts"""
+        if counts is None or len(counts) != len(self):
+            parts = np.array_split(values, len(self))
+        else:
+            parts = np.split(values, np.cumsum(counts)[:-1])
+        self._update(self._broadcast([("load", part) for part in parts]))
+
+    def step(self, concentration, mutation_std, reproduction_rate, capacity, rng, seed_sequence,
+             generation, backend="numpy", count_threshold=None, timer=NULL_TIMER):
+        """Step every shard; count_threshold also counts the cells at or above it"""
+        with timer.phase("shards"):
+            sizes = np.array(self._broadcast(
+                [("step", concentration, mutation_std, reproduction_rate,
+                  seed_sequence.entropy, seed_sequence.spawn_key, generation, backend)] * len(self)),
+                dtype=np.int64)
+        with timer.phase("capacity"):
+            if sizes.sum() > capacity:
+                quotas = multivariate_hypergeometric(sizes, capacity, rng)
+            else:
+                quotas = sizes
+            self._update(self._broadcast([("commit", int(quota), count_threshold)
+                                          for quota in quotas]), count_threshold)
+
+    def histogram(self, bins):
+        return np.sum(self._broadcast([("histogram", bins)] * len(self)), axis=0)
+
+    def count_at_least(self, threshold):
+        if self.at_least is not None and threshold == self.threshold:
+            return self.at_least
+        return sum(self._broadcast([("at_least", threshold)] * len(self)))
+
+    def sample(self, k, rng):
+        """Up to k values drawn without replacement across all shards"""
+        k = min(int(k), int(self.counts.sum()))
+        quotas = multivariate_hypergeometric(self.counts, k, rng)
+        seeds = rng.integers(0, 2**63, len(self))
+        values = np.concatenate(self._broadcast(
+            [("sample", int(quota), int(seed)) for quota, seed in zip(quotas, seeds)]))
+        rng.shuffle(values)
+        return values
+
+    def gather(self):
+        """Copy of the whole population, read from the shards' shared memory"""
+        parts = []
+        for name, count in zip(self.names, self.counts):
+            segment = self._attached.get(name)
+            if segment is None:
+                segment = shared_memory.SharedMemory(name=name)
+                self._attached[name] = segment
+            parts.append(np.ndarray((count,), dtype=np.float64, buffer=segment.buf).copy())
+        # Segments the shards have since replaced are not needed any more
+        for stale in set(self._attached) - set(self.names):
+            self._attached.pop(stale).close()
+        return np.concatenate(parts)
+
+    def close(self):
+        for segment in self._attached.values():
+            segment.close()
+        self._attached = {}
+        for conn in self.connections:
+            try:
+                conn.send(("close",))
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        self.processes = []
+
+
+class ShardedPopulation:
+    """Agent population whose cells live in a ShardPool"""
+    mode = "agents"
+
+    def __init__(self, pool, engine):
+        self.pool = pool
+        self.engine = engine
+
+    def size(self):
+        return int(self.pool.counts.sum())
+
+    def mean(self):
+        count = self.size()
+        if count == 0:
+            return 0.0
+        return float(self.pool.sums.sum() / count)
+
+    def fraction_at_least(self, threshold):
+        count = self.size()
+        if count == 0:
+            return 0.0
+        return self.pool.count_at_least(threshold) / count
+
+    def histogram(self, bins=30):
+        """Counts and edges of the resistance distribution over [0, 1]"""
+        return self.pool.histogram(bins), np.linspace(0, 1, bins + 1)
+
+    def sample(self, k, rng):
+        return self.pool.sample(k, rng)
+
+    def step(self, concentration, mutation_std, reproduction_rate, capacity, rng, timer=NULL_TIMER):
+        # The engine bumps its generation after stepping, so this produces generation + 1.
+        # With telemetry attached the shards also count resistant cells while committing.
+        threshold = concentration if self.engine.telemetry is not None else None
+        self.pool.step(concentration, mutation_std, reproduction_rate, capacity, rng,
+                       self.engine.seed_sequence, self.engine.generation + 1, self.engine.backend,
+                       threshold, timer)
+        return self
+
+    def copy_data(self):
+        return self.pool.gather()
+
+
+class ShardedEngine(SimulationEngine):
+    """SimulationEngine whose agent population is split across worker processes
+
+    Close it (or use it as a context manager) to stop the workers and free
+    the shared memory.
+    """
+    def __init__(self, shards=None, seed=None, history=None, backend="numpy", **params):
+        self.pool = ShardPool(shards or os.cpu_count() or 1)
+        try:
+            super().__init__(seed=seed, population_mode="agents", history=history, backend=backend,
+                             **params)
+        except BaseException:
+            self.pool.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def set_population_mode(self, population_mode, num_bins=None):
+        if population_mode != "agents":
+            raise ValueError("ShardedEngine only supports the agents population mode")
+        super().set_population_mode(population_mode, num_bins)
+
+    def create_population(self):
+        min_res, max_res = self.initial_resistance_range
+        self.pool.initialize(self.population_size, min_res, max_res, self.seed_sequence)
+        return ShardedPopulation(self.pool, self)
+
+    def get_state(self):
+        state = super().get_state()
+        # Shard boundaries, so a restore with as many shards continues bit-exactly
+        state["metadata"]["shard_counts"] = self.pool.counts.tolist()
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.pool.load(self.population.values, state["metadata"].get("shard_counts"))
+        self.population = ShardedPopulation(self.pool, self)
+
+    def close(self):
+        self.pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one large agent-mode simulation across processes")
+    parser.add_argument("--population-size", type=int, default=DEFAULT_PARAMETERS["population_size"])
+    parser.add_argument("--carrying-capacity", type=int, default=DEFAULT_PARAMETERS["carrying_capacity"])
+    parser.add_argument("--concentration", type=float, dest="antibiotic_concentration",
+                        default=DEFAULT_PARAMETERS["antibiotic_concentration"])
+    parser.add_argument("--mutation-std", type=float, default=DEFAULT_PARAMETERS["mutation_std"])
+    parser.add_argument("--reproduction-rate", type=float, default=DEFAULT_PARAMETERS["reproduction_rate"])
+    parser.add_argument("--generations", type=int, default=DEFAULT_PARAMETERS["max_generations"])
+    parser.add_argument("--shards", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--backend", choices=("auto", "numpy", "numba"), default="numpy",
+                        help="generation kernel each shard runs (see kernels.py)")
+    args = parser.parse_args(argv)
+
+    params = {
+        "population_size": args.population_size,
+        "carrying_capacity": args.carrying_capacity,
+        "antibiotic_concentration": args.antibiotic_concentration,
+        "mutation_std": args.mutation_std,
+        "reproduction_rate": args.reproduction_rate,
+        "max_generations": args.generations,
+    }
+    with ShardedEngine(shards=args.shards, seed=args.seed, backend=args.backend, **params) as engine:
+        print(f"{len(engine.pool)} shards, seed {engine.seed_sequence.entropy}", flush=True)
+        start = time.perf_counter()
+        while not engine.is_finished():
+            engine.step()
+            print(f"generation {engine.generation}: population {engine.population_count():,}, "
+                  f"mean resistance {engine.average_resistance():.4f}", flush=True)
+        elapsed = time.perf_counter() - start
+        print(f"{engine.generation} generations in {elapsed:.1f} s "
+              f"({engine.generation / elapsed if elapsed else 0:.2f} gen/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""Precomputed emulator of expected trajectories for instant slider previews
+
+A run takes seconds, but the GUI's antibiotic concentration, mutation and
+reproduction sliders are dragged continuously. A Surrogate holds the mean
+population, mean resistance and extinction probability trajectories of
+small replicate ensembles at every point of a grid over those three
+sliders, with the other parameters fixed. predict() interpolates the eight
+grid points around any slider position (trilinear), which takes well
+under a millisecond.
+
+Building one runs every grid point across a process pool (agent-mode
+points are batched, see batched.py); with the default grid and
+parameters that is a couple of CPU-minutes. Surrogates are saved in the
+cache directory under the SHA-256 of everything they were built from,
+ENGINE_VERSION included, so a changed model or changed fixed parameters
+simply miss and are rebuilt.
+
+Example:
+    python surrogate.py build --population-size 1000 --carrying-capacity 2000
+    python surrogate.py predict --concentration 0.3 --mutation-std 0.01 --reproduction-rate 1.2
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+from engine import DEFAULT_PARAMETERS, ENGINE_VERSION, POPULATION_MODES, seed_sequence
+from ensemble import run_replicate, run_replicate_batch
+from run_cache import CACHE_DIR
+
+SURROGATE_DIR = os.path.join(os.path.dirname(CACHE_DIR), "surrogates")
+
+# Bumped whenever the file layout changes
+SURROGATE_VERSION = 1
+
+# Interpolated parameters, in grid axis order, and their default grid values
+# (the GUI slider ranges). Growth switches from decline to saturation within a
+# narrow reproduction band and mutation matters most when small, so those are dense.
+SURROGATE_AXES = ("antibiotic_concentration", "mutation_std", "reproduction_rate")
+DEFAULT_GRID = {
+    "antibiotic_concentration": np.linspace(0.0, 1.0, 21),
+    "mutation_std": np.array([0.001, 0.005, 0.01, 0.02, 0.05, 0.1]),
+    "reproduction_rate": np.linspace(1.0, 2.0, 11),
+}
+
+DEFAULT_REPLICATES = 8
+DEFAULT_SEED = 0  # fixed, so equal inputs give the same surrogate and cache key
+
+# Trajectory length used when the fixed parameters leave max_generations unlimited
+DEFAULT_GENERATIONS = 200
+
+
+def surrogate_key(base_params, population_mode, grid, replicates, seed):
+    """Hex digest of everything a surrogate is built from"""
+    seed = seed_sequence(seed)
+    record = {
+        "engine_version": ENGINE_VERSION,
+        "surrogate_version": SURROGATE_VERSION,
+        "parameters": {name: base_params[name] for name in sorted(base_params)
+                       if name not in SURROGATE_AXES},
+        "population_mode": population_mode,
+        "grid": {name: [float(value) for value in grid[name]] for name in SURROGATE_AXES},
+        "replicates": int(replicates),
+        "seed": {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key)},
+    }
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+def surrogate_parameters(params):
+    """Fixed parameters of a surrogate for params: the sliders dropped, generations bounded"""
+    base = {name: value for name, value in dict(DEFAULT_PARAMETERS, **params).items()
+            if name in DEFAULT_PARAMETERS and name not in SURROGATE_AXES}
+    base["initial_resistance_range"] = [float(value) for value in base["initial_resistance_range"]]
+    if base["max_generations"] <= 0:
+        base["max_generations"] = DEFAULT_GENERATIONS
+    return base
+
+
+def run_grid_point(task):
+    """Mean trajectories of one grid point's replicates
+
+    Returns (index, population mean, mean resistance over surviving
+    replicates (NaN once all are extinct), extinction probability).
+    """
+    index, params, population_mode, replicates, seed = task
+    if population_mode == "agents":
+        population, resistance = run_replicate_batch((params, replicates, seed))
+    else:
+        rows = [run_replicate((params, population_mode, child)) for child in seed.spawn(replicates)]
+        population = np.array([row[0] for row in rows])
+        resistance = np.array([row[1] for row in rows])
+
+    alive = population > 0
+    survivors = alive.sum(axis=0)
+    mean_resistance = np.divide(np.where(alive, resistance, 0).sum(axis=0), survivors,
+                                out=np.full(survivors.size, np.nan), where=survivors > 0)
+    return index, population.mean(axis=0), mean_resistance, 1 - alive.mean(axis=0)
+
+
+class Surrogate:
+    """Grid of ensemble-mean trajectories with trilinear interpolation between points
+
+    population, resistance and extinction have shape (grid sizes..., generations + 1).
+    """
+    def __init__(self, base_params, population_mode, grid, replicates, seed,
+                 population, resistance, extinction):
+        self.base_params = dict(base_params)
+        self.population_mode = population_mode
+        self.grid = {name: np.asarray(grid[name], dtype=np.float64) for name in SURROGATE_AXES}
+        self.replicates = int(replicates)
+        self.seed = seed_sequence(seed)
+        self.population = population
+        self.resistance = resistance
+        self.extinction = extinction
+
+    @property
+    def key(self):
+        return surrogate_key(self.base_params, self.population_mode, self.grid,
+                             self.replicates, self.seed)
+
+    @property
+    def generations(self):
+        return self.population.shape[-1] - 1
+
+    def matches(self, params, population_mode):
+        """Whether the surrogate was built for these fixed parameters and mode"""
+        return (population_mode == self.population_mode
+                and surrogate_parameters(params) == self.base_params)
+
+    def corners(self, **point):
+        """Grid indices and weights of the (up to) eight grid points around point
+
+        Values outside the grid are clamped to its edges.
+        """
+        axes = []
+        for name in SURROGATE_AXES:
+            values = self.grid[name]
+            value = float(np.clip(point.get(name, self.base_params.get(name, values[0])),
+                                  values[0], values[-1]))
+            if values.size == 1:
+                axes.append(((0, 1.0),))
+                continue
+            i = int(np.clip(np.searchsorted(values, value, side="right") - 1, 0, values.size - 2))
+            t = (value - values[i]) / (values[i + 1] - values[i])
+            axes.append(((i, 1 - t), (i + 1, t)))
+
+        corners = []
+        for a, wa in axes[0]:
+            for b, wb in axes[1]:
+                for c, wc in axes[2]:
+                    if wa * wb * wc > 0:
+                        corners.append(((a, b, c), wa * wb * wc))
+        return corners
+
+    def predict(self, **point):
+        """Expected trajectories at a slider position
+
+        point gives antibiotic_concentration, mutation_std and
+        reproduction_rate. Returns a dict of (generations + 1,) arrays:
+        population, resistance (NaN once every replicate died out) and
+        extinction_probability.
+        """
+        corners = self.corners(**point)
+        weights = np.array([weight for _, weight in corners])[:, None]
+        population = sum(weight * self.population[index] for index, weight in corners)
+        extinction = sum(weight * self.extinction[index] for index, weight in corners)
+
+        # Interpolate resistance only between points with survivors
+        resistance = np.array([self.resistance[index] for index, _ in corners])
+        valid = ~np.isnan(resistance)
+        total = (np.where(valid, resistance, 0) * weights).sum(axis=0)
+        weight = (valid * weights).sum(axis=0)
+        resistance = np.divide(total, weight, out=np.full(weight.size, np.nan), where=weight > 0)
+        return {
+            "population": population,
+            "resistance": resistance,
+            "extinction_probability": extinction,
+        }
+
+    def save(self, path):
+        """Write the surrogate to an .npz file atomically"""
+        metadata = {
+            "version": SURROGATE_VERSION,
+            "engine_version": ENGINE_VERSION,
+            "base_params": self.base_params,
+            "population_mode": self.population_mode,
+            "replicates": self.replicates,
+            "seed": {"entropy": self.seed.entropy, "spawn_key": list(self.seed.spawn_key)},
+        }
+        grid = {f"grid_{name}": self.grid[name] for name in SURROGATE_AXES}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, metadata=np.array(json.dumps(metadata)), population=self.population,
+                     resistance=self.resistance, extinction=self.extinction, **grid)
+        os.replace(tmp_path, path)
+
+
+def load_surrogate(path):
+    """Read a surrogate written by Surrogate.save()"""
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        if metadata.get("version") != SURROGATE_VERSION:
+            raise ValueError(f"Unsupported surrogate version: {metadata.get('version')}")
+        if metadata.get("engine_version") != ENGINE_VERSION:
+            raise ValueError("Surrogate was built for a different engine version")
+        grid = {name: data[f"grid_{name}"] for name in SURROGATE_AXES}
+        seed = np.random.SeedSequence(metadata["seed"]["entropy"],
+                                      spawn_key=tuple(metadata["seed"]["spawn_key"]))
+        return Surrogate(metadata["base_params"], metadata["population_mode"], grid,
+                         metadata["replicates"], seed,
+                         data["population"], data["resistance"], data["extinction"])
+
+
+def surrogate_path(key, directory=SURROGATE_DIR):
+    return os.path.join(directory, f"{key}.npz")
+
+
+def load_cached_surrogate(params, population_mode="agents", grid=None,
+                          replicates=DEFAULT_REPLICATES, seed=DEFAULT_SEED, directory=SURROGATE_DIR):
+    """Surrogate previously built for these inputs, or None"""
+    key = surrogate_key(surrogate_parameters(params), population_mode, grid or DEFAULT_GRID,
+                        replicates, seed)
+    try:
+        return load_surrogate(surrogate_path(key, directory))
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def build_surrogate(params, population_mode="agents", grid=None, replicates=DEFAULT_REPLICATES,
+                    seed=DEFAULT_SEED, processes=None, on_progress=None, should_stop=None,
+                    directory=SURROGATE_DIR):
+    """Run every grid point and return the Surrogate, saved under its key in directory
+
+    params holds the fixed parameters (slider values in it are ignored).
+    on_progress(done, total) is called in the calling process as points
+    finish; should_stop() returning True abandons the build and returns
+    None. Pass directory=None to skip saving.
+    """
+    if population_mode not in POPULATION_MODES:
+        raise ValueError(f"Unknown population mode: {population_mode}")
+    grid = {name: np.asarray((grid or DEFAULT_GRID)[name], dtype=np.float64)
+            for name in SURROGATE_AXES}
+    for name, values in grid.items():
+        if values.size == 0 or np.any(np.diff(values) <= 0):
+            raise ValueError(f"Surrogate grid for {name} must be increasing")
+    base_params = surrogate_parameters(params)
+    root = seed_sequence(seed)
+
+    shape = tuple(grid[name].size for name in SURROGATE_AXES)
+    length = base_params["max_generations"] + 1
+    population = np.zeros(shape + (length,))
+    resistance = np.zeros(shape + (length,))
+    extinction = np.zeros(shape + (length,))
+
+    points = list(np.ndindex(shape))
+    tasks = [(index, dict(base_params, **{name: float(grid[name][i])
+                                          for name, i in zip(SURROGATE_AXES, index)}),
+              population_mode, replicates,
+              np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (n,)))
+             for n, index in enumerate(points)]
+    # Spawned, not forked: the GUI builds from a thread, after pygame has taken over SIGTERM
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        for done, (index, *trajectories) in enumerate(pool.imap_unordered(run_grid_point, tasks), 1):
+            population[index], resistance[index], extinction[index] = trajectories
+            if on_progress is not None:
+                on_progress(done, len(tasks))
+            if should_stop is not None and should_stop():
+                pool.terminate()
+                return None
+
+    surrogate = Surrogate(base_params, population_mode, grid, replicates, root,
+                          population, resistance, extinction)
+    if directory is not None:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            surrogate.save(surrogate_path(surrogate.key, directory))
+        except OSError:
+            pass  # an unsaved surrogate only costs a rebuild next time
+    return surrogate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the slider preview surrogate")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="run the grid and save the surrogate")
+    predict_parser = commands.add_parser("predict", help="print predicted trajectories")
+    for command in (build_parser, predict_parser):
+        command.add_argument("--population-size", type=int,
+                             default=DEFAULT_PARAMETERS["population_size"])
+        command.add_argument("--resistance-range", type=float, nargs=2, metavar=("MIN", "MAX"),
+                             default=DEFAULT_PARAMETERS["initial_resistance_range"])
+        command.add_argument("--carrying-capacity", type=int,
+                             default=DEFAULT_PARAMETERS["carrying_capacity"])
+        command.add_argument("--max-generations", type=int,
+                             default=DEFAULT_PARAMETERS["max_generations"])
+        command.add_argument("--binned", action="store_true", help="use the binned population model")
+        command.add_argument("--replicates", type=int, default=DEFAULT_REPLICATES)
+        command.add_argument("--cache-dir", default=SURROGATE_DIR, help="surrogate directory")
+    build_parser.add_argument("--processes", type=int, default=None,
+                              help="worker processes (default: all cores)")
+    predict_parser.add_argument("--concentration", type=float,
+                                default=DEFAULT_PARAMETERS["antibiotic_concentration"])
+    predict_parser.add_argument("--mutation-std", type=float, default=DEFAULT_PARAMETERS["mutation_std"])
+    predict_parser.add_argument("--reproduction-rate", type=float,
+                                default=DEFAULT_PARAMETERS["reproduction_rate"])
+    args = parser.parse_args(argv)
+
+    params = {
+        "population_size": args.population_size,
+        "initial_resistance_range": tuple(args.resistance_range),
+        "carrying_capacity": args.carrying_capacity,
+        "max_generations": args.max_generations,
+    }
+    population_mode = "binned" if args.binned else "agents"
+
+    if args.command == "build":
+        def report(done, total):
+            if done % max(1, total // 20) == 0 or done == total:
+                print(f"[{done}/{total}] grid points", flush=True)
+
+        surrogate = build_surrogate(params, population_mode, replicates=args.replicates,
+                                    processes=args.processes, on_progress=report,
+                                    directory=args.cache_dir)
+        print(f"Surrogate saved to {surrogate_path(surrogate.key, args.cache_dir)}")
+        return 0
+
+    surrogate = load_cached_surrogate(params, population_mode, replicates=args.replicates,
+                                      directory=args.cache_dir)
+    if surrogate is None:
+        parser.error("no surrogate built for these parameters; run the build command first")
+    prediction = surrogate.predict(antibiotic_concentration=args.concentration,
+                                   mutation_std=args.mutation_std,
+                                   reproduction_rate=args.reproduction_rate)
+    print("generation,population,mean_resistance,extinction_probability")
+    for generation, row in enumerate(zip(prediction["population"], prediction["resistance"],
+                                         prediction["extinction_probability"])):
+        print(f"{generation},{row[0]:.1f},{row[1]:.4f},{row[2]:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""Parallel parameter sweeps over a process pool
+
+Runs every point of a grid over the GUI's slider/entry knobs headlessly,
+spreading grid points across all cores. Each finished run's summary is
+appended to a CSV results table as soon as it completes, so an interrupted
+sweep can be resumed by running the same command again. The sweep seed,
+fixed parameters, population mode and backend are kept next to the table
+(results.csv.sweep.json); a resume reuses them and refuses to mix in rows
+from conflicting settings. Each grid point gets its own random stream,
+spawned from the sweep seed with a key derived from the point's parameter
+values, so a point's result does not depend on which worker ran it, when,
+or what else is in the grid. Every row records that spawn key, so together
+with the sweep seed it replays exactly.
+Finished runs are also kept in the run cache (see run_cache.py), so points
+shared with earlier sweeps or batch runs are loaded instead of recomputed.
+
+Example:
+    python sweep.py results.csv --concentration 0.1 0.3 0.5 \\
+        --mutation-std 0.01 0.05 --reproduction-rate 1.2 1.5 \\
+        --carrying-capacity 2000 10000
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from engine import DEFAULT_PARAMETERS, SimulationEngine, seed_sequence
+from run_cache import CACHE_DIR, RunCache, run_key
+from telemetry import TelemetryPublisher
+
+# Parameters a sweep can vary, in results-table column order
+SWEEP_AXES = (
+    "antibiotic_concentration",
+    "mutation_std",
+    "reproduction_rate",
+    "carrying_capacity",
+)
+
+SUMMARY_FIELDS = (
+    "final_mean_resistance",
+    "extinction_generation",
+    "peak_population",
+    "generations",
+)
+
+# The generation kernel and the point's spawn key (a JSON list extending the
+# sweep seed's) are recorded because runs only replay with the same ones
+RESULT_FIELDS = SWEEP_AXES + SUMMARY_FIELDS + ("backend", "spawn_key")
+
+
+def build_grid(axes):
+    """Expand {parameter: [values]} into a list of parameter dicts"""
+    for name in axes:
+        if name not in SWEEP_AXES:
+            raise ValueError(f"Cannot sweep over parameter: {name}")
+    names = [name for name in SWEEP_AXES if name in axes]
+    return [dict(zip(names, values))
+            for values in itertools.product(*(axes[name] for name in names))]
+
+
+def point_key(point, names):
+    """Hashable identity of a grid point, stable across CSV round trips"""
+    return tuple(float(point[name]) for name in names)
+
+
+def point_seed(root, point):
+    """Random stream of a grid point, keyed by its parameter values
+
+    Independent of scheduling and of the point's position in the grid, so
+    a resumed sweep over a changed grid still matches a fresh run.
+    """
+    record = json.dumps(sorted((name, float(value)) for name, value in point.items()))
+    digest = hashlib.sha256(record.encode()).digest()
+    words = tuple(int.from_bytes(digest[i:i + 4], "little") for i in range(0, 16, 4))
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + words)
+
+
+def run_point(task):
+    """Run one grid point to completion and return its results row"""
+    point, base_params, population_mode, backend, seed, cache, telemetry = task
+    engine = SimulationEngine(seed=seed, population_mode=population_mode, backend=backend,
+                              **base_params, **point)
+    key = run_key(engine) if cache is not None else None
+    if key is None or not cache.load(key, engine):
+        if telemetry is not None:
+            name = ",".join(f"{name}={value}" for name, value in point.items())
+            engine.telemetry = TelemetryPublisher(telemetry, name)
+        try:
+            engine.run()
+        finally:
+            if engine.telemetry is not None:
+                engine.telemetry.close()
+        if key is not None:
+            cache.store(key, engine)
+    summary = engine.summary()
+    row = dict(point)
+    for field in SUMMARY_FIELDS:
+        row[field] = summary[field]
+    row["backend"] = engine.backend
+    row["spawn_key"] = json.dumps(list(seed.spawn_key))
+    return row
+
+
+def metadata_path(output_path):
+    """Sidecar file holding the settings a results table was produced with"""
+    return output_path + ".sweep.json"
+
+
+def sweep_metadata(root, base_params, population_mode, backend):
+    """JSON-ready record of everything besides the axes that determines the rows"""
+    return json.loads(json.dumps({
+        "seed": {"entropy": root.entropy, "spawn_key": list(root.spawn_key)},
+        "base_params": base_params,
+        "population_mode": population_mode,
+        "backend": backend,
+        "point_seeds": "values",  # tables from before value-keyed seeds cannot be resumed
+    }))
+
+
+def read_metadata(output_path):
+    """Settings stored with a results table, or None when there are none"""
+    try:
+        with open(metadata_path(output_path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_metadata(output_path, metadata):
+    tmp_path = metadata_path(output_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, metadata_path(output_path))
+
+
+def metadata_seed(metadata):
+    """Root SeedSequence of a sweep from its stored settings"""
+    seed = metadata["seed"]
+    return np.random.SeedSequence(seed["entropy"], spawn_key=tuple(seed["spawn_key"]))
+
+
+def read_completed(output_path, axes):
+    """Load finished rows from an existing results table
+
+    Rows cut short by an interruption are dropped, and the file is rewritten
+    without them so that appending can continue cleanly.
+    """
+    if not os.path.exists(output_path):
+        return []
+
+    rows = []
+    with open(output_path, newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                for name in axes:
+                    float(row[name])
+                float(row["final_mean_resistance"])
+                int(row["peak_population"])
+                int(row["generations"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            rows.append(row)
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+def run_sweep(axes, output_path, base_params=None, population_mode="agents",
+              processes=None, resume=True, on_result=None, seed=None, cache=None, telemetry=None,
+              backend="numpy"):
+    """Run a parameter grid across a process pool, streaming rows to a CSV
+
+    axes maps swept parameter names to lists of values; base_params holds
+    the fixed parameters. With resume=True, grid points already present in
+    output_path are skipped; the seed stored with the table is reused when
+    seed is None, and a ValueError is raised when seed, base_params,
+    population_mode or backend conflict with the stored ones. on_result(row,
+    done, total) is called in the parent process as each run finishes. seed
+    (int or SeedSequence) makes the sweep replayable. cache is an
+    optional RunCache consulted before each run, and telemetry an optional
+    HOST:PORT the runs publish their metrics to. backend is the agent-mode
+    generation kernel (see kernels.py). Returns the number of runs executed.
+    """
+    base_params = dict(base_params or {})
+    for name in axes:
+        base_params.pop(name, None)
+
+    grid = build_grid(axes)
+    stored = read_metadata(output_path) if resume else None
+    if resume:
+        rows = read_completed(output_path, axes)
+        if rows and stored is None:
+            raise ValueError(f"{output_path} has no {metadata_path(output_path)} recording its seed "
+                             "and parameters; restart the sweep instead of resuming it")
+        completed = {point_key(row, axes) for row in rows}
+    else:
+        completed = set()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+    if seed is None and stored is not None:
+        root = metadata_seed(stored)
+    else:
+        root = seed_sequence(seed)
+    metadata = sweep_metadata(root, base_params, population_mode, backend)
+    if stored is not None and completed:
+        for name, value in metadata.items():
+            if stored.get(name) != value:
+                raise ValueError(f"{output_path} was produced with a different {name}: "
+                                 f"{stored.get(name)} (now {value}); restart the sweep "
+                                 "or use a new results file")
+    write_metadata(output_path, metadata)
+    pending = [point for point in grid if point_key(point, axes) not in completed]
+
+    new_file = not os.path.exists(output_path)
+    with open(output_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+            f.flush()
+
+        tasks = [(point, base_params, population_mode, backend, point_seed(root, point), cache,
+                  telemetry)
+                 for point in pending]
+        done = len(grid) - len(pending)
+        with multiprocessing.Pool(processes) as pool:
+            for row in pool.imap_unordered(run_point, tasks):
+                writer.writerow(row)
+                f.flush()
+                done += 1
+                if on_result is not None:
+                    on_result(row, done, len(grid))
+    return len(pending)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parallel parameter sweep of the resistance model")
+    parser.add_argument("output", help="CSV results table (appended to and resumed from)")
+    parser.add_argument("--concentration", type=float, nargs="+", dest="antibiotic_concentration",
+                        default=[DEFAULT_PARAMETERS["antibiotic_concentration"]])
+    parser.add_argument("--mutation-std", type=float, nargs="+", dest="mutation_std",
+                        default=[DEFAULT_PARAMETERS["mutation_std"]])
+    parser.add_argument("--reproduction-rate", type=float, nargs="+", dest="reproduction_rate",
+                        default=[DEFAULT_PARAMETERS["reproduction_rate"]])
+    parser.add_argument("--carrying-capacity", type=int, nargs="+", dest="carrying_capacity",
+                        default=[DEFAULT_PARAMETERS["carrying_capacity"]])
+    parser.add_argument("--population-size", type=int, default=DEFAULT_PARAMETERS["population_size"])
+    parser.add_argument("--resistance-range", type=float, nargs=2, metavar=("MIN", "MAX"),
+                        default=DEFAULT_PARAMETERS["initial_resistance_range"])
+    parser.add_argument("--max-generations", type=int, default=DEFAULT_PARAMETERS["max_generations"])
+    parser.add_argument("--binned", action="store_true", help="use the binned population model")
+    parser.add_argument("--backend", choices=("auto", "numpy", "numba"), default="numpy",
+                        help="agent-mode generation kernel (see kernels.py)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="sweep seed (default: fresh entropy, printed at the start)")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--restart", action="store_true", help="discard existing results instead of resuming")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="run cache directory")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always recompute and leave the run cache untouched")
+    parser.add_argument("--telemetry", metavar="HOST:PORT",
+                        help="publish per-generation metrics to a telemetry collector")
+    args = parser.parse_args(argv)
+
+    if args.max_generations <= 0:
+        parser.error("--max-generations must be positive for a sweep")
+
+    axes = {name: getattr(args, name) for name in SWEEP_AXES}
+    base_params = {
+        "population_size": args.population_size,
+        "initial_resistance_range": tuple(args.resistance_range),
+        "max_generations": args.max_generations,
+    }
+
+    # A resumed sweep keeps the seed it was started with
+    metadata = None if args.restart else read_metadata(args.output)
+    if args.seed is None and metadata is not None:
+        seed = metadata_seed(metadata)
+    else:
+        seed = seed_sequence(args.seed)
+    print(f"Sweep seed: {seed.entropy}", flush=True)
+
+    def report(row, done, total):
+        point = ", ".join(f"{name}={row[name]}" for name in SWEEP_AXES)
+        print(f"[{done}/{total}] {point} -> mean resistance {row['final_mean_resistance']:.4f}, "
+              f"peak {row['peak_population']}", flush=True)
+
+    try:
+        ran = run_sweep(axes, args.output, base_params,
+                        population_mode="binned" if args.binned else "agents",
+                        processes=args.processes, resume=not args.restart, on_result=report,
+                        seed=seed, cache=None if args.no_cache else RunCache(args.cache_dir),
+                        telemetry=args.telemetry, backend=args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Sweep finished: {ran} runs executed, results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Live per-generation metrics for external dashboards
+
+A TelemetryPublisher attached to an engine (engine.telemetry) records, for
+every generation, the generation number, population size, mean resistance,
+the fraction of cells resistant at the current concentration and the step
+latency. Recording only appends a tuple to a bounded queue. A background
+thread sends the queue in batches as JSON-lines UDP datagrams, so a slow or
+absent listener never blocks the simulation loop. When the queue is full,
+the oldest records are dropped and counted.
+
+Many runs, in any number of processes, can send to one collector. The
+collector keeps each run's latest metrics and serves them at /metrics in
+the Prometheus text format:
+
+    python telemetry.py collect --udp-port 9999 --http-port 9100
+    python batch.py scenarios.toml results.json --telemetry 127.0.0.1:9999
+
+The GUI publishes when SIMULASI_TELEMETRY is set to HOST:PORT.
+"""
+import argparse
+import collections
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Environment variable naming the HOST:PORT the GUI publishes to
+TELEMETRY_ENV = "SIMULASI_TELEMETRY"
+
+DEFAULT_UDP_PORT = 9999
+DEFAULT_HTTP_PORT = 9100
+
+# Seconds between batches, and records held while the sender falls behind
+FLUSH_INTERVAL = 0.25
+MAX_PENDING = 65536
+
+# Payload bytes per datagram (well under the loopback limit)
+MAX_DATAGRAM = 32768
+
+# Fields of each record, in tuple order
+FIELDS = ("time", "generation", "population", "mean_resistance", "resistant_fraction",
+          "step_seconds")
+
+# Runs not heard from for this many seconds are dropped from /metrics
+STALE_AFTER = 600
+
+
+def parse_target(target):
+    """(host, port) of a HOST:PORT string"""
+    host, _, port = target.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Telemetry target must be HOST:PORT, not {target!r}")
+    return host, int(port)
+
+
+class TelemetryPublisher:
+    """Batched, non-blocking UDP publisher for one run's per-generation metrics
+
+    record() is called from the simulation thread; a daemon thread does the
+    encoding and sending. close() sends what is left.
+    """
+    def __init__(self, target, run, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.address = parse_target(target)
+        self.run = str(run)
+        self.pid = os.getpid()
+        self.flush_interval = flush_interval
+        self.pending = collections.deque(maxlen=max_pending)
+        self.recorded = 0
+        self.sent = 0
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._send_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, engine, step_seconds):
+        """Queue the metrics of the generation the engine just finished"""
+        count, mean, fraction = engine.recorded_metrics
+        self.pending.append((time.time(), engine.generation, count, mean, fraction, step_seconds))
+        self.recorded += 1
+
+    def dropped(self):
+        """Records lost to a full queue or a failed send"""
+        return self.recorded - self.sent - len(self.pending)
+
+    def _send_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Send every queued record (called from the sender thread)"""
+        lines = []
+        size = 0
+        while self.pending:
+            values = self.pending.popleft()
+            record = dict(zip(FIELDS, values), run=self.run, pid=self.pid)
+            line = json.dumps(record).encode()
+            if lines and size + len(line) + 1 > MAX_DATAGRAM:
+                self._send(lines)
+                lines = []
+                size = 0
+            lines.append(line)
+            size += len(line) + 1
+        if lines:
+            self._send(lines)
+
+    def _send(self, lines):
+        try:
+            self.socket.sendto(b"\n".join(lines), self.address)
+            self.sent += len(lines)
+        except OSError:
+            pass  # full socket buffer or no route: drop the batch rather than wait
+
+    def close(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.thread.join(timeout=2)
+            self.socket.close()
+
+
+def publisher_from_environment(run):
+    """TelemetryPublisher for SIMULASI_TELEMETRY, or None when it is unset"""
+    target = os.environ.get(TELEMETRY_ENV)
+    if not target:
+        return None
+    return TelemetryPublisher(target, run)
+
+
+# Prometheus metrics: (name, type, help, record field)
+METRICS = (
+    ("simulasi_generation", "gauge", "Latest generation of the run", "generation"),
+    ("simulasi_population", "gauge", "Population size", "population"),
+    ("simulasi_mean_resistance", "gauge", "Mean resistance", "mean_resistance"),
+    ("simulasi_resistant_fraction", "gauge",
+     "Fraction of cells with resistance at least the antibiotic concentration", "resistant_fraction"),
+    ("simulasi_step_seconds", "gauge", "Duration of the latest generation step", "step_seconds"),
+)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Latest metrics of every run heard from, rendered for Prometheus"""
+    def __init__(self, stale_after=STALE_AFTER):
+        self.stale_after = stale_after
+        self.lock = threading.Lock()
+        self.runs = {}  # (run, pid) -> [latest record, steps, step seconds sum, last seen]
+
+    def add(self, record):
+        key = (record["run"], record["pid"])
+        with self.lock:
+            entry = self.runs.get(key)
+            if entry is None:
+                entry = self.runs[key] = [record, 0, 0.0, 0.0]
+            entry[0] = record
+            entry[1] += 1
+            entry[2] += record["step_seconds"]
+            entry[3] = time.monotonic()
+
+    def render(self):
+        """Prometheus text exposition of every live run"""
+        now = time.monotonic()
+        with self.lock:
+            for key in [key for key, entry in self.runs.items() if now - entry[3] > self.stale_after]:
+                del self.runs[key]
+            runs = sorted(self.runs.items())
+
+        lines = []
+        for name, kind, description, field in METRICS:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (run, pid), (record, _, _, _) in runs:
+                lines.append(f'{name}{{run="{_label(run)}",pid="{pid}"}} {record[field]!r}')
+        lines.append("# HELP simulasi_steps_total Generation steps reported")
+        lines.append("# TYPE simulasi_steps_total counter")
+        for (run, pid), (_, steps, _, _) in runs:
+            lines.append(f'simulasi_steps_total{{run="{_label(run)}",pid="{pid}"}} {steps}')
+        lines.append("# HELP simulasi_step_seconds_total Time spent in reported generation steps")
+        lines.append("# TYPE simulasi_step_seconds_total counter")
+        for (run, pid), (_, _, seconds, _) in runs:
+            lines.append(f'simulasi_step_seconds_total{{run="{_label(run)}",pid="{pid}"}} {seconds!r}')
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scraped every few seconds; not worth a log line each time
+
+
+def collect(udp_port=DEFAULT_UDP_PORT, http_port=DEFAULT_HTTP_PORT, echo=False):
+    """Receive telemetry datagrams and serve them at /metrics until interrupted"""
+    registry = MetricsRegistry()
+    server = ThreadingHTTPServer(("127.0.0.1", http_port), _MetricsHandler)
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", udp_port))
+    print(f"Collecting telemetry on udp://127.0.0.1:{udp_port}, "
+          f"serving http://127.0.0.1:{server.server_port}/metrics", flush=True)
+    try:
+        while True:
+            payload = receiver.recv(65536)
+            for line in payload.splitlines():
+                try:
+                    record = json.loads(line)
+                    registry.add(record)
+                except (ValueError, KeyError, TypeError):
+                    continue  # not one of ours
+                if echo:
+                    print(line.decode(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect live simulation telemetry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    collect_parser = commands.add_parser("collect", help="receive run metrics and serve /metrics")
+    collect_parser.add_argument("--udp-port", type=int, default=DEFAULT_UDP_PORT)
+    collect_parser.add_argument("--http-port", type=int, default=DEFAULT_HTTP_PORT)
+    collect_parser.add_argument("--echo", action="store_true", help="also print every record")
+    args = parser.parse_args(argv)
+
+    collect(args.udp_port, args.http_port, args.echo)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The GUI calls pygame.init() before any ensemble; SDL then traps SIGTERM,
+# which forked pool workers used to inherit, hanging pool cleanup forever
+ENSEMBLE_AFTER_PYGAME = """
+import pygame
+pygame.init()
+from ensemble import run_ensemble
+stats = run_ensemble(dict(population_size=200, carrying_capacity=400, max_generations=20),
+                     16, seed=1)
+assert stats.replicates == 16, stats.replicates
+stopped = run_ensemble(dict(population_size=200, carrying_capacity=400, max_generations=20),
+                       16, seed=1, batched=False, should_stop=lambda: True)
+assert 1 <= stopped.replicates < 16, stopped.replicates
+"""
+
+
+def test_run_ensemble_finishes_after_pygame_init():
+    pytest.importorskip("pygame")
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy",
+               PYGAME_HIDE_SUPPORT_PROMPT="1")
+    result = subprocess.run([sys.executable, "-c", ENSEMBLE_AFTER_PYGAME], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
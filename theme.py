@@ -0,0 +1,22 @@
+"""Shared color scheme for the GUI, renderer and charts"""
+
+# Custom color scheme
+COLORS = {
+    "primary": "#006A71",      # Dark teal
+    "secondary": "#48A6A7",    # Medium teal
+    "tertiary": "#9ACBD0",     # Light teal
+    "background": "#F2EFE7",   # Off-white
+    "text": "#333333",         # Dark gray for text
+    "text_light": "#666666",   # Light gray for secondary text
+    "accent": "#E74C3C",       # Red for alerts/highlights
+    "border": "#D0D0D0",       # Light gray for borders
+    "button": "#006A71",       # Button background
+    "button_hover": "#48A6A7", # Button hover
+    "button_text": "#FFFFFF",  # Button text
+}
+
+
+def hex_to_rgb(hex_color):
+    """Convert hex color to RGB tuple"""
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))